@@ -14,7 +14,9 @@ from sqlalchemy.exc import ArgumentError
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-from .extensions import db, login_manager, csrf, mail, migrate
+from .audit import audit_sink
+from .cli import register_cli
+from .extensions import db, login_manager, csrf, mail, migrate, submission_limiter
 from .seed import ensure_seed_data
 
 
@@ -83,7 +85,23 @@ def create_app() -> Flask:
         MAIL_USERNAME=os.getenv("MAIL_USERNAME", ""),
         MAIL_PASSWORD=os.getenv("MAIL_PASSWORD", ""),
         MAIL_DEFAULT_SENDER=os.getenv("MAIL_DEFAULT_SENDER", ""),
-
+        # Fair-play rate limiting: "memory" per worker, "sqlite" shared across workers on one box.
+        SUBMISSION_RATE_LIMIT_BACKEND=os.getenv("SUBMISSION_RATE_LIMIT_BACKEND", "memory"),
+        SUBMISSION_RATE_LIMIT_PATH=os.getenv("SUBMISSION_RATE_LIMIT_PATH", ""),
+        # Server-Sent Events (/events/stream). Streams are short and reconnect with
+        # Last-Event-ID; keep SSE_STREAM_SECONDS under the gunicorn worker timeout and
+        # SSE_MAX_STREAMS_PER_WORKER under the worker's thread count.
+        SSE_MAX_STREAMS_PER_WORKER=int(os.getenv("SSE_MAX_STREAMS_PER_WORKER", "4")),
+        SSE_STREAM_SECONDS=float(os.getenv("SSE_STREAM_SECONDS", "25")),
+        SSE_POLL_SECONDS=float(os.getenv("SSE_POLL_SECONDS", "2")),
+        SSE_HEARTBEAT_SECONDS=float(os.getenv("SSE_HEARTBEAT_SECONDS", "10")),
+        SSE_RETRY_MS=int(os.getenv("SSE_RETRY_MS", "1000")),
+        SSE_BUSY_RETRY_MS=int(os.getenv("SSE_BUSY_RETRY_MS", "30000")),
+        # Admin audit log: page-view entries are buffered and written in batches
+        # (app/audit.py); AUDIT_ASYNC=false writes each one immediately.
+        AUDIT_ASYNC=(os.getenv("AUDIT_ASYNC", "true").lower() in {"1", "true", "yes"}),
+        AUDIT_BATCH_SIZE=int(os.getenv("AUDIT_BATCH_SIZE", "100")),
+        AUDIT_FLUSH_SECONDS=float(os.getenv("AUDIT_FLUSH_SECONDS", "2")),
     )
 
     Path(app.instance_path).mkdir(parents=True, exist_ok=True)
@@ -94,16 +112,22 @@ def create_app() -> Flask:
     csrf.init_app(app)
     migrate.init_app(app, db)
     mail.init_app(app)
+    submission_limiter.init_app(app)
+    audit_sink.init_app(app)
 
     from .main.routes import bp as main_bp
     from .auth.routes import bp as auth_bp
     from .client.routes import bp as client_bp
     from .admin.routes import bp as admin_bp
+    from .events.routes import bp as events_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(client_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(events_bp)
+
+    register_cli(app)
 
     with app.app_context():
         auto_migrate_env = os.getenv("AUTO_MIGRATE")
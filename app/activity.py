@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+from datetime import date, timedelta
+
+
+# One bit per day of the year: bit n (little-endian across the bytes) is day-of-year n + 1.
+YEAR_BYTES = 46  # 366 bits, rounded up
+
+
+def day_bit(day: date) -> int:
+    return day.timetuple().tm_yday - 1
+
+
+def empty_year() -> bytes:
+    return bytes(YEAR_BYTES)
+
+
+def has_day(bits: bytes, day: date) -> bool:
+    n = day_bit(day)
+    return bool(bits[n >> 3] & (1 << (n & 7)))
+
+
+def with_day(bits: bytes, day: date) -> bytes:
+    n = day_bit(day)
+    out = bytearray(bits or empty_year())
+    out[n >> 3] |= 1 << (n & 7)
+    return bytes(out)
+
+
+def merge(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, "little") | int.from_bytes(b, "little")).to_bytes(YEAR_BYTES, "little")
+
+
+def days_in(year: int, bits: bytes) -> Iterator[date]:
+    """Active days of `year`, oldest first (walks set bits only)."""
+    x = int.from_bytes(bits, "little")
+    jan1 = date(year, 1, 1)
+    while x:
+        low = x & -x
+        yield jan1 + timedelta(days=low.bit_length() - 1)
+        x ^= low
+
+
+def active_weeks(year: int, bits: bytes) -> Iterator[date]:
+    """Mondays of the weeks with any activity in `year`: one 7-bit mask test per week."""
+    jan1 = date(year, 1, 1)
+    first_monday = jan1 - timedelta(days=jan1.weekday())
+    # Re-base so bit 0 is the Monday on or before Jan 1; then week k is bits 7k..7k+6.
+    x = int.from_bytes(bits, "little") << jan1.weekday()
+    week = 0
+    while x:
+        if x & 0x7F:
+            yield first_monday + timedelta(weeks=week)
+        x >>= 7
+        week += 1
+
+
+def days_from(bitmaps: Iterable[tuple[int, bytes]]) -> Iterator[date]:
+    """Active days across (year, bits) pairs, oldest first."""
+    for year, bits in sorted(bitmaps, key=lambda item: item[0]):
+        yield from days_in(year, bits)
+
+
+def timeline(bitmaps: dict[int, bytes]) -> tuple[date, int]:
+    """Consecutive years as one integer: bit n is (first Jan 1) + n days."""
+    if not bitmaps:
+        return date.min, 0
+    first = min(bitmaps)
+    x = 0
+    offset = 0
+    for year in range(first, max(bitmaps) + 1):
+        x |= int.from_bytes(bitmaps.get(year, b""), "little") << offset
+        offset += (date(year + 1, 1, 1) - date(year, 1, 1)).days
+    return date(first, 1, 1), x
+
+
+def streak_stats(bitmaps: dict[int, bytes]) -> tuple[int, int, date | None]:
+    """(run ending on the last active day, longest run, last active day) from bit scans alone."""
+    start, x = timeline(bitmaps)
+    if not x:
+        return 0, 0, None
+    top = x.bit_length() - 1
+    gaps = ~x & ((1 << (top + 1)) - 1)
+    current = top - (gaps.bit_length() - 1) if gaps else top + 1
+
+    # Each x &= x >> 1 shortens every run by one, so the loop count is the longest run.
+    longest = 0
+    y = x
+    while y:
+        y &= y >> 1
+        longest += 1
+    return current, longest, start + timedelta(days=top)
@@ -1,12 +1,45 @@
 from __future__ import annotations
 
 from datetime import datetime
+from urllib.parse import urlencode
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, Response, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
+from ..analytics import FUNNEL_WINDOWS, TREND_WINDOWS, cohort_retention, funnel, overview, trends
+from ..applications import (
+    STATUSES,
+    ApplicationFilters,
+    ExportFilters,
+    accounting_csv,
+    application_page,
+    flagged_application_ids,
+)
+from ..audit import AuditFilters, audit_page, audit_sink, export_csv, export_jsonl
+from ..chat import admin_inbox, mark_read, message_json, page_for_args, post_message, recent_messages, unread_counts
+from ..engagement import FLAG_REASONS
+from ..exports import gzip_chunks
 from ..extensions import db
-from ..models import AdminAuditLog, Announcement, Application, ChatMessage, ClassFee, GameScore, User
+from ..fair_play import (
+    FINDING_KINDS,
+    REVIEW_STATUSES,
+    FlagFilters,
+    clear_flags,
+    confirm_flags,
+    finding_page,
+    finding_summary,
+    findings_for_scores,
+    flag_page,
+)
+from ..games import GameTiers, compute_game_discount, format_tiers, game_registry, parse_tiers
+from ..leaderboard import invalidate_discounts, invalidate_game_scores
+from ..models import AdminAuditLog, Announcement, Application, ClassFee, GameTierOverride, User
+from ..notifications import AUDIENCE_ALL, publish
+
+AUDIT_EXPORT_FORMATS = {
+    "csv": (export_csv, "text/csv"),
+    "jsonl": (export_jsonl, "application/x-ndjson"),
+}
 
 bp = Blueprint("admin", __name__, url_prefix="/admin")
 
@@ -24,22 +57,28 @@ def _audit(
     target_type: str | None = None,
     target_id: int | None = None,
     detail: str | None = None,
+    sync: bool = False,
 ) -> None:
-    try:
-        db.session.add(
-            AdminAuditLog(
-                admin_user_id=current_user.id,
-                action=action,
-                target_type=target_type,
-                target_id=target_id,
-                detail=detail,
-                ip_address=request.headers.get("X-Forwarded-For", request.remote_addr),
-                user_agent=(request.headers.get("User-Agent") or "")[:255],
-            )
-        )
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
+    """Record an admin action.
+
+    By default the entry goes to the buffered background writer, so page views
+    cost no extra commit. Mutations pass sync=True *before* their commit so the
+    entry is written in the same transaction as the change it describes.
+    """
+    row = {
+        "admin_user_id": current_user.id,
+        "action": action,
+        "target_type": target_type,
+        "target_id": target_id,
+        "detail": detail,
+        "ip_address": request.headers.get("X-Forwarded-For", request.remote_addr),
+        "user_agent": (request.headers.get("User-Agent") or "")[:255],
+        "created_at": datetime.utcnow(),
+    }
+    if sync:
+        db.session.add(AdminAuditLog(**row))
+    else:
+        audit_sink.enqueue(row)
 
 
 @bp.get("/dashboard")
@@ -50,8 +89,71 @@ def dashboard():
         return r
 
     fees = ClassFee.query.order_by(ClassFee.class_name.asc()).all()
-    apps = Application.query.order_by(Application.created_at.desc()).limit(50).all()
-    return render_template("admin/dashboard.html", fees=fees, apps=apps)
+    apps, _ = application_page(ApplicationFilters(), limit=20)
+    unread = unread_counts("admin", [a.id for a in apps])
+    return render_template("admin/dashboard.html", fees=fees, apps=apps, unread=unread)
+
+
+@bp.get("/applications")
+@login_required
+def applications():
+    r = _require_admin()
+    if r:
+        return r
+
+    filters = ApplicationFilters.from_args(request.args)
+    apps, next_before = application_page(filters, before_id=request.args.get("before", type=int))
+    ids = [a.id for a in apps]
+    return render_template(
+        "admin/applications.html",
+        apps=apps,
+        next_before=next_before,
+        filters=filters,
+        fees=ClassFee.query.order_by(ClassFee.class_name.asc()).all(),
+        statuses=STATUSES,
+        unread=unread_counts("admin", ids),
+        flagged=flagged_application_ids(ids),
+    )
+
+
+@bp.get("/applications/export")
+@login_required
+def applications_export():
+    r = _require_admin()
+    if r:
+        return r
+
+    filters = ExportFilters.from_args(request.args)
+    compress = request.args.get("gzip") == "1"
+    args = {k: v for k, v in filters.as_args().items() if v is not None}
+    _audit("export_applications", detail=urlencode({**args, "gzip": int(compress)}))
+
+    filename = f"applications-{datetime.utcnow():%Y%m%d-%H%M%S}.csv"
+    body = accounting_csv(filters)
+    mimetype = "text/csv"
+    if compress:
+        body, mimetype, filename = gzip_chunks(body), "application/gzip", filename + ".gz"
+    # The rows come off their own connection (stream_rows); return the request's
+    # one to the pool now rather than holding it for the whole download.
+    db.session.remove()
+    # Rows are written as they come off the cursor; nothing is built up in memory.
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@bp.get("/inbox")
+@login_required
+def inbox():
+    r = _require_admin()
+    if r:
+        return r
+
+    unread_only = request.args.get("unread") == "1"
+    rows, next_before = admin_inbox(before_id=request.args.get("before", type=int), unread_only=unread_only)
+    return render_template("admin/inbox.html", rows=rows, next_before=next_before, unread_only=unread_only)
 
 
 @bp.get("/analytics")
@@ -61,24 +163,36 @@ def analytics():
     if r:
         return r
 
-    total_users = User.query.count()
-    total_apps = Application.query.count()
-    pending = Application.query.filter_by(status="pending").count()
-    accepted = Application.query.filter_by(status="accepted").count()
-    rejected = Application.query.filter_by(status="rejected").count()
-    paid = Application.query.filter(Application.payment_method.isnot(None)).count()
+    stats = overview()
+    days = request.args.get("days", TREND_WINDOWS[0], type=int)
+    if days not in TREND_WINDOWS:
+        days = TREND_WINDOWS[0]
 
     # Lightweight audit record for page access.
     _audit("view_analytics")
 
+    return render_template("admin/analytics.html", trend=trends(days), trend_windows=TREND_WINDOWS, **stats)
+
+
+@bp.get("/analytics/funnel")
+@login_required
+def analytics_funnel():
+    r = _require_admin()
+    if r:
+        return r
+
+    days = request.args.get("days", type=int)
+    if days not in FUNNEL_WINDOWS:
+        days = None
+
+    _audit("view_funnel")
+
     return render_template(
-        "admin/analytics.html",
-        total_users=total_users,
-        total_apps=total_apps,
-        pending=pending,
-        accepted=accepted,
-        rejected=rejected,
-        paid=paid,
+        "admin/funnel.html",
+        stages=funnel(days),
+        cohorts=cohort_retention(),
+        days=days,
+        funnel_windows=FUNNEL_WINDOWS,
     )
 
 
@@ -89,9 +203,45 @@ def audit_log():
     if r:
         return r
 
-    logs = AdminAuditLog.query.order_by(AdminAuditLog.created_at.desc()).limit(200).all()
+    filters = AuditFilters.from_args(request.args)
+    logs, next_before = audit_page(filters, before_id=request.args.get("before", type=int))
     _audit("view_audit_log")
-    return render_template("admin/audit.html", logs=logs)
+    return render_template(
+        "admin/audit.html",
+        logs=logs,
+        next_before=next_before,
+        filters=filters,
+        admins=User.query.filter_by(is_admin=True).order_by(User.email.asc()).all(),
+    )
+
+
+@bp.get("/audit/export")
+@login_required
+def audit_export():
+    r = _require_admin()
+    if r:
+        return r
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in AUDIT_EXPORT_FORMATS:
+        flash("Unknown export format.", "error")
+        return redirect(url_for("admin.audit_log"))
+    filters = AuditFilters.from_args(request.args)
+    args = {k: v for k, v in filters.as_args().items() if v is not None}
+    _audit("export_audit_log", detail=urlencode({"format": fmt, **args}))
+
+    export, mimetype = AUDIT_EXPORT_FORMATS[fmt]
+    filename = f"audit-log-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    body = export(filters)
+    # The rows come off their own connection (stream_rows); return the request's
+    # one to the pool now rather than holding it for the whole download.
+    db.session.remove()
+    # Rows are written as they come off the cursor; nothing is built up in memory.
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @bp.get("/announcements")
@@ -126,8 +276,11 @@ def announcements_create():
 
     row = Announcement(title=title[:120], body=body, is_active=make_active)
     db.session.add(row)
+    db.session.flush()
+    if make_active:
+        _publish_announcement(row)
+    _audit("create_announcement", target_type="Announcement", target_id=row.id, detail=row.title, sync=True)
     db.session.commit()
-    _audit("create_announcement", target_type="Announcement", target_id=row.id, detail=row.title)
     flash("Announcement saved.", "success")
     return redirect(url_for("admin.announcements"))
 
@@ -148,17 +301,27 @@ def announcements_toggle(announcement_id: int):
     if new_state:
         Announcement.query.update({Announcement.is_active: False})
     row.is_active = new_state
-    db.session.commit()
+    _publish_announcement(row)
     _audit(
         "toggle_announcement",
         target_type="Announcement",
         target_id=row.id,
         detail=f"is_active={row.is_active}",
+        sync=True,
     )
+    db.session.commit()
     flash("Announcement updated.", "success")
     return redirect(url_for("admin.announcements"))
 
 
+def _publish_announcement(row: Announcement) -> None:
+    publish(
+        "announcement",
+        {"id": row.id, "title": row.title, "body": row.body, "is_active": bool(row.is_active)},
+        audience=AUDIENCE_ALL,
+    )
+
+
 @bp.get("/fair-play")
 @login_required
 def fair_play():
@@ -166,14 +329,160 @@ def fair_play():
     if r:
         return r
 
-    flagged = (
-        GameScore.query.filter_by(is_flagged=True)
-        .order_by(GameScore.created_at.desc())
-        .limit(200)
-        .all()
-    )
+    filters = FlagFilters.from_args(request.args)
+    scores, next_before = flag_page(filters, before_id=request.args.get("before", type=int))
+    finding_counts, analyzed_at = finding_summary()
     _audit("view_fair_play")
-    return render_template("admin/fair_play.html", scores=flagged)
+    return render_template(
+        "admin/fair_play.html",
+        scores=scores,
+        next_before=next_before,
+        filters=filters,
+        statuses=REVIEW_STATUSES,
+        reasons=FLAG_REASONS,
+        games=sorted(game_registry.all()),
+        # What each pending score would earn if cleared, under the current tiers.
+        would_earn={s.id: compute_game_discount(s.game_key, s.score) for s in scores},
+        findings=findings_for_scores([s.id for s in scores]),
+        finding_kinds=FINDING_KINDS,
+        finding_counts=finding_counts,
+        analyzed_at=analyzed_at,
+    )
+
+
+@bp.get("/fair-play/findings")
+@login_required
+def fair_play_findings():
+    r = _require_admin()
+    if r:
+        return r
+
+    kind = request.args.get("kind")
+    if kind not in FINDING_KINDS:
+        kind = next(iter(FINDING_KINDS))
+    rows, next_after = finding_page(kind, after_id=request.args.get("after", type=int))
+    finding_counts, analyzed_at = finding_summary()
+    _audit("view_fair_play_findings", detail=kind)
+    return render_template(
+        "admin/fair_play_findings.html",
+        rows=rows,
+        next_after=next_after,
+        kind=kind,
+        finding_kinds=FINDING_KINDS,
+        finding_counts=finding_counts,
+        analyzed_at=analyzed_at,
+    )
+
+
+@bp.post("/fair-play/review")
+@login_required
+def fair_play_review():
+    r = _require_admin()
+    if r:
+        return r
+
+    filters = FlagFilters.from_args(request.form)
+    back = redirect(url_for("admin.fair_play", **filters.as_args()))
+    decision = request.form.get("decision")
+    if decision not in ("clear", "confirm"):
+        flash("Choose clear or confirm.", "error")
+        return back
+    ids = request.form.getlist("score_id", type=int)
+    if not ids:
+        flash("Select at least one score.", "error")
+        return back
+
+    review = clear_flags if decision == "clear" else confirm_flags
+    result = review(ids, current_user.id)
+    if not result.reviewed:
+        flash("Those scores were already reviewed.", "error")
+        return back
+
+    detail = f"{result.reviewed} score(s): {','.join(map(str, result.score_ids))}"
+    if decision == "clear":
+        detail += f"; +{result.credited_pct}% across {result.applications} application(s)"
+        if result.locked:
+            detail += f"; {result.locked} on paid applications, not credited"
+        if result.bonuses:
+            detail += f"; {result.bonuses} weekly bonus(es) completed"
+    # One audit entry per batch, committed with the UPDATEs it describes.
+    _audit(f"{decision}_flags", target_type="game_score", detail=detail, sync=True)
+    db.session.commit()
+    for class_fee_id in result.class_fee_ids:
+        invalidate_discounts(class_fee_id)
+    for game_key, week_key in result.game_boards:
+        invalidate_game_scores(game_key, week_key)
+    flash(f"{'Cleared' if decision == 'clear' else 'Confirmed'} {result.reviewed} flagged score(s).", "success")
+    return back
+
+
+@bp.get("/games")
+@login_required
+def games():
+    r = _require_admin()
+    if r:
+        return r
+
+    rows = [
+        {
+            "key": key,
+            "tiers": format_tiers(tiers),
+            "lower_is_better": tiers.lower_is_better,
+            "overridden": game_registry.is_overridden(key),
+        }
+        for key, tiers in sorted(game_registry.all().items())
+    ]
+    return render_template("admin/games.html", rows=rows)
+
+
+@bp.post("/games/<game_key>/tiers")
+@login_required
+def games_set_tiers(game_key: str):
+    r = _require_admin()
+    if r:
+        return r
+
+    game_key = game_key.lower()
+    if game_key not in game_registry.defaults:
+        flash("Unknown game.", "error")
+        return redirect(url_for("admin.games"))
+
+    try:
+        pairs = parse_tiers(request.form.get("tiers") or "")
+    except ValueError as e:
+        flash(f"Invalid tiers: {e}", "error")
+        return redirect(url_for("admin.games"))
+
+    lower_is_better = request.form.get("lower_is_better") == "1"
+    row = db.session.get(GameTierOverride, game_key) or GameTierOverride(game_key=game_key)
+    row.tiers = format_tiers(GameTiers.compile(pairs, lower_is_better=lower_is_better))
+    row.lower_is_better = lower_is_better
+    row.updated_by_id = current_user.id
+    row.updated_at = datetime.utcnow()
+    db.session.add(row)
+    _audit("set_game_tiers", target_type="Game", detail=f"{game_key}: {row.tiers}", sync=True)
+    db.session.commit()
+    game_registry.invalidate()
+
+    flash("Game tiers updated.", "success")
+    return redirect(url_for("admin.games"))
+
+
+@bp.post("/games/<game_key>/tiers/reset")
+@login_required
+def games_reset_tiers(game_key: str):
+    r = _require_admin()
+    if r:
+        return r
+
+    row = db.session.get(GameTierOverride, game_key.lower())
+    if row:
+        db.session.delete(row)
+        _audit("reset_game_tiers", target_type="Game", detail=game_key.lower(), sync=True)
+        db.session.commit()
+        game_registry.invalidate()
+    flash("Game tiers reset to defaults.", "success")
+    return redirect(url_for("admin.games"))
 
 
 @bp.post("/fees/<int:fee_id>")
@@ -196,14 +505,14 @@ def update_fee(fee_id: int):
     old_amount = fee.amount_bdt
     fee.amount_bdt = amount
     fee.updated_at = datetime.utcnow()
-    db.session.commit()
-
     _audit(
         "update_fee",
         target_type="ClassFee",
         target_id=fee.id,
         detail=f"{fee.class_name}: {old_amount} -> {amount}",
+        sync=True,
     )
+    db.session.commit()
     flash("Fee updated.", "success")
     return redirect(url_for("admin.dashboard"))
 
@@ -227,13 +536,14 @@ def set_application_status(app_id: int):
 
     old_status = app_row.status
     app_row.status = status
-    db.session.commit()
     _audit(
         "set_application_status",
         target_type="Application",
         target_id=app_row.id,
         detail=f"{old_status} -> {status}",
+        sync=True,
     )
+    db.session.commit()
     flash("Application status updated.", "success")
     return redirect(url_for("admin.application", app_id=app_id))
 
@@ -251,8 +561,19 @@ def application(app_id: int):
         return redirect(url_for("admin.dashboard"))
 
     user = db.session.get(User, app_row.user_id)
-    messages = ChatMessage.query.filter_by(application_id=app_row.id).order_by(ChatMessage.created_at.asc()).all()
-    return render_template("admin/application.html", app=app_row, user=user, messages=messages)
+    messages, has_older = recent_messages(app_row.id)
+    mark_read(app_row.id, "admin", messages)
+    return render_template("admin/application.html", app=app_row, user=user, messages=messages, has_older=has_older)
+
+
+@bp.get("/applications/<int:app_id>/chat/messages")
+@login_required
+def chat_messages(app_id: int):
+    if not current_user.is_admin:
+        return jsonify({"error": "forbidden"}), 403
+
+    app_row = db.get_or_404(Application, app_id)
+    return jsonify(page_for_args(app_row.id, request.args, reader_role="admin"))
 
 
 @bp.post("/applications/<int:app_id>/chat")
@@ -268,21 +589,23 @@ def chat_send(app_id: int):
         return redirect(url_for("admin.dashboard"))
 
     text = (request.form.get("message") or "").strip()
+    wants_json = request.accept_mimetypes.best == "application/json"
     if not text:
+        if wants_json:
+            return jsonify({"ok": False, "error": "empty"}), 400
         return redirect(url_for("admin.application", app_id=app_id))
 
-    msg = ChatMessage(
-        application_id=app_row.id,
-        sender_role="admin",
-        sender_name="I am Molay Man",
-        message=text,
-    )
-    db.session.add(msg)
-    db.session.commit()
+    # Added to the session first so post_message's commit writes it with the message.
     _audit(
         "admin_chat_send",
         target_type="Application",
         target_id=app_row.id,
-        detail=(text[:500] if text else None),
+        detail=text[:500],
+        sync=True,
+    )
+    msg = post_message(
+        app_row.id, sender_role="admin", sender_name="I am Molay Man", text=text, recipient_user_id=app_row.user_id
     )
+    if wants_json:
+        return jsonify({"ok": True, "message": message_json(msg)})
     return redirect(url_for("admin.application", app_id=app_id))
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, case, exists
+
+from .activity import active_weeks
+from .cache import SnapshotCache
+from .extensions import db
+from .models import (
+    Application,
+    ClassFee,
+    DailyMetric,
+    RollupWatermark,
+    User,
+    UserActivityYear,
+    UserGameStat,
+    discounted_amount_sql,
+)
+
+
+# Admin numbers may lag writes by this much; nothing on the page needs to be live.
+analytics_cache = SnapshotCache(ttl_seconds=60)
+
+# Funnel and cohort reports are heavy and only need to be current to the day.
+report_cache = SnapshotCache(ttl_seconds=6 * 3600)
+
+TREND_WINDOWS = (30, 90, 365)
+TREND_METRICS = (
+    ("signups", "Sign-ups"),
+    ("applications", "Applications"),
+    ("payments", "Payments submitted"),
+    ("game_plays", "Game plays"),
+    ("flagged_scores", "Flagged scores"),
+    ("discount_granted", "Discount granted (BDT)"),
+)
+
+
+def overview() -> dict[str, int]:
+    return analytics_cache.get("overview", _load_overview)
+
+
+def _count_if(condition):
+    return db.func.coalesce(db.func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _sum_if(condition, value):
+    return db.func.coalesce(db.func.sum(case((condition, value), else_=0)), 0)
+
+
+def _load_overview() -> dict[str, int]:
+    """Every headline metric in one statement: conditional aggregates over application + a user count."""
+    paid = Application.payment_method.is_not(None)
+    payable = discounted_amount_sql(ClassFee.amount_bdt, Application.total_discount_pct)
+    row = (
+        db.session.query(
+            db.session.query(db.func.count(User.id)).scalar_subquery().label("total_users"),
+            db.func.count(Application.id).label("total_apps"),
+            _count_if(Application.status == "pending").label("pending"),
+            _count_if(Application.status == "accepted").label("accepted"),
+            _count_if(Application.status == "rejected").label("rejected"),
+            _count_if(paid).label("paid"),
+            db.func.coalesce(db.func.sum(ClassFee.amount_bdt), 0).label("gross_fees"),
+            db.func.coalesce(db.func.sum(payable), 0).label("payable_total"),
+            _sum_if(paid, payable).label("paid_total"),
+            db.func.coalesce(db.func.avg(Application.total_discount_pct), 0).label("avg_discount_pct"),
+        )
+        .select_from(Application)
+        .join(ClassFee, ClassFee.id == Application.class_fee_id)
+        .one()
+    )
+    out = {key: int(round(value or 0)) for key, value in row._mapping.items()}
+    out["discount_given"] = out["gross_fees"] - out["payable_total"]
+    return out
+
+
+@dataclass(frozen=True)
+class TrendSeries:
+    metric: str
+    label: str
+    values: list[int]  # one per day, oldest first
+
+    @property
+    def total(self) -> int:
+        return sum(self.values)
+
+    @property
+    def peak(self) -> int:
+        return max(self.values, default=0)
+
+
+@dataclass(frozen=True)
+class Trends:
+    days: int
+    start: date
+    end: date
+    series: list[TrendSeries]
+    plays_by_game: list[tuple[str, int]]  # busiest first
+    rolled_up_at: datetime | None  # last `flask analytics rollup`, None if it never ran
+
+
+def trends(days: int) -> Trends:
+    """Daily series for the last `days` days, read only from the daily_metric rollups."""
+    return analytics_cache.get(("trends", days), lambda: _load_trends(days))
+
+
+def _load_trends(days: int) -> Trends:
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+    metrics = [m for m, _ in TREND_METRICS]
+    rows = (
+        db.session.query(DailyMetric.metric, DailyMetric.dim, DailyMetric.day, DailyMetric.value)
+        .filter(DailyMetric.metric.in_(metrics), DailyMetric.day >= start, DailyMetric.day <= end)
+        .all()
+    )
+    values = {m: [0] * days for m in metrics}
+    plays_by_game: Counter = Counter()
+    for metric, dim, day, value in rows:
+        values[metric][(day - start).days] += int(value)
+        if metric == "game_plays":
+            plays_by_game[dim] += int(value)
+
+    return Trends(
+        days=days,
+        start=start,
+        end=end,
+        series=[TrendSeries(m, label, values[m]) for m, label in TREND_METRICS],
+        plays_by_game=plays_by_game.most_common(),
+        rolled_up_at=db.session.query(db.func.max(RollupWatermark.updated_at)).scalar(),
+    )
+
+
+FUNNEL_WINDOWS = (30, 90, 365)  # signup window in days; None means all time
+FUNNEL_STAGES = (
+    ("signed_up", "Signed up"),
+    ("applied", "Applied"),
+    ("spun", "Spun the wheel"),
+    ("played", "Played ≥1 game"),
+    ("paid", "Submitted payment"),
+    ("accepted", "Accepted"),
+)
+COHORT_WEEKS = 12
+COHORT_CHUNK = 1000
+
+
+@dataclass(frozen=True)
+class FunnelStage:
+    key: str
+    label: str
+    reached: int  # users who completed this step and every earlier one
+    any: int  # users who completed this step, regardless of earlier ones
+    of_previous: float | None  # reached / previous stage's reached, in percent
+
+
+def funnel(days: int | None) -> list[FunnelStage]:
+    """Signup-to-acceptance funnel for users who signed up in the last `days` days (all time when None)."""
+    today = datetime.utcnow().date()
+    return report_cache.get(("funnel", today, days), lambda: _load_funnel(today, days))
+
+
+def _load_funnel(today: date, days: int | None) -> list[FunnelStage]:
+    # One pass over user: each step is an indexed EXISTS per user, summed in the same SELECT.
+    def app_exists(*where):
+        return exists().where(Application.user_id == User.id, *where)
+
+    flags = [
+        app_exists(),
+        app_exists(Application.spin_discount_pct > 0),
+        exists().where(UserGameStat.user_id == User.id, UserGameStat.plays_count > 0),
+        app_exists(Application.payment_method.is_not(None)),
+        app_exists(Application.status == "accepted"),
+    ]
+    columns = [db.func.count(User.id)]
+    for i, flag in enumerate(flags):
+        columns.append(_count_if(flag))
+        columns.append(_count_if(and_(*flags[: i + 1])))
+
+    query = db.session.query(*columns).filter(User.is_admin.is_(False))
+    if days is not None:
+        query = query.filter(User.created_at >= datetime.combine(today - timedelta(days=days - 1), datetime.min.time()))
+    row = query.one()
+
+    signed_up = int(row[0] or 0)
+    stages = [FunnelStage("signed_up", FUNNEL_STAGES[0][1], signed_up, signed_up, None)]
+    for i, (key, label) in enumerate(FUNNEL_STAGES[1:]):
+        any_, reached = int(row[1 + 2 * i] or 0), int(row[2 + 2 * i] or 0)
+        previous = stages[-1].reached
+        stages.append(FunnelStage(key, label, reached, any_, round(100 * reached / previous, 1) if previous else None))
+    return stages
+
+
+@dataclass(frozen=True)
+class CohortRow:
+    week_start: date  # Monday of the signup week
+    size: int
+    retained: list[float | None]  # percent active in week 0, 1, ...; None for weeks not reached yet
+
+
+def cohort_retention(weeks: int = COHORT_WEEKS) -> list[CohortRow]:
+    """Weekly signup cohorts for the last `weeks` weeks and the share active (activity bitmaps) each week after."""
+    today = datetime.utcnow().date()
+    return report_cache.get(("cohorts", today, weeks), lambda: _load_cohorts(today, weeks))
+
+
+def _monday(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+def _load_cohorts(today: date, weeks: int) -> list[CohortRow]:
+    first_week = _monday(today) - timedelta(weeks=weeks - 1)
+    sizes: Counter = Counter()
+    active: Counter = Counter()  # (cohort week, weeks since) -> users
+
+    # Stream users in id order; only the current chunk's activity days are ever in memory.
+    last_id = 0
+    while True:
+        users = (
+            db.session.query(User.id, User.created_at)
+            .filter(
+                User.id > last_id,
+                User.is_admin.is_(False),
+                User.created_at >= datetime.combine(first_week, datetime.min.time()),
+            )
+            .order_by(User.id.asc())
+            .limit(COHORT_CHUNK)
+            .all()
+        )
+        if not users:
+            break
+        last_id = users[-1].id
+
+        cohort_of = {uid: _monday(created.date()) for uid, created in users}
+        sizes.update(cohort_of.values())
+        # One bitmap row per user-year instead of one row per active day.
+        weeks_active: dict[int, set[int]] = {}
+        bitmaps = db.session.query(UserActivityYear.user_id, UserActivityYear.year, UserActivityYear.days).filter(
+            UserActivityYear.user_id.in_(list(cohort_of)), UserActivityYear.year >= first_week.year
+        )
+        for uid, year, bits in bitmaps:
+            for monday in active_weeks(year, bits):
+                offset = (monday - cohort_of[uid]).days // 7
+                if offset >= 0:
+                    weeks_active.setdefault(uid, set()).add(offset)
+        for uid, offsets in weeks_active.items():
+            for offset in offsets:
+                active[cohort_of[uid], offset] += 1
+        if len(users) < COHORT_CHUNK:
+            break
+
+    rows = []
+    for i in range(weeks):
+        week = first_week + timedelta(weeks=i)
+        size = sizes[week]
+        elapsed = (_monday(today) - week).days // 7
+        rows.append(
+            CohortRow(
+                week_start=week,
+                size=size,
+                retained=[
+                    round(100 * active[week, k] / size, 1) if size and k <= elapsed else None
+                    for k in range(weeks)
+                ],
+            )
+        )
+    return rows
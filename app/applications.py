@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import joinedload
+from werkzeug.datastructures import MultiDict
+
+from .exports import csv_chunks, parse_date_arg, stream_rows
+from .extensions import db
+from .models import Application, ClassFee, GameScore, User, discounted_amount_sql
+
+
+PAGE_SIZE = 50
+STATUSES = ("pending", "accepted", "rejected")
+EXPORT_DATE_FIELDS = ("applied", "paid")
+ACCOUNTING_COLUMNS = (
+    "application_id",
+    "applied_at",
+    "status",
+    "user_id",
+    "user_name",
+    "user_email",
+    "class",
+    "fee_bdt",
+    "payment_method",
+    "payment_reference",
+    "paid_at",
+    "spin_discount_pct",
+    "games_discount_pct",
+    "bonus_discount_pct",
+    "total_discount_pct",
+    "discount_bdt",
+    "payable_bdt",
+)
+
+
+@dataclass(frozen=True)
+class ApplicationFilters:
+    status: str | None = None
+    class_fee_id: int | None = None
+    paid: bool | None = None  # True: payment submitted, False: not yet
+    flagged: bool = False  # only applications with a flagged game score
+
+    @classmethod
+    def from_args(cls, args: MultiDict) -> ApplicationFilters:
+        status = args.get("status")
+        paid = args.get("paid")
+        return cls(
+            status=status if status in STATUSES else None,
+            class_fee_id=args.get("class", type=int),
+            paid={"paid": True, "unpaid": False}.get(paid),
+            flagged=args.get("flagged") == "1",
+        )
+
+    def as_args(self) -> dict:
+        """Query-string form, for links that keep the current filters."""
+        return {
+            "status": self.status,
+            "class": self.class_fee_id,
+            "paid": None if self.paid is None else ("paid" if self.paid else "unpaid"),
+            "flagged": "1" if self.flagged else None,
+        }
+
+    @property
+    def active(self) -> bool:
+        return any(v is not None for v in self.as_args().values())
+
+
+def _has_flagged_score():
+    return exists().where(GameScore.application_id == Application.id, GameScore.is_flagged == db.true())
+
+
+def application_page(
+    filters: ApplicationFilters, *, before_id: int | None = None, limit: int = PAGE_SIZE
+) -> tuple[list[Application], int | None]:
+    """Newest-first page of applications, keyset-paginated on (created_at, id).
+
+    `user` and `class_fee` are loaded in the same query. Returns (rows, before_id
+    for the next page or None).
+    """
+    query = Application.query.options(joinedload(Application.user), joinedload(Application.class_fee))
+    if filters.status:
+        query = query.filter(Application.status == filters.status)
+    if filters.class_fee_id:
+        query = query.filter(Application.class_fee_id == filters.class_fee_id)
+    if filters.paid is not None:
+        paid = Application.payment_method.is_not(None)
+        query = query.filter(paid if filters.paid else ~paid)
+    if filters.flagged:
+        query = query.filter(_has_flagged_score())
+
+    if before_id is not None:
+        anchor = db.session.query(Application.created_at).filter(Application.id == before_id).scalar()
+        if anchor is not None:
+            query = query.filter(
+                or_(
+                    Application.created_at < anchor,
+                    and_(Application.created_at == anchor, Application.id < before_id),
+                )
+            )
+
+    # One extra row tells us whether there is another page without a COUNT.
+    rows = query.order_by(Application.created_at.desc(), Application.id.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if more else None)
+
+
+def flagged_application_ids(application_ids: list[int]) -> set[int]:
+    """Which of these applications have at least one flagged game score (one query)."""
+    if not application_ids:
+        return set()
+    rows = (
+        db.session.query(GameScore.application_id)
+        .filter(GameScore.application_id.in_(application_ids), GameScore.is_flagged == db.true())
+        .distinct()
+        .all()
+    )
+    return {app_id for (app_id,) in rows}
+
+
+@dataclass(frozen=True)
+class ExportFilters:
+    status: str | None = None
+    date_field: str = "applied"  # which date the range applies to: "applied" or "paid"
+    date_from: date | None = None  # inclusive, UTC
+    date_to: date | None = None  # inclusive, UTC
+
+    @classmethod
+    def from_args(cls, args: MultiDict) -> ExportFilters:
+        status = args.get("status")
+        by = args.get("by")
+        return cls(
+            status=status if status in STATUSES else None,
+            date_field=by if by in EXPORT_DATE_FIELDS else "applied",
+            date_from=parse_date_arg(args.get("from")),
+            date_to=parse_date_arg(args.get("to")),
+        )
+
+    def as_args(self) -> dict:
+        return {
+            "status": self.status,
+            "by": None if self.date_field == "applied" else self.date_field,
+            "from": self.date_from.isoformat() if self.date_from else None,
+            "to": self.date_to.isoformat() if self.date_to else None,
+        }
+
+
+def accounting_rows(filters: ExportFilters) -> Iterator[tuple]:
+    """One row per application in ACCOUNTING_COLUMNS order, oldest first, streamed from the cursor.
+
+    Discount and payable amounts are computed in SQL with the same rounding as
+    Application.discounted_amount.
+    """
+    apps = Application.__table__
+    users = User.__table__
+    fees = ClassFee.__table__
+    payable = discounted_amount_sql(fees.c.amount_bdt, apps.c.total_discount_pct)
+    day = apps.c.paid_at if filters.date_field == "paid" else apps.c.created_at
+
+    stmt = (
+        db.select(
+            apps.c.id,
+            apps.c.created_at,
+            apps.c.status,
+            users.c.id,
+            users.c.name,
+            users.c.email,
+            fees.c.class_name,
+            fees.c.amount_bdt,
+            apps.c.payment_method,
+            apps.c.payment_reference,
+            apps.c.paid_at,
+            apps.c.spin_discount_pct,
+            apps.c.games_discount_pct,
+            apps.c.bonus_discount_pct,
+            apps.c.total_discount_pct,
+            fees.c.amount_bdt - payable,
+            payable,
+        )
+        .join(users, users.c.id == apps.c.user_id)
+        .join(fees, fees.c.id == apps.c.class_fee_id)
+    )
+    if filters.status:
+        stmt = stmt.where(apps.c.status == filters.status)
+    if filters.date_field == "paid":
+        stmt = stmt.where(apps.c.paid_at.is_not(None))
+    if filters.date_from:
+        stmt = stmt.where(day >= datetime.combine(filters.date_from, datetime.min.time()))
+    if filters.date_to:
+        stmt = stmt.where(day < datetime.combine(filters.date_to + timedelta(days=1), datetime.min.time()))
+    # Walks ix_application_created / ix_application_status_created, or ix_application_paid_at.
+    return stream_rows(stmt.order_by(day.asc(), apps.c.id.asc()))
+
+
+def accounting_csv(filters: ExportFilters) -> Iterator[str]:
+    return csv_chunks(ACCOUNTING_COLUMNS, accounting_rows(filters))
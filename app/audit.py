@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+from werkzeug.datastructures import MultiDict
+
+from .exports import EXPORT_BATCH, csv_chunks, parse_date_arg, stream_rows
+from .extensions import db
+from .models import AdminAuditLog, User
+
+
+log = logging.getLogger(__name__)
+
+
+class AuditSink:
+    """Buffers admin audit rows in-process and writes them in batches from a background thread.
+
+    - A batch is written once `batch_size` rows are waiting or `flush_seconds` have passed.
+    - Writes use their own connection, never the request's session or transaction.
+    - Pending rows are flushed at interpreter exit (gunicorn graceful shutdown).
+    - At most `max_pending` rows are held; if the database stays down, the oldest are dropped.
+    """
+
+    def __init__(self, *, batch_size: int = 100, flush_seconds: float = 2.0, max_pending: int = 10_000) -> None:
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.enabled = True
+        self._app: Flask | None = None
+        self._pending: deque[dict] = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._closing = False
+
+    def init_app(self, app: Flask) -> None:
+        self._app = app
+        self.batch_size = int(app.config["AUDIT_BATCH_SIZE"])
+        self.flush_seconds = float(app.config["AUDIT_FLUSH_SECONDS"])
+        # AUDIT_ASYNC=false writes each row immediately (tests, one-off scripts).
+        self.enabled = bool(app.config["AUDIT_ASYNC"])
+        atexit.register(self.close)
+
+    def enqueue(self, row: dict) -> None:
+        row.setdefault("created_at", datetime.utcnow())
+        if not self.enabled:
+            self._write([row])
+            return
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                log.warning("Audit buffer full; dropped the oldest entry.")
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        self._ensure_thread()
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of rows written."""
+        written = 0
+        while True:
+            with self._cond:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                return written
+            if not self._write(batch):
+                with self._cond:
+                    # Keep them for the next attempt, ahead of anything newer.
+                    self._pending.extendleft(reversed(batch))
+                return written
+            written += len(batch)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=5.0)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        # Started on first use in each process, so gunicorn workers forked from a
+        # preloaded master each get their own writer.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size and not self._closing:
+                    self._cond.wait(self.flush_seconds)
+                closing = self._closing
+            self.flush()
+            if closing:
+                return
+
+    def _write(self, rows: list[dict]) -> bool:
+        if self._app is None:
+            log.error("Audit sink used before init_app; dropping %d entries.", len(rows))
+            return True
+        with self._write_lock:
+            try:
+                with self._app.app_context(), db.engine.begin() as conn:
+                    # One multi-row INSERT per batch.
+                    conn.execute(AdminAuditLog.__table__.insert().values(rows))
+                return True
+            except Exception:
+                log.exception("Could not write %d audit entries; will retry.", len(rows))
+                return False
+
+
+audit_sink = AuditSink()
+
+
+PAGE_SIZE = 100
+EXPORT_COLUMNS = (
+    "id",
+    "created_at",
+    "admin_user_id",
+    "admin_email",
+    "action",
+    "target_type",
+    "target_id",
+    "detail",
+    "ip_address",
+    "user_agent",
+)
+
+
+@dataclass(frozen=True)
+class AuditFilters:
+    admin_user_id: int | None = None
+    action: str | None = None
+    target_type: str | None = None
+    target_id: int | None = None
+    date_from: date | None = None  # inclusive, UTC
+    date_to: date | None = None  # inclusive, UTC
+
+    @classmethod
+    def from_args(cls, args: MultiDict) -> AuditFilters:
+        return cls(
+            admin_user_id=args.get("admin", type=int),
+            action=(args.get("action") or "").strip() or None,
+            target_type=(args.get("target_type") or "").strip() or None,
+            target_id=args.get("target_id", type=int),
+            date_from=parse_date_arg(args.get("from")),
+            date_to=parse_date_arg(args.get("to")),
+        )
+
+    def as_args(self) -> dict:
+        """Query-string form, for links that keep the current filters."""
+        return {
+            "admin": self.admin_user_id,
+            "action": self.action,
+            "target_type": self.target_type,
+            "target_id": self.target_id,
+            "from": self.date_from.isoformat() if self.date_from else None,
+            "to": self.date_to.isoformat() if self.date_to else None,
+        }
+
+    @property
+    def active(self) -> bool:
+        return any(v is not None for v in self.as_args().values())
+
+    def apply(self, stmt):
+        # Each filter is the leading column of one of the (…, created_at, id) indexes.
+        if self.admin_user_id is not None:
+            stmt = stmt.where(AdminAuditLog.admin_user_id == self.admin_user_id)
+        if self.action:
+            stmt = stmt.where(AdminAuditLog.action == self.action)
+        if self.target_type:
+            stmt = stmt.where(AdminAuditLog.target_type == self.target_type)
+        if self.target_id is not None:
+            stmt = stmt.where(AdminAuditLog.target_id == self.target_id)
+        if self.date_from:
+            stmt = stmt.where(AdminAuditLog.created_at >= datetime.combine(self.date_from, datetime.min.time()))
+        if self.date_to:
+            end = datetime.combine(self.date_to + timedelta(days=1), datetime.min.time())
+            stmt = stmt.where(AdminAuditLog.created_at < end)
+        return stmt
+
+
+def audit_page(
+    filters: AuditFilters, *, before_id: int | None = None, limit: int = PAGE_SIZE
+) -> tuple[list[AdminAuditLog], int | None]:
+    """Newest-first page of audit entries, keyset-paginated on (created_at, id).
+
+    Returns (rows, before_id for the next page or None).
+    """
+    stmt = filters.apply(db.select(AdminAuditLog).options(joinedload(AdminAuditLog.admin)))
+    if before_id is not None:
+        anchor = db.session.query(AdminAuditLog.created_at).filter(AdminAuditLog.id == before_id).scalar()
+        if anchor is not None:
+            stmt = stmt.where(
+                or_(
+                    AdminAuditLog.created_at < anchor,
+                    and_(AdminAuditLog.created_at == anchor, AdminAuditLog.id < before_id),
+                )
+            )
+
+    # One extra row tells us whether there is another page without a COUNT.
+    stmt = stmt.order_by(AdminAuditLog.created_at.desc(), AdminAuditLog.id.desc()).limit(limit + 1)
+    rows = db.session.execute(stmt).scalars().all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if more else None)
+
+
+def _export_rows(filters: AuditFilters) -> Iterator[tuple]:
+    log_table = AdminAuditLog.__table__
+    user_table = User.__table__
+    stmt = filters.apply(
+        db.select(
+            log_table.c.id,
+            log_table.c.created_at,
+            log_table.c.admin_user_id,
+            user_table.c.email,
+            log_table.c.action,
+            log_table.c.target_type,
+            log_table.c.target_id,
+            log_table.c.detail,
+            log_table.c.ip_address,
+            log_table.c.user_agent,
+        ).outerjoin(user_table, user_table.c.id == log_table.c.admin_user_id)
+    ).order_by(log_table.c.created_at.asc(), log_table.c.id.asc())
+    return stream_rows(stmt)
+
+
+def export_csv(filters: AuditFilters) -> Iterator[str]:
+    return csv_chunks(EXPORT_COLUMNS, _export_rows(filters))
+
+
+def export_jsonl(filters: AuditFilters) -> Iterator[str]:
+    # Rows are set up here, not on first iteration, like export_csv: the
+    # response is streamed after the request's app context has ended.
+    return _jsonl_chunks(_export_rows(filters))
+
+
+def _jsonl_chunks(rows: Iterator[tuple]) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        item = dict(zip(EXPORT_COLUMNS, row))
+        item["created_at"] = item["created_at"].isoformat()
+        lines.append(json.dumps(item, ensure_ascii=False))
+        if len(lines) == EXPORT_BATCH:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
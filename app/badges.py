@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+
+from .batching import iter_user_id_chunks
+from .extensions import db
+from .models import Application, BadgeAward, UserGameStat
+from .notifications import publish
+from .upserts import insert_badge_rows
+
+
+@dataclass(frozen=True)
+class BadgeRule:
+    key: str
+    icon: str
+    title: str
+    metric: str  # see METRICS
+    threshold: int  # earned once metric >= threshold
+
+
+# Metrics a rule can be declared against.
+METRICS = {
+    "total_plays": "Games played across all applications",
+    "total_discount_pct": "Best total discount on any application",
+    "spin_discount_pct": "Best spin-wheel win on any application",
+    "payments_submitted": "Applications with a payment submitted",
+}
+
+
+BADGE_RULES: tuple[BadgeRule, ...] = (
+    BadgeRule("first_game", "🎮", "First Game", "total_plays", 1),
+    BadgeRule("games_5", "⭐", "5 Games Played", "total_plays", 5),
+    BadgeRule("games_10", "🔥", "10 Games Legend", "total_plays", 10),
+    BadgeRule("games_25", "👑", "Game Master", "total_plays", 25),
+    BadgeRule("discount_50", "💎", "Reached 50% Discount", "total_discount_pct", 50),
+    BadgeRule("spin_30", "🎰", "30% Spin Winner", "spin_discount_pct", 30),
+    BadgeRule("payment_submitted", "💳", "Payment Submitted", "payments_submitted", 1),
+)
+
+
+class BadgeRegistry:
+    """Badge rules precompiled into per-metric tables sorted by threshold."""
+
+    def __init__(self, rules: Iterable[BadgeRule]) -> None:
+        self.rules = tuple(rules)
+        keys = [r.key for r in self.rules]
+        if len(keys) != len(set(keys)):
+            raise ValueError("Duplicate badge keys in registry")
+
+        self._tables: dict[str, tuple[list[int], list[BadgeRule]]] = {}
+        for metric in {r.metric for r in self.rules}:
+            if metric not in METRICS:
+                raise ValueError(f"Unknown badge metric: {metric!r}")
+            ordered = sorted((r for r in self.rules if r.metric == metric), key=lambda r: r.threshold)
+            self._tables[metric] = ([r.threshold for r in ordered], ordered)
+
+    def earned(self, metrics: Mapping[str, int]) -> list[BadgeRule]:
+        # Every rule whose threshold is <= the metric value; one bisect per metric.
+        out: list[BadgeRule] = []
+        for metric, value in metrics.items():
+            table = self._tables.get(metric)
+            if table is None or value is None:
+                continue
+            thresholds, ordered = table
+            out.extend(ordered[: bisect_right(thresholds, int(value))])
+        return out
+
+
+registry = BadgeRegistry(BADGE_RULES)
+
+
+def held_badge_keys(user_id: int) -> set[str]:
+    return {key for (key,) in db.session.query(BadgeAward.badge_key).filter(BadgeAward.user_id == user_id).all()}
+
+
+def award_earned_badges(user_id: int, metrics: Mapping[str, int], *, held: set[str] | None = None) -> list[BadgeRule]:
+    """Insert every badge the metrics earn that the user does not hold. Returns the new ones.
+
+    Pass `held` when the caller already loaded the user's badge keys; it is updated in place.
+    """
+    if held is None:
+        held = held_badge_keys(user_id)
+
+    fresh = [rule for rule in registry.earned(metrics) if rule.key not in held]
+    if not fresh:
+        return []
+
+    rows = [{"user_id": user_id, "badge_key": r.key, "icon": r.icon, "title": r.title} for r in fresh]
+    inserted = {key for _, key in insert_badge_rows(rows)}
+    held |= inserted
+    new_badges = [rule for rule in fresh if rule.key in inserted]
+    for rule in new_badges:
+        publish("badge", {"key": rule.key, "icon": rule.icon, "title": rule.title}, user_id=user_id)
+    return new_badges
+
+
+def reevaluate_all_badges(*, chunk_size: int = 500) -> int:
+    """Re-run every rule for every user (e.g. after a rule change). Returns badges inserted."""
+    awarded = 0
+    for user_ids in iter_user_id_chunks(chunk_size):
+        metrics: dict[int, dict[str, int]] = {uid: {} for uid in user_ids}
+
+        plays = (
+            db.session.query(UserGameStat.user_id, db.func.sum(UserGameStat.plays_count))
+            .filter(UserGameStat.user_id.in_(user_ids))
+            .group_by(UserGameStat.user_id)
+            .all()
+        )
+        for uid, total in plays:
+            metrics[uid]["total_plays"] = int(total or 0)
+
+        apps = (
+            db.session.query(
+                Application.user_id,
+                db.func.max(Application.total_discount_pct),
+                db.func.max(Application.spin_discount_pct),
+                db.func.count(Application.payment_method),
+            )
+            .filter(Application.user_id.in_(user_ids))
+            .group_by(Application.user_id)
+            .all()
+        )
+        for uid, total_discount, spin, paid in apps:
+            metrics[uid].update(
+                total_discount_pct=int(total_discount or 0),
+                spin_discount_pct=int(spin or 0),
+                payments_submitted=int(paid or 0),
+            )
+
+        held: dict[int, set[str]] = {uid: set() for uid in user_ids}
+        for uid, key in (
+            db.session.query(BadgeAward.user_id, BadgeAward.badge_key).filter(BadgeAward.user_id.in_(user_ids)).all()
+        ):
+            held[uid].add(key)
+
+        rows = [
+            {"user_id": uid, "badge_key": r.key, "icon": r.icon, "title": r.title}
+            for uid, user_metrics in metrics.items()
+            for r in registry.earned(user_metrics)
+            if r.key not in held[uid]
+        ]
+        awarded += len(insert_badge_rows(rows))
+        db.session.commit()
+
+    return awarded
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+from .extensions import db
+from .models import User
+
+
+def iter_id_chunks(column, chunk_size: int = 1000, *, filters: tuple = ()) -> Iterator[list[int]]:
+    """Keyset walk over an integer id column so batch jobs never hold the whole table."""
+    last_id = 0
+    while True:
+        ids = [
+            row_id
+            for (row_id,) in db.session.query(column)
+            .filter(column > last_id, *filters)
+            .order_by(column.asc())
+            .limit(chunk_size)
+            .all()
+        ]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def iter_user_id_chunks(chunk_size: int = 1000) -> Iterator[list[int]]:
+    return iter_id_chunks(User.id, chunk_size)
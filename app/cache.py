@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+
+
+class SnapshotCache:
+    """Per-process cache of read-mostly snapshots (leaderboards, option lists).
+
+    - Entries expire after `ttl_seconds`, which bounds staleness across workers.
+    - `invalidate()` expires keys immediately in this worker after a write.
+    - Only one thread per key runs the loader. While it does, other threads
+      are served the previous snapshot, or wait for it if there is none yet.
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[Hashable, _Entry] = {}
+        self._generations: dict[Hashable, int] = {}
+        self._locks: dict[Hashable, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry.value
+
+        lock = self._lock_for(key)
+        if entry is not None:
+            if not lock.acquire(blocking=False):
+                # Someone else is refreshing: a slightly stale snapshot beats a stampede.
+                return entry.value
+        else:
+            lock.acquire()
+
+        try:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                return entry.value
+
+            generation = self._generations.get(key, 0)
+            value = loader()
+            # An invalidate() during the load means the value may predate the write:
+            # keep it for stale reads but do not treat it as fresh.
+            fresh = self._generations.get(key, 0) == generation
+            self._entries[key] = _Entry(value, time.monotonic() + self.ttl_seconds if fresh else 0.0)
+            return value
+        finally:
+            lock.release()
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._guard:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.expires_at = 0.0
+
+    def clear(self) -> None:
+        with self._guard:
+            for key in self._entries:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.clear()
+
+    def _lock_for(self, key: Hashable) -> threading.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(key, threading.Lock())
+        return lock
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import and_, case
+from werkzeug.datastructures import MultiDict
+
+from .extensions import db
+from .models import Application, ChatMessage, ChatReadCursor, ClassFee, User
+from .notifications import AUDIENCE_ADMINS, publish
+from .upserts import advance_read_cursor
+
+
+PAGE_SIZE = 50
+INBOX_PAGE_SIZE = 30
+
+
+def recent_messages(application_id: int, *, limit: int = PAGE_SIZE) -> tuple[list[ChatMessage], bool]:
+    """The newest `limit` messages in display order, and whether older ones exist."""
+    return messages_before(application_id, None, limit=limit)
+
+
+def messages_before(application_id: int, before_id: int | None, *, limit: int = PAGE_SIZE) -> tuple[list[ChatMessage], bool]:
+    """Keyset page of messages older than `before_id` (newest page when None), oldest first."""
+    query = ChatMessage.query.filter(ChatMessage.application_id == application_id)
+    if before_id is not None:
+        query = query.filter(ChatMessage.id < before_id)
+    # One extra row tells us whether there is another page without a COUNT.
+    rows = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return rows[:limit][::-1], has_more
+
+
+def messages_after(application_id: int, after_id: int, *, limit: int = 200) -> list[ChatMessage]:
+    """Messages newer than `after_id`, oldest first (what a polling client has not seen yet)."""
+    return (
+        ChatMessage.query.filter(ChatMessage.application_id == application_id, ChatMessage.id > after_id)
+        .order_by(ChatMessage.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def post_message(
+    application_id: int, *, sender_role: str, sender_name: str, text: str, recipient_user_id: int | None = None
+) -> ChatMessage:
+    """Save a message and push it to the other side: `recipient_user_id`, or every admin when None."""
+    msg = ChatMessage(application_id=application_id, sender_role=sender_role, sender_name=sender_name, message=text)
+    db.session.add(msg)
+    db.session.flush()
+    advance_read_cursor(application_id, sender_role, msg.id)
+    payload = {"application_id": application_id, **message_json(msg)}
+    if recipient_user_id is None:
+        publish("chat", payload, audience=AUDIENCE_ADMINS)
+    else:
+        publish("chat", payload, user_id=recipient_user_id)
+    db.session.commit()
+    return msg
+
+
+def message_json(m: ChatMessage) -> dict:
+    return {
+        "id": m.id,
+        "sender_role": m.sender_role,
+        "sender_name": m.sender_name,
+        "message": m.message,
+        "created_at": m.created_at.isoformat(timespec="seconds"),
+    }
+
+
+def page_json(messages: list[ChatMessage], *, has_more: bool | None = None) -> dict:
+    out = {"messages": [message_json(m) for m in messages]}
+    if has_more is not None:
+        out["has_more"] = has_more
+    return out
+
+
+def page_for_args(application_id: int, args: MultiDict, *, reader_role: str) -> dict:
+    """?after=<id> for polling, ?before=<id> for "load older", neither for the newest page.
+
+    New and newest messages count as read by `reader_role`.
+    """
+    after = args.get("after", type=int)
+    before = args.get("before", type=int)
+    if after is not None:
+        messages = messages_after(application_id, after)
+        out = page_json(messages)
+    else:
+        messages, has_more = messages_before(application_id, before)
+        out = page_json(messages, has_more=has_more)
+    if before is None:
+        mark_read(application_id, reader_role, messages)
+    return out
+
+
+def mark_read(application_id: int, reader_role: str, messages: list[ChatMessage]) -> None:
+    if messages:
+        advance_read_cursor(application_id, reader_role, max(m.id for m in messages))
+        db.session.commit()
+
+
+def _unread_for(reader_role: str, cursor):
+    # Messages from the other side above the reader's cursor.
+    return db.func.coalesce(
+        db.func.sum(
+            case(
+                (
+                    and_(
+                        ChatMessage.sender_role != reader_role,
+                        ChatMessage.id > db.func.coalesce(cursor.last_read_id, 0),
+                    ),
+                    1,
+                ),
+                else_=0,
+            )
+        ),
+        0,
+    )
+
+
+def _cursor_join(reader_role: str):
+    cursor = db.aliased(ChatReadCursor)
+    on = and_(cursor.application_id == ChatMessage.application_id, cursor.reader_role == reader_role)
+    return cursor, on
+
+
+def unread_counts(reader_role: str, application_ids: list[int]) -> dict[int, int]:
+    """Unread message counts per application for one side, in one grouped query."""
+    if not application_ids:
+        return {}
+    cursor, on = _cursor_join(reader_role)
+    rows = (
+        db.session.query(ChatMessage.application_id, _unread_for(reader_role, cursor))
+        .outerjoin(cursor, on)
+        .filter(ChatMessage.application_id.in_(application_ids))
+        .group_by(ChatMessage.application_id)
+        .all()
+    )
+    return {app_id: int(unread) for app_id, unread in rows if unread}
+
+
+@dataclass(frozen=True)
+class InboxRow:
+    application_id: int
+    last_message_id: int
+    unread: int
+    preview: str
+    last_sender_role: str
+    last_sender_name: str
+    last_at: datetime
+    status: str
+    class_name: str
+    user_name: str
+    user_email: str
+
+
+def admin_inbox(
+    *, before_id: int | None = None, unread_only: bool = False, limit: int = INBOX_PAGE_SIZE
+) -> tuple[list[InboxRow], int | None]:
+    """Conversations by latest activity with admin unread counts; keyset-paginated on the latest message id.
+
+    Returns (rows, before_id for the next page or None).
+    """
+    cursor, on = _cursor_join("admin")
+    last_id = db.func.max(ChatMessage.id)
+    unread = _unread_for("admin", cursor)
+    agg = (
+        db.session.query(
+            ChatMessage.application_id.label("application_id"),
+            last_id.label("last_id"),
+            unread.label("unread"),
+        )
+        .outerjoin(cursor, on)
+        .group_by(ChatMessage.application_id)
+    )
+    if before_id is not None:
+        agg = agg.having(last_id < before_id)
+    if unread_only:
+        agg = agg.having(unread > 0)
+    agg = agg.order_by(last_id.desc()).limit(limit + 1).subquery()
+
+    latest = db.aliased(ChatMessage)
+    rows = (
+        db.session.query(
+            agg.c.application_id,
+            agg.c.last_id,
+            agg.c.unread,
+            latest.message,
+            latest.sender_role,
+            latest.sender_name,
+            latest.created_at,
+            Application.status,
+            ClassFee.class_name,
+            User.name,
+            User.email,
+        )
+        .join(latest, latest.id == agg.c.last_id)
+        .join(Application, Application.id == agg.c.application_id)
+        .join(ClassFee, ClassFee.id == Application.class_fee_id)
+        .join(User, User.id == Application.user_id)
+        .order_by(agg.c.last_id.desc())
+        .all()
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = [
+        InboxRow(
+            application_id=r[0],
+            last_message_id=r[1],
+            unread=int(r[2] or 0),
+            preview=(r[3] or "")[:140],
+            last_sender_role=r[4],
+            last_sender_name=r[5],
+            last_at=r[6],
+            status=r[7],
+            class_name=r[8],
+            user_name=r[9],
+            user_email=r[10],
+        )
+        for r in rows
+    ]
+    return items, (items[-1].last_message_id if more else None)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+import click
+from flask import Flask
+from flask.cli import AppGroup
+
+from .badges import reevaluate_all_badges
+from .engagement import (
+    migrate_activity_rows,
+    rebuild_streaks,
+    rebuild_weekly_game_best,
+    rebuild_weekly_progress,
+    week_key_for,
+)
+from .notifications import prune_events
+from .rollups import reset_rollups, run_rollups
+
+
+engagement_cli = AppGroup("engagement", help="Engagement maintenance commands.")
+analytics_cli = AppGroup("analytics", help="Analytics rollup commands.")
+fair_play_cli = AppGroup("fair-play", help="Offline fair-play analysis.")
+
+
+@engagement_cli.command("backfill-streaks")
+@click.option("--chunk-size", default=1000, show_default=True, help="Users processed per transaction.")
+def backfill_streaks(chunk_size: int) -> None:
+    """Rebuild user_streak from the activity bitmaps (folding in any legacy activity rows first)."""
+    rebuilt = rebuild_streaks(chunk_size=chunk_size)
+    click.echo(f"Rebuilt streaks for {rebuilt} users.")
+
+
+@engagement_cli.command("migrate-activity")
+@click.option("--chunk-size", default=1000, show_default=True, help="Users processed per transaction.")
+@click.option("--delete-rows", is_flag=True, help="Delete user_activity_day rows once folded into bitmaps.")
+def migrate_activity(chunk_size: int, delete_rows: bool) -> None:
+    """Fold legacy user_activity_day rows into user_activity_year bitmaps (safe to re-run)."""
+    folded = migrate_activity_rows(chunk_size=chunk_size, delete_rows=delete_rows)
+    click.echo(f"Folded {folded} activity rows into bitmaps.")
+
+
+@engagement_cli.command("rebuild-weekly")
+@click.option("--week", "week_key", default=None, help='ISO week key such as "2026-W06" (default: this week).')
+def rebuild_weekly(week_key: str | None) -> None:
+    """Recompute weekly challenge counters and game bests from game_score (e.g. after a fair-play reversal)."""
+    week_key = week_key or week_key_for()
+    written = rebuild_weekly_progress(week_key)
+    click.echo(f"Rebuilt weekly progress for {written} applications in {week_key}.")
+    bests = rebuild_weekly_game_best(week_key)
+    click.echo(f"Rebuilt {bests} weekly game bests in {week_key}.")
+
+
+@engagement_cli.command("reevaluate-badges")
+@click.option("--chunk-size", default=500, show_default=True, help="Users evaluated per batch.")
+def reevaluate_badges(chunk_size: int) -> None:
+    """Re-run every badge rule for every user, e.g. after adding or changing a rule."""
+    awarded = reevaluate_all_badges(chunk_size=chunk_size)
+    click.echo(f"Awarded {awarded} badges.")
+
+
+@engagement_cli.command("prune-events")
+@click.option("--hours", default=24, show_default=True, help="Delete stream notifications older than this.")
+def prune_events_command(hours: int) -> None:
+    """Delete delivered SSE notifications; reconnecting clients only need recent ones."""
+    deleted = prune_events(older_than=timedelta(hours=hours))
+    click.echo(f"Deleted {deleted} event notifications.")
+
+
+@analytics_cli.command("rollup")
+@click.option("--batch-size", default=5000, show_default=True, help="Source rows folded in per transaction.")
+@click.option("--rebuild", is_flag=True, help="Discard existing rollups and recount everything.")
+def rollup(batch_size: int, rebuild: bool) -> None:
+    """Fold new signups, applications, payments and game plays into daily_metric (safe to run from cron)."""
+    if rebuild:
+        reset_rollups()
+    processed = run_rollups(batch_size=batch_size)
+    for source, rows in processed.items():
+        click.echo(f"{source}: {rows} new rows")
+
+
+@fair_play_cli.command("analyze")
+@click.option("--chunk-size", default=50_000, show_default=True, help="game_score rows fetched per round trip.")
+def analyze(chunk_size: int) -> None:
+    """Scan every game score for statistical anomalies and replace the findings shown on the fair-play page."""
+    # Imported here so web workers never load NumPy.
+    from .score_analysis import analyze_scores
+
+    counts = analyze_scores(chunk_size=chunk_size)
+    for kind, found in counts.items():
+        click.echo(f"{kind}: {found} findings")
+
+
+def register_cli(app: Flask) -> None:
+    app.cli.add_command(engagement_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(fair_play_cli)
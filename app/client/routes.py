@@ -4,22 +4,31 @@ import random
 from datetime import datetime
 from pathlib import Path
 
-from flask import Blueprint, flash, current_app, jsonify, redirect, render_template, request, send_from_directory, url_for
+from flask import Blueprint, abort, flash, current_app, jsonify, redirect, render_template, request, send_from_directory, url_for
 from flask_login import current_user, login_required
 from werkzeug.utils import secure_filename
 
+from ..badges import award_earned_badges
+from ..chat import mark_read, message_json, page_for_args, post_message, recent_messages, unread_counts
 from ..extensions import db
+from ..games import game_registry
+from ..leaderboard import (
+    class_fee_options,
+    invalidate_discounts,
+    invalidate_game_scores,
+    ranks_for_user,
+    top_discounts,
+    top_game_scores,
+)
 from ..engagement import (
-    badge_rules_after_game,
+    GameSubmission,
+    GameSubmissionResult,
     compute_streak_days,
-    maybe_award_discount_badges,
-    maybe_award_weekly_bonus,
     record_activity_day,
-    should_flag_score,
-    update_user_game_stat,
+    week_key_for,
     weekly_challenge_for_application,
 )
-from ..models import Announcement, Application, BadgeAward, ChatMessage, ClassFee, GameScore, UserGameStat
+from ..models import Announcement, Application, BadgeAward, ClassFee, GameScore, UserGameStat
 
 bp = Blueprint("client", __name__, url_prefix="/client")
 
@@ -53,6 +62,7 @@ def dashboard():
         "client/dashboard.html",
         class_fees=class_fees,
         apps=apps,
+        unread=unread_counts("client", [a.id for a in apps]),
         announcement=announcement,
         streak_days=streak_days,
         recent_badges=recent_badges,
@@ -147,13 +157,11 @@ def payment(app_id: int):
     app_row.paid_at = datetime.utcnow()
 
     record_activity_day(current_user.id)
+    new_badges = award_earned_badges(current_user.id, {"payments_submitted": 1})
     db.session.commit()
 
-    # Badge: payment submitted
-    from ..engagement import award_badge_once
-
-    if award_badge_once(current_user.id, "payment_submitted", title="Payment Submitted", icon="💳"):
-        flash("Badge unlocked: 💳 Payment Submitted", "success")
+    for badge in new_badges:
+        flash(f"Badge unlocked: {badge.icon} {badge.title}", "success")
 
     flash("Payment submitted. You can now spin and play games.", "success")
     return redirect(url_for("client.application", app_id=app_id))
@@ -229,13 +237,16 @@ def spin_submit(app_id: int):
 
     record_activity_day(current_user.id)
 
-    from ..engagement import award_badge_once
-
-    if win and int(win) >= 30:
-        if award_badge_once(current_user.id, "spin_30", title="30% Spin Winner", icon="🎰"):
-            flash("Badge unlocked: 🎰 30% Spin Winner", "success")
-
+    new_badges = award_earned_badges(
+        current_user.id,
+        {"spin_discount_pct": app_row.spin_discount_pct, "total_discount_pct": app_row.total_discount_pct},
+    )
     db.session.commit()
+    if win:
+        invalidate_discounts(app_row.class_fee_id)
+
+    for badge in new_badges:
+        flash(f"Badge unlocked: {badge.icon} {badge.title}", "success")
 
     return jsonify({"ok": True, "discount": win})
 
@@ -274,6 +285,10 @@ def games(app_id: int):
     return render_template(
         "client/games.html",
         app=app_row,
+        game_tiers={
+            key: {"lower_is_better": tiers.lower_is_better, "tiers": tiers.pairs()}
+            for key, tiers in game_registry.all().items()
+        },
         streak_days=streak_days,
         weekly_challenge=weekly,
         plays_this_app=plays_this_app,
@@ -293,69 +308,99 @@ def submit_game(app_id: int):
         flash("Payment already submitted. Discounts are locked.", "error")
         return redirect(url_for("client.application", app_id=app_id))
 
-    game_key = (request.form.get("game_key") or "").strip()
-    score = int(request.form.get("score") or 0)
-
-    # Fair play checks
-    flagged, reason = should_flag_score(app_row, game_key, score)
+    submitted = _submitted_score()
+    if submitted is None:
+        flash("Invalid game score.", "error")
+        return redirect(url_for("client.games", app_id=app_id))
+    result = _record_game_score(app_row, *submitted)
 
-    earned = _compute_game_discount(game_key, score)
+    if result.weekly_bonus_awarded:
+        flash("Weekly Challenge complete! Bonus +1% added.", "success")
+    for badge in result.new_badges:
+        flash(f"Badge unlocked: {badge.icon} {badge.title}", "success")
+    for category, message in _score_messages(result):
+        flash(message, category)
 
-    if flagged:
-        earned = 0
+    return redirect(url_for("client.games", app_id=app_id))
 
-    # Apply earned discount with cap
-    before = app_row.total_discount_pct
-    app_row.games_discount_pct = min(70, (app_row.games_discount_pct or 0) + earned)
 
-    update_user_game_stat(current_user.id, game_key.lower(), score)
-    record_activity_day(current_user.id)
+@bp.post("/application/<int:app_id>/games/submit.json")
+@login_required
+def submit_game_json(app_id: int):
+    """JSON variant of submit_game so the games page can update in place."""
+    if current_user.is_admin:
+        return jsonify({"ok": False, "error": "admin"}), 403
 
-    score_row = GameScore(
-        application_id=app_row.id,
-        game_key=game_key,
-        score=score,
-        earned_discount_pct=earned,
-        is_flagged=bool(flagged),
-        flag_reason=reason,
+    app_row = Application.query.filter_by(id=app_id, user_id=current_user.id).first_or_404()
+    if app_row.discounts_locked:
+        return jsonify({"ok": False, "error": "locked", "message": "Payment already submitted. Discounts are locked."}), 409
+
+    submitted = _submitted_score()
+    if submitted is None:
+        return jsonify({"ok": False, "error": "invalid", "message": "Invalid game score."}), 400
+    result = _record_game_score(app_row, *submitted)
+    weekly = result.weekly_challenge
+    return jsonify(
+        {
+            "ok": True,
+            "flagged": result.flagged,
+            "earned_pct": result.earned_pct,
+            "total_discount_pct": result.total_after,
+            "games_discount_pct": app_row.games_discount_pct,
+            "bonus_discount_pct": app_row.bonus_discount_pct,
+            "new_badges": [{"key": b.key, "icon": b.icon, "title": b.title} for b in result.new_badges],
+            "weekly_challenge": {
+                "title": weekly.title,
+                "progress": weekly.progress,
+                "target": weekly.target,
+                "complete": weekly.complete,
+                "awarded": weekly.awarded,
+                "bonus_awarded_now": result.weekly_bonus_awarded,
+            },
+            "messages": [{"category": c, "text": m} for c, m in _score_messages(result)],
+        }
     )
-    db.session.add(score_row)
-
-    # Make pending inserts visible to subsequent queries.
-    db.session.flush()
 
-    # Weekly challenge bonus
-    if maybe_award_weekly_bonus(app_row):
-        flash("Weekly Challenge complete! Bonus +1% added.", "success")
 
-    # Badges
-    from ..engagement import award_badge_once
-
-    unlocked_any = False
-    for key, icon, title in badge_rules_after_game(current_user.id):
-        if award_badge_once(current_user.id, key, title=title, icon=icon):
-            flash(f"Badge unlocked: {icon} {title}", "success")
-            unlocked_any = True
+def _submitted_score() -> tuple[str, int] | None:
+    """(game_key, score) from the submit form, or None when either is missing or malformed."""
+    game_key = (request.form.get("game_key") or "").strip()
+    try:
+        score = int(request.form.get("score") or 0)
+    except ValueError:
+        return None
+    if not game_key or len(game_key) > 50:  # GameScore.game_key is String(50)
+        return None
+    return game_key, score
 
-    for key, icon, title in maybe_award_discount_badges(current_user.id, app_row):
-        if award_badge_once(current_user.id, key, title=title, icon=icon):
-            flash(f"Badge unlocked: {icon} {title}", "success")
-            unlocked_any = True
 
+def _record_game_score(app_row: Application, game_key: str, score: int) -> GameSubmissionResult:
+    result = GameSubmission(app_row, current_user.id, game_key, score).apply()
     db.session.commit()
-
-    after = app_row.total_discount_pct
-    if flagged:
-        flash("Score submitted for review (fair play check). Discount not applied.", "info")
+    if result.total_after != result.total_before:
+        # Games discount or weekly bonus moved this application on the leaderboard.
+        invalidate_discounts(app_row.class_fee_id)
+    stat_key = result.score_row.game_key.lower()
+    if result.new_best:
+        invalidate_game_scores(stat_key)
+    if result.new_weekly_best:
+        invalidate_game_scores(stat_key, result.weekly_challenge.week_key)
+    return result
+
+
+def _score_messages(result: GameSubmissionResult) -> list[tuple[str, str]]:
+    game_key = result.score_row.game_key
+    earned, after = result.earned_pct, result.total_after
+    if result.flagged:
+        messages = [("info", "Score submitted for review (fair play check). Discount not applied.")]
     elif earned > 0:
-        flash(f"You earned +{earned}% discount from {game_key}. Total discount: {after}%.", "success")
+        messages = [("success", f"You earned +{earned}% discount from {game_key}. Total discount: {after}%.")]
     else:
-        flash(f"Score submitted for {game_key}. Total discount: {after}%.", "info")
+        messages = [("info", f"Score submitted for {game_key}. Total discount: {after}%.")]
 
-    if after == before and earned > 0:
-        flash("Discount cap reached (70%).", "info")
-
-    return redirect(url_for("client.games", app_id=app_id))
+    if after == result.total_before and earned > 0:
+        messages.append(("info", "Discount cap reached (70%)."))
+    return messages
 
 
 @bp.get("/leaderboard")
@@ -365,93 +410,52 @@ def leaderboard():
     if r:
         return r
 
-    class_fees = ClassFee.query.order_by(ClassFee.class_name.asc()).all()
+    class_fees = class_fee_options()
     class_fee_id = request.args.get("class_fee_id")
     selected_fee = None
-    query = Application.query
     if class_fee_id:
         try:
             fee_id_int = int(class_fee_id)
-            selected_fee = db.session.get(ClassFee, fee_id_int)
-            if selected_fee:
-                query = query.filter(Application.class_fee_id == fee_id_int)
+            selected_fee = next((fee for fee in class_fees if fee["id"] == fee_id_int), None)
         except ValueError:
             selected_fee = None
 
-    apps = query.order_by(
-        (Application.spin_discount_pct + Application.games_discount_pct + Application.bonus_discount_pct).desc(),
-        Application.created_at.asc(),
-    ).limit(10).all()
-
-    leaderboard_rows = []
-    for a in apps:
-        # Privacy-safe label
-        leaderboard_rows.append(
-            {
-                "label": f"Student #A{a.id:04d}",
-                "class_name": a.class_fee.class_name,
-                "discount": a.total_discount_pct,
-            }
-        )
+    leaderboard_rows = top_discounts(selected_fee["id"] if selected_fee else None)
 
     return render_template(
         "client/leaderboard.html",
         class_fees=class_fees,
         selected_fee=selected_fee,
         rows=leaderboard_rows,
+        my_ranks=ranks_for_user(current_user.id),
     )
 
 
-def _compute_game_discount(game_key: str, score: int) -> int:
-    # Keep this intentionally simple & deterministic.
-    game_key = game_key.lower()
-
-    rules = {
-        "click_rush": [(50, 1), (100, 2), (160, 3), (220, 4), (280, 5)],
-        "reaction": [(900, 1), (700, 2), (550, 3), (450, 4), (350, 5)],  # lower is better (ms)
-        "memory": [(3, 1), (5, 2), (7, 3), (9, 4), (11, 5)],
-        "quiz": [(3, 1), (5, 2), (7, 3), (9, 4), (10, 5)],
-        "lucky_number": [(30, 1), (45, 2), (60, 3), (75, 4), (90, 5)],
-        "keymaster": [(20, 1), (35, 2), (50, 3), (65, 4), (80, 5)],
-        "math_sprint": [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)],
-        "coin_flip": [(4, 1), (6, 2), (7, 3), (8, 4), (9, 5)],
-        "slider": [(60, 1), (70, 2), (80, 3), (90, 4), (97, 5)],
-        "word_scramble": [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)],
-        "timing_tap": [(3, 1), (5, 2), (6, 3), (8, 4), (9, 5)],
-        "color_match": [(3, 1), (4, 2), (5, 3), (6, 4), (7, 5)],
-        "pattern_memory": [(10, 1), (20, 2), (30, 3), (40, 4), (50, 5)],
-        "catch_falling": [(10, 1), (20, 2), (30, 3), (40, 4), (50, 5)],
-        "number_guess": [(30, 1), (40, 2), (50, 3), (60, 4), (70, 5)],
-        # New games
-        "emoji_roulette": [(10, 1), (20, 2), (30, 3), (50, 4), (70, 5)],
-        "truth_or_dare": [(20, 1), (35, 2), (50, 3), (60, 4), (75, 5)],
-        "would_you_rather": [(10, 1), (20, 2), (30, 3), (40, 4), (50, 5)],
-        "pickup_line": [(15, 1), (30, 2), (45, 3), (55, 4), (70, 5)],
-        "dad_joke": [(15, 1), (25, 2), (40, 3), (55, 4), (70, 5)],
-        "hot_take": [(20, 1), (35, 2), (50, 3), (65, 4), (80, 5)],
-        "drunk_walk": [(50, 1), (100, 2), (200, 3), (400, 4), (600, 5)],
-        "speed_typer": [(20, 1), (40, 2), (60, 3), (80, 4), (100, 5)],
-        "flirty_dice": [(12, 1), (24, 2), (36, 3), (48, 4), (60, 5)],
-        "meme_caption": [(15, 1), (30, 2), (45, 3), (55, 4), (70, 5)],
-        # Adults Only games
-        "roast_master": [(10, 1), (25, 2), (45, 3), (65, 4), (80, 5)],
-        "nsfw_trivia": [(15, 1), (30, 2), (45, 3), (60, 4), (75, 5)],
-        "awkward_confess": [(15, 1), (30, 2), (50, 3), (65, 4), (80, 5)],
-        "dirty_mind": [(20, 1), (35, 2), (50, 3), (60, 4), (75, 5)],
-        "booty_shake": [(20, 1), (40, 2), (60, 3), (75, 4), (90, 5)],
-        "savage_comeback": [(20, 1), (40, 2), (55, 3), (70, 4), (85, 5)],
-        "never_have_i": [(20, 1), (35, 2), (50, 3), (65, 4), (80, 5)],
-        "cursed_compliment": [(20, 1), (40, 2), (55, 3), (70, 4), (90, 5)],
-        # High-Graphics 18+ Canvas Games
-        "strip_pong": [(20, 1), (40, 2), (60, 3), (80, 4), (100, 5)],
-        "naughty_snake": [(10, 1), (30, 2), (50, 3), (80, 4), (120, 5)],
-        "kiss_catcher": [(30, 1), (60, 2), (100, 3), (150, 4), (200, 5)],
-        "spank_mole": [(20, 1), (40, 2), (60, 3), (80, 4), (120, 5)],
-        "body_shots": [(20, 1), (50, 2), (80, 3), (120, 4), (180, 5)],
-        "twerk_runner": [(15, 1), (30, 2), (50, 3), (80, 4), (120, 5)],
-        "strip_poker": [(20, 1), (40, 2), (50, 3), (70, 4), (90, 5)],
-        "naughty_blocks": [(100, 1), (250, 2), (500, 3), (800, 4), (1200, 5)],
-    }
+@bp.get("/leaderboard/games")
+@login_required
+def game_leaderboard():
+    r = _require_client()
+    if r:
+        return r
+
+    game_keys = sorted(game_registry.all())
+    game_key = (request.args.get("game") or game_keys[0]).lower()
+    if game_key not in game_keys:
+        abort(404)
+
+    period = "week" if request.args.get("period") == "week" else "all"
+    week_key = week_key_for() if period == "week" else None
+    tiers = game_registry.get(game_key)
+
+    return render_template(
+        "client/game_leaderboard.html",
+        game_keys=game_keys,
+        game_key=game_key,
+        period=period,
+        week_key=week_key,
+        lower_is_better=bool(tiers and tiers.lower_is_better),
+        rows=top_game_scores(game_key, week_key),
+    )
 
 
 @bp.get("/profile")
@@ -486,24 +490,6 @@ def profile():
         streak_days=streak_days,
     )
 
-    tiers = rules.get(game_key)
-    if not tiers:
-        return 0
-
-    if game_key == "reaction":
-        # score is ms; award more discount for smaller values
-        earned = 0
-        for max_ms, pct in tiers:
-            if score <= max_ms:
-                earned = pct
-        return int(earned)
-
-    earned = 0
-    for min_score, pct in tiers:
-        if score >= min_score:
-            earned = pct
-    return int(earned)
-
 
 @bp.get("/application/<int:app_id>/chat")
 @login_required
@@ -513,8 +499,19 @@ def chat(app_id: int):
         return r
 
     app_row = Application.query.filter_by(id=app_id, user_id=current_user.id).first_or_404()
-    messages = ChatMessage.query.filter_by(application_id=app_row.id).order_by(ChatMessage.created_at.asc()).all()
-    return render_template("client/chat.html", app=app_row, messages=messages)
+    messages, has_older = recent_messages(app_row.id)
+    mark_read(app_row.id, "client", messages)
+    return render_template("client/chat.html", app=app_row, messages=messages, has_older=has_older)
+
+
+@bp.get("/application/<int:app_id>/chat/messages")
+@login_required
+def chat_messages(app_id: int):
+    if current_user.is_admin:
+        return jsonify({"error": "admin"}), 403
+
+    app_row = Application.query.filter_by(id=app_id, user_id=current_user.id).first_or_404()
+    return jsonify(page_for_args(app_row.id, request.args, reader_role="client"))
 
 
 @bp.post("/application/<int:app_id>/chat")
@@ -526,15 +523,13 @@ def chat_send(app_id: int):
 
     app_row = Application.query.filter_by(id=app_id, user_id=current_user.id).first_or_404()
     text = (request.form.get("message") or "").strip()
+    wants_json = request.accept_mimetypes.best == "application/json"
     if not text:
+        if wants_json:
+            return jsonify({"ok": False, "error": "empty"}), 400
         return redirect(url_for("client.chat", app_id=app_id))
 
-    msg = ChatMessage(
-        application_id=app_row.id,
-        sender_role="client",
-        sender_name=current_user.name,
-        message=text,
-    )
-    db.session.add(msg)
-    db.session.commit()
+    msg = post_message(app_row.id, sender_role="client", sender_name=current_user.name, text=text)
+    if wants_json:
+        return jsonify({"ok": True, "message": message_json(msg)})
     return redirect(url_for("client.chat", app_id=app_id))
@@ -3,8 +3,28 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 
-from .extensions import db
-from .models import Application, BadgeAward, GameScore, UserActivityDay, UserGameStat
+from .activity import streak_stats, with_day
+from .badges import BadgeRule, award_earned_badges, held_badge_keys
+from .batching import iter_user_id_chunks
+from .extensions import db, submission_limiter
+from .games import compute_game_discount, game_registry
+from .models import (
+    Application,
+    GameScore,
+    UserActivityDay,
+    UserActivityYear,
+    UserGameStat,
+    UserStreak,
+    WeeklyChallengeProgress,
+    WeeklyGameBest,
+)
+from .upserts import (
+    bump_weekly_progress,
+    insert_activity_day,
+    merge_activity_bits,
+    upsert_game_stat,
+    upsert_weekly_best,
+)
 
 
 @dataclass(frozen=True)
@@ -27,123 +47,228 @@ def week_key_for(d: date | None = None) -> str:
 
 def record_activity_day(user_id: int, *, day: date | None = None) -> None:
     day = day or date.today()
-    existing = UserActivityDay.query.filter_by(user_id=user_id, day=day).first()
-    if existing:
+    streak = db.session.get(UserStreak, user_id)
+    if streak and streak.last_active_day == day:
+        # Already counted: the common case costs a single primary-key read.
         return
-    row = UserActivityDay()
-    row.user_id = user_id
-    row.day = day
-    db.session.add(row)
+
+    # Only the request that actually inserts the day advances the streak,
+    # so concurrent submits cannot double count or collide on the streak row.
+    if not insert_activity_day(user_id, day):
+        return
+    if streak is None:
+        streak = UserStreak(user_id=user_id, current_streak=0, longest_streak=0)
+        db.session.add(streak)
+    advance_streak(streak, day)
+
+
+def advance_streak(streak: UserStreak, day: date) -> None:
+    # O(1) update: extend the run if `day` follows the last active day, otherwise restart it.
+    last = streak.last_active_day
+    if last is not None and day <= last:
+        return
+    if last is not None and day - last == timedelta(days=1):
+        streak.current_streak = int(streak.current_streak or 0) + 1
+    else:
+        streak.current_streak = 1
+    streak.longest_streak = max(int(streak.longest_streak or 0), streak.current_streak)
+    streak.last_active_day = day
+    streak.updated_at = datetime.utcnow()
 
 
 def compute_streak_days(user_id: int, *, today: date | None = None) -> int:
     today = today or date.today()
 
-    # Pull the last ~40 days of activity and compute consecutive streak.
-    window_start = today - timedelta(days=40)
-    days = (
-        UserActivityDay.query.filter(
-            UserActivityDay.user_id == user_id,
-            UserActivityDay.day >= window_start,
-            UserActivityDay.day <= today,
+    # A streak only counts while it includes today.
+    streak = db.session.get(UserStreak, user_id)
+    if not streak or streak.last_active_day != today:
+        return 0
+    return int(streak.current_streak or 0)
+
+
+def rebuild_streaks(*, chunk_size: int = 1000) -> int:
+    """Recompute user_streak from the activity bitmaps. Returns the number of users with activity.
+
+    Legacy user_activity_day rows are folded into the bitmaps first (as
+    migrate-activity does), so running this before that cannot wipe streaks.
+    """
+    rebuilt = 0
+    for user_ids in iter_user_id_chunks(chunk_size):
+        _fold_activity_rows(user_ids)
+        # One bitmap row per user-year; runs are found with bit scans, not per-day rows.
+        bitmaps: dict[int, dict[int, bytes]] = {}
+        rows = db.session.query(UserActivityYear.user_id, UserActivityYear.year, UserActivityYear.days).filter(
+            UserActivityYear.user_id.in_(user_ids)
         )
-        .order_by(UserActivityDay.day.desc())
-        .all()
+        for uid, year, bits in rows:
+            bitmaps.setdefault(uid, {})[year] = bits
+
+        UserStreak.query.filter(UserStreak.user_id.in_(user_ids)).delete(synchronize_session=False)
+        for uid, years in bitmaps.items():
+            current, longest, last_day = streak_stats(years)
+            if last_day is None:
+                continue
+            db.session.add(
+                UserStreak(
+                    user_id=uid,
+                    current_streak=current,
+                    longest_streak=longest,
+                    last_active_day=last_day,
+                    updated_at=datetime.utcnow(),
+                )
+            )
+            rebuilt += 1
+        db.session.commit()
+
+    return rebuilt
+
+
+def migrate_activity_rows(*, chunk_size: int = 1000, delete_rows: bool = False) -> int:
+    """Fold legacy user_activity_day rows into user_activity_year bitmaps. Returns rows folded.
+
+    Idempotent (bits are OR-ed in) and committed per chunk of users, so it can be
+    re-run or interrupted. With `delete_rows`, each chunk's rows are removed once folded.
+    """
+    folded = 0
+    for user_ids in iter_user_id_chunks(chunk_size):
+        chunk = _fold_activity_rows(user_ids)
+        if delete_rows and chunk:
+            UserActivityDay.query.filter(UserActivityDay.user_id.in_(user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        folded += chunk
+
+    return folded
+
+
+def _fold_activity_rows(user_ids: list[int]) -> int:
+    """OR these users' user_activity_day rows into their bitmaps. Returns rows read; the caller commits."""
+    merged: dict[tuple[int, int], bytes] = {}
+    folded = 0
+    rows = db.session.query(UserActivityDay.user_id, UserActivityDay.day).filter(UserActivityDay.user_id.in_(user_ids))
+    for uid, day in rows:
+        merged[uid, day.year] = with_day(merged.get((uid, day.year), b""), day)
+        folded += 1
+    for (uid, year), bits in merged.items():
+        merge_activity_bits(uid, year, bits)
+    return folded
+
+
+def _challenge_spec(today: date) -> tuple[str, str, int, int]:
+    # Rotate between a few simple challenges based on the ISO week: (key, title, target, reward).
+    _, iso_week, _ = today.isocalendar()
+    if iso_week % 2 == 0:
+        return "play_5_games", "Weekly Challenge: Play 5 games", 5, 1
+    return "play_3_unique", "Weekly Challenge: Play 3 different games", 3, 1
+
+
+def _build_weekly_challenge(app_row: Application, today: date, *, plays: int, unique_games: int) -> WeeklyChallenge:
+    key, title, target, reward = _challenge_spec(today)
+    wk = week_key_for(today)
+    progress = plays if key == "play_5_games" else unique_games
+    awarded = (app_row.bonus_week_key == wk) and (int(app_row.bonus_discount_pct or 0) > 0)
+    return WeeklyChallenge(
+        key=key,
+        title=title,
+        target=target,
+        progress=progress,
+        reward_pct=reward,
+        complete=progress >= target,
+        week_key=wk,
+        awarded=awarded,
     )
-    day_set = {row.day for row in days}
-
-    streak = 0
-    cursor = today
-    while cursor in day_set:
-        streak += 1
-        cursor = cursor - timedelta(days=1)
-
-    return streak
-
-
-def award_badge_once(user_id: int, badge_key: str, *, title: str, icon: str) -> bool:
-    existing = BadgeAward.query.filter_by(user_id=user_id, badge_key=badge_key).first()
-    if existing:
-        return False
-    row = BadgeAward()
-    row.user_id = user_id
-    row.badge_key = badge_key
-    row.title = title
-    row.icon = icon
-    db.session.add(row)
-    return True
-
-
-def update_user_game_stat(user_id: int, game_key: str, score: int) -> None:
-    row = UserGameStat.query.filter_by(user_id=user_id, game_key=game_key).first()
-    now = datetime.utcnow()
-    if not row:
-        row = UserGameStat()
-        row.user_id = user_id
-        row.game_key = game_key
-        row.plays_count = 0
-        db.session.add(row)
-
-    row.plays_count = int(row.plays_count or 0) + 1
-    if row.best_score is None or score > int(row.best_score):
-        row.best_score = score
-        row.best_at = now
-    row.updated_at = now
 
 
 def weekly_challenge_for_application(app_row: Application) -> WeeklyChallenge:
-    # Rotate between a few simple challenges based on the ISO week.
     today = date.today()
-    wk = week_key_for(today)
+    progress = db.session.get(WeeklyChallengeProgress, (app_row.id, week_key_for(today)))
+    plays = int(progress.plays_count) if progress else 0
+    unique_games = int(progress.unique_games) if progress else 0
+    return _build_weekly_challenge(app_row, today, plays=plays, unique_games=unique_games)
 
-    iso_year, iso_week, _ = today.isocalendar()
-    rotation = iso_week % 2
 
-    start = today - timedelta(days=today.weekday())  # Monday
+def week_bounds(week_key: str) -> tuple[datetime, datetime]:
+    # "2026-W06" -> [Monday 00:00, next Monday 00:00)
+    year, week = week_key.split("-W")
+    start = date.fromisocalendar(int(year), int(week), 1)
     start_dt = datetime.combine(start, datetime.min.time())
+    return start_dt, start_dt + timedelta(days=7)
+
+
+def rebuild_weekly_progress(week_key: str, *, application_ids: list[int] | None = None) -> int:
+    """Recompute weekly_challenge_progress for one week from game_score. Returns rows written."""
+    start_dt, end_dt = week_bounds(week_key)
+    query = (
+        db.session.query(GameScore.application_id, GameScore.game_key, db.func.count(GameScore.id))
+        .filter(
+            GameScore.created_at >= start_dt,
+            GameScore.created_at < end_dt,
+            GameScore.is_flagged.is_(False),
+        )
+        .group_by(GameScore.application_id, GameScore.game_key)
+    )
+    existing = WeeklyChallengeProgress.query.filter(WeeklyChallengeProgress.week_key == week_key)
+    if application_ids is not None:
+        query = query.filter(GameScore.application_id.in_(application_ids))
+        existing = existing.filter(WeeklyChallengeProgress.application_id.in_(application_ids))
 
-    if rotation == 0:
-        key = "play_5_games"
-        title = "Weekly Challenge: Play 5 games"
-        target = 5
-        progress = (
-            GameScore.query.filter(
-                GameScore.application_id == app_row.id,
-                GameScore.created_at >= start_dt,
-                GameScore.is_flagged.is_(False),
-            ).count()
+    rows: dict[int, WeeklyChallengeProgress] = {}
+    now = datetime.utcnow()
+    for app_id, game_key, plays in query.all():
+        row = rows.get(app_id)
+        if row is None:
+            row = rows[app_id] = WeeklyChallengeProgress(
+                application_id=app_id,
+                week_key=week_key,
+                plays_count=0,
+                unique_games=0,
+                game_keys=",",
+                updated_at=now,
+            )
+        row.plays_count += int(plays)
+        token = game_key.replace(",", "")
+        if f",{token}," not in row.game_keys:
+            row.unique_games += 1
+            row.game_keys += token + ","
+
+    existing.delete(synchronize_session=False)
+    db.session.add_all(rows.values())
+    db.session.commit()
+    return len(rows)
+
+
+def rebuild_weekly_game_best(week_key: str) -> int:
+    """Recompute weekly_game_best for one week from game_score. Returns rows written."""
+    start_dt, end_dt = week_bounds(week_key)
+    query = (
+        db.session.query(
+            Application.user_id,
+            db.func.lower(GameScore.game_key),
+            db.func.min(GameScore.score),
+            db.func.max(GameScore.score),
+            db.func.max(GameScore.created_at),
         )
-        reward = 1
-    else:
-        key = "play_3_unique"
-        title = "Weekly Challenge: Play 3 different games"
-        target = 3
-        game_keys = (
-            db.session.query(GameScore.game_key)
-            .filter(GameScore.application_id == app_row.id, GameScore.created_at >= start_dt)
-            .filter(GameScore.is_flagged.is_(False))
-            .distinct()
-            .all()
+        .join(Application, Application.id == GameScore.application_id)
+        .filter(
+            GameScore.created_at >= start_dt,
+            GameScore.created_at < end_dt,
+            GameScore.is_flagged.is_(False),
         )
-        progress = len([k for (k,) in game_keys])
-        reward = 1
-
-    complete = progress >= target
-    awarded = (app_row.bonus_week_key == wk) and (int(app_row.bonus_discount_pct or 0) > 0)
-    return WeeklyChallenge(
-        key=key,
-        title=title,
-        target=target,
-        progress=progress,
-        reward_pct=reward,
-        complete=complete,
-        week_key=wk,
-        awarded=awarded,
+        .group_by(Application.user_id, db.func.lower(GameScore.game_key))
     )
 
+    rows = []
+    for user_id, game_key, low, high, last_at in query.all():
+        tiers = game_registry.get(game_key)
+        best = low if tiers and tiers.lower_is_better else high
+        rows.append(WeeklyGameBest(week_key=week_key, game_key=game_key, user_id=user_id, best_score=best, best_at=last_at))
+
+    WeeklyGameBest.query.filter(WeeklyGameBest.week_key == week_key).delete(synchronize_session=False)
+    db.session.add_all(rows)
+    db.session.commit()
+    return len(rows)
 
-def maybe_award_weekly_bonus(app_row: Application) -> bool:
-    ch = weekly_challenge_for_application(app_row)
+
+def _apply_weekly_bonus(app_row: Application, ch: WeeklyChallenge) -> bool:
     if not ch.complete:
         return False
     if ch.awarded:
@@ -155,46 +280,211 @@ def maybe_award_weekly_bonus(app_row: Application) -> bool:
     return True
 
 
+def award_weekly_bonus(app_row: Application, week_key: str, *, plays: int, unique_games: int) -> bool:
+    """GameSubmission's weekly challenge check for any week, e.g. once flagged plays are cleared.
+
+    bonus_week_key only records the latest week awarded, so earlier weeks are
+    left alone: whether they were awarded cannot be told.
+    """
+    if app_row.bonus_week_key and app_row.bonus_week_key > week_key:
+        return False
+    monday = week_bounds(week_key)[0].date()
+    challenge = _build_weekly_challenge(app_row, monday, plays=plays, unique_games=unique_games)
+    return _apply_weekly_bonus(app_row, challenge)
+
+
+RAPID_SUBMISSION_LIMIT = 20
+FLAG_REASONS = ("negative_score", "score_too_large", "rapid_submissions")
+
+
 def should_flag_score(app_row: Application, game_key: str, score: int) -> tuple[bool, str | None]:
+    # Rapid submissions: 20+ earlier submissions in the last 2 minutes for this application.
+    # Counted by the sliding-window limiter rather than a COUNT over game_score.
+    recent_count = submission_limiter.hit(f"application:{app_row.id}")
+    return _flag_for(score, recent_count)
+
+
+def _flag_for(score: int, recent_count: int) -> tuple[bool, str | None]:
     # Very simple sanity checks to reduce obvious abuse.
     if score < 0:
         return True, "negative_score"
     if score > 100000:
         return True, "score_too_large"
-
-    # Rapid submissions: more than 20 submissions in last 2 minutes for this application.
-    since = datetime.utcnow() - timedelta(seconds=120)
-    recent_count = GameScore.query.filter(
-        GameScore.application_id == app_row.id,
-        GameScore.created_at >= since,
-    ).count()
-    if recent_count >= 20:
+    if recent_count >= RAPID_SUBMISSION_LIMIT:
         return True, "rapid_submissions"
-
     return False, None
 
 
-def badge_rules_after_game(user_id: int) -> list[tuple[str, str, str]]:
-    # Return list of (key, icon, title) badges that should be awarded now.
-    total_plays = UserGameStat.query.filter_by(user_id=user_id).with_entities(db.func.sum(UserGameStat.plays_count)).scalar() or 0
-    badges: list[tuple[str, str, str]] = []
-
-    if total_plays >= 1:
-        badges.append(("first_game", "🎮", "First Game"))
-    if total_plays >= 5:
-        badges.append(("games_5", "⭐", "5 Games Played"))
-    if total_plays >= 10:
-        badges.append(("games_10", "🔥", "10 Games Legend"))
-    if total_plays >= 25:
-        badges.append(("games_25", "👑", "Game Master"))
-
-    return badges
+@dataclass
+class GameSubmissionResult:
+    score_row: GameScore
+    flagged: bool
+    flag_reason: str | None
+    earned_pct: int
+    total_before: int
+    total_after: int
+    weekly_challenge: WeeklyChallenge
+    weekly_bonus_awarded: bool
+    new_badges: list[BadgeRule]
+    new_best: bool  # new all-time best for this user and game
+    new_weekly_best: bool
+
+
+class GameSubmission:
+    """Engagement unit of work for one game score.
+
+    All state needed for stats, streaks, the weekly challenge and badges
+    is read up front in two statements, evaluated in
+    memory, and written back together by `apply()`. The caller commits.
+    """
+
+    def __init__(self, app_row: Application, user_id: int, game_key: str, score: int) -> None:
+        self.app_row = app_row
+        self.user_id = user_id
+        self.game_key = game_key
+        self.stat_key = game_key.lower()
+        self.score = score
+        self.now = datetime.utcnow()
+        self.today = date.today()
+
+    def _load(self) -> None:
+        app_id = self.app_row.id
+        self.week_key = week_key_for(self.today)
+
+        def scalar(query):
+            return query.scalar_subquery()
+
+        def progress(column):
+            return scalar(
+                db.session.query(column).filter(
+                    WeeklyChallengeProgress.application_id == app_id,
+                    WeeklyChallengeProgress.week_key == self.week_key,
+                )
+            )
+
+        row = db.session.query(
+            progress(WeeklyChallengeProgress.plays_count).label("week_plays"),
+            progress(WeeklyChallengeProgress.unique_games).label("week_unique"),
+            progress(WeeklyChallengeProgress.game_keys).label("week_game_keys"),
+            scalar(
+                db.session.query(db.func.sum(UserGameStat.plays_count)).filter(UserGameStat.user_id == self.user_id)
+            ).label("total_plays"),
+            scalar(
+                db.session.query(UserStreak.current_streak).filter(UserStreak.user_id == self.user_id)
+            ).label("streak_current"),
+            scalar(
+                db.session.query(UserStreak.longest_streak).filter(UserStreak.user_id == self.user_id)
+            ).label("streak_longest"),
+            scalar(
+                db.session.query(UserStreak.last_active_day).filter(UserStreak.user_id == self.user_id)
+            ).label("streak_last_day"),
+        ).one()
+        self.state = row
+
+        self.badge_keys = held_badge_keys(self.user_id)
+
+    def apply(self) -> GameSubmissionResult:
+        """Evaluate the submission and write all of its effects."""
+        self._load()
+        st = self.state
+        app_row = self.app_row
+
+        flagged, reason = should_flag_score(app_row, self.game_key, self.score)
+        earned = 0 if flagged else compute_game_discount(self.game_key, self.score)
+
+        before = app_row.total_discount_pct
+        app_row.games_discount_pct = min(70, (app_row.games_discount_pct or 0) + earned)
+
+        score_row = GameScore(
+            application_id=app_row.id,
+            game_key=self.game_key,
+            score=self.score,
+            earned_discount_pct=earned,
+            is_flagged=bool(flagged),
+            flag_reason=reason,
+            review_status="pending" if flagged else None,
+        )
 
+        # Activity day + streak: skip entirely when today is already counted.
+        streak = None
+        if st.streak_current is not None and st.streak_last_day != self.today:
+            streak = UserStreak(
+                user_id=self.user_id,
+                current_streak=int(st.streak_current),
+                longest_streak=int(st.streak_longest or 0),
+                last_active_day=st.streak_last_day,
+            )
+            advance_streak(streak, self.today)
+
+        # Weekly challenge, counting this score if it is not flagged.
+        week_plays = int(st.week_plays or 0)
+        week_unique = int(st.week_unique or 0)
+        if not flagged:
+            week_plays += 1
+            if f",{self.game_key.replace(',', '')}," not in (st.week_game_keys or ""):
+                week_unique += 1
+        weekly = _build_weekly_challenge(app_row, self.today, plays=week_plays, unique_games=week_unique)
+        bonus_awarded = _apply_weekly_bonus(app_row, weekly)
+        if bonus_awarded:
+            weekly = _build_weekly_challenge(app_row, self.today, plays=week_plays, unique_games=week_unique)
+
+        total_plays = int(st.total_plays or 0) + 1
+
+        # Write phase.
+        db.session.add(score_row)
+        db.session.flush()
+        tiers = game_registry.get(self.stat_key)
+        lower_is_better = bool(tiers and tiers.lower_is_better)
+        new_best = upsert_game_stat(
+            self.user_id,
+            self.stat_key,
+            self.score,
+            now=self.now,
+            lower_is_better=lower_is_better,
+            counts_for_best=not flagged,
+        )
+        new_weekly_best = False
+        if not flagged:
+            bump_weekly_progress(app_row.id, self.week_key, self.game_key, now=self.now)
+            new_weekly_best = upsert_weekly_best(
+                self.week_key, self.stat_key, self.user_id, self.score, now=self.now, lower_is_better=lower_is_better
+            )
+        if st.streak_current is None:
+            # No streak state yet; take the careful path once.
+            record_activity_day(self.user_id, day=self.today)
+        elif streak is not None and insert_activity_day(self.user_id, self.today):
+            db.session.execute(
+                db.update(UserStreak)
+                .where(UserStreak.user_id == self.user_id)
+                .values(
+                    current_streak=streak.current_streak,
+                    longest_streak=streak.longest_streak,
+                    last_active_day=streak.last_active_day,
+                    updated_at=streak.updated_at,
+                )
+            )
+
+        # Badges: set difference against the keys loaded above, one batched insert.
+        new_badges = award_earned_badges(
+            self.user_id,
+            {
+                "total_plays": total_plays,
+                "total_discount_pct": app_row.total_discount_pct,
+                "spin_discount_pct": app_row.spin_discount_pct,
+            },
+            held=self.badge_keys,
+        )
 
-def maybe_award_discount_badges(user_id: int, app_row: Application) -> list[tuple[str, str, str]]:
-    badges: list[tuple[str, str, str]] = []
-    if app_row.total_discount_pct >= 50:
-        badges.append(("discount_50", "💎", "Reached 50% Discount"))
-    if app_row.spin_discount_pct >= 30:
-        badges.append(("spin_30", "🎰", "30% Spin Winner"))
-    return badges
+        return GameSubmissionResult(
+            score_row=score_row,
+            flagged=bool(flagged),
+            flag_reason=reason,
+            earned_pct=earned,
+            total_before=before,
+            total_after=app_row.total_discount_pct,
+            weekly_challenge=weekly,
+            weekly_bonus_awarded=bonus_awarded,
+            new_badges=new_badges,
+            new_best=new_best,
+            new_weekly_best=new_weekly_best,
+        )
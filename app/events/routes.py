@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from flask_login import current_user, login_required
+
+from ..extensions import db
+from ..notifications import event_stream, latest_event_id, stream_slots
+
+bp = Blueprint("events", __name__, url_prefix="/events")
+
+
+@bp.get("/stream")
+@login_required
+def stream():
+    """Server-Sent Events for the logged-in user: chat, badges and announcements."""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if not stream_slots.acquire(int(current_app.config["SSE_MAX_STREAMS_PER_WORKER"])):
+        # Worker is full: tell EventSource to come back later instead of holding a thread.
+        retry_ms = int(current_app.config["SSE_BUSY_RETRY_MS"])
+        return Response(f"retry: {retry_ms}\n: busy\n\n", mimetype="text/event-stream", headers=headers)
+
+    try:
+        try:
+            last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0)
+        except ValueError:
+            last_id = 0
+        if last_id <= 0:
+            # Fresh connection: only events from now on, the page itself is already up to date.
+            last_id = latest_event_id()
+        user_id, is_admin = current_user.id, bool(current_user.is_admin)
+        # event_stream polls on its own short-lived connections; hand the one the
+        # login check and latest_event_id used back to the pool instead of holding
+        # it idle-in-transaction for the life of the stream.
+        db.session.remove()
+        response = Response(
+            stream_with_context(event_stream(user_id, is_admin, last_id)), mimetype="text/event-stream", headers=headers
+        )
+    except Exception:
+        stream_slots.release()
+        raise
+    # Runs when the server closes the response, including when the client goes
+    # away before the first chunk and the generator never starts.
+    response.call_on_close(stream_slots.release)
+    return response
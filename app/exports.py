@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import csv
+import io
+import zlib
+from collections.abc import Iterable, Iterator
+from datetime import date
+
+from .extensions import db
+
+
+EXPORT_BATCH = 1000
+
+
+def parse_date_arg(value: str | None) -> date | None:
+    """YYYY-MM-DD from a query string; None when missing or malformed."""
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def stream_rows(stmt, *, batch_size: int = EXPORT_BATCH) -> Iterator[tuple]:
+    """Rows of `stmt` through a server-side cursor (yield_per implies stream_results).
+
+    Only `batch_size` rows are buffered at a time, however many match. Uses its own
+    connection from the engine bound here, so the rows can still be read by a
+    streamed response after the request (and its app context) has ended.
+    """
+    engine = db.engine
+
+    def rows() -> Iterator[tuple]:
+        with engine.connect() as conn:
+            result = conn.execution_options(yield_per=batch_size).execute(stmt)
+            for partition in result.partitions():
+                yield from partition
+
+    return rows()
+
+
+# A spreadsheet treats a cell starting with one of these as a formula.
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_safe(value):
+    """Quote a user-supplied string so a spreadsheet shows it as text rather than running it."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(header: Iterable[str], rows: Iterable[tuple], *, batch_size: int = EXPORT_BATCH) -> Iterator[str]:
+    """CSV text for a header and rows, `batch_size` rows per chunk. String cells go through csv_safe."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([csv_safe(value) for value in row])
+        if i % batch_size == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Gzip a text stream as it is produced; the output is one .gz member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # | 16: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -6,6 +6,8 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import CSRFProtect
 
+from .ratelimit import SubmissionRateLimiter
+
 
 db = SQLAlchemy()
 login_manager = LoginManager()
@@ -13,3 +15,5 @@ login_manager.login_view = "auth.login"
 csrf = CSRFProtect()
 migrate = Migrate()
 mail = Mail()
+# Rapid game submissions per application: sliding 2-minute window.
+submission_limiter = SubmissionRateLimiter(window_seconds=120)
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import and_, case, or_, update
+from sqlalchemy.orm import joinedload
+from werkzeug.datastructures import MultiDict
+
+from .badges import award_earned_badges
+from .engagement import FLAG_REASONS, award_weekly_bonus, week_key_for
+from .extensions import db
+from .games import compute_game_discount, game_registry
+from .models import Application, BadgeAward, GameScore, ScoreAnomaly, WeeklyChallengeProgress, total_discount_sql
+from .upserts import add_weekly_plays, upsert_game_bests, upsert_weekly_bests
+
+
+PAGE_SIZE = 50
+MAX_BATCH = 500
+REVIEW_STATUSES = ("pending", "confirmed", "cleared")
+MAX_GAMES_DISCOUNT_PCT = 70  # same cap as GameSubmission.apply
+# Written by `flask fair-play analyze` (app/score_analysis.py).
+FINDING_KINDS = {
+    "outlier": "Score outliers",
+    "timing": "Impossible timing",
+    "threshold": "Threshold hunting",
+}
+
+
+@dataclass(frozen=True)
+class FlagFilters:
+    status: str = "pending"
+    reason: str | None = None
+    game_key: str | None = None
+
+    @classmethod
+    def from_args(cls, args: MultiDict) -> FlagFilters:
+        status = args.get("status")
+        reason = args.get("reason")
+        return cls(
+            status=status if status in REVIEW_STATUSES else "pending",
+            reason=reason if reason in FLAG_REASONS else None,
+            game_key=(args.get("game") or "").strip().lower() or None,
+        )
+
+    def as_args(self) -> dict:
+        """Query-string form, for links that keep the current filters."""
+        return {
+            "status": None if self.status == "pending" else self.status,
+            "reason": self.reason,
+            "game": self.game_key,
+        }
+
+    @property
+    def active(self) -> bool:
+        return self.reason is not None or self.game_key is not None
+
+
+def flag_page(
+    filters: FlagFilters, *, before_id: int | None = None, limit: int = PAGE_SIZE
+) -> tuple[list[GameScore], int | None]:
+    """Review queue, newest first, keyset-paginated on (created_at, id).
+
+    The application, its user and class are loaded in the same query. Returns
+    (rows, before_id for the next page or None).
+    """
+    query = GameScore.query.options(
+        joinedload(GameScore.application).joinedload(Application.user),
+        joinedload(GameScore.application).joinedload(Application.class_fee),
+        joinedload(GameScore.reviewed_by),
+    ).filter(GameScore.review_status == filters.status)
+    if filters.reason:
+        query = query.filter(GameScore.flag_reason == filters.reason)
+    if filters.game_key:
+        query = query.filter(GameScore.game_key == filters.game_key)
+
+    if before_id is not None:
+        anchor = db.session.query(GameScore.created_at).filter(GameScore.id == before_id).scalar()
+        if anchor is not None:
+            query = query.filter(
+                or_(
+                    GameScore.created_at < anchor,
+                    and_(GameScore.created_at == anchor, GameScore.id < before_id),
+                )
+            )
+
+    # One extra row tells us whether there is another page without a COUNT.
+    rows = query.order_by(GameScore.created_at.desc(), GameScore.id.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if more else None)
+
+
+@dataclass(frozen=True)
+class ReviewResult:
+    score_ids: tuple[int, ...] = ()  # the scores this call actually reviewed
+    credited_pct: int = 0  # discount points the cleared scores earned (before the per-application cap)
+    applications: int = 0  # applications that received a credit
+    locked: int = 0  # cleared scores whose application had already paid (no credit)
+    bonuses: int = 0  # applications whose weekly challenge the cleared plays completed
+    class_fee_ids: tuple[int, ...] = ()  # classes whose discount leaderboard changed
+    game_boards: tuple[tuple[str, str | None], ...] = ()  # (game_key, week_key or None) boards with a new best
+
+    @property
+    def reviewed(self) -> int:
+        return len(self.score_ids)
+
+
+def _batch(score_ids) -> list[int]:
+    return sorted({int(i) for i in score_ids})[:MAX_BATCH]
+
+
+def confirm_flags(score_ids, reviewer_id: int, *, now: datetime | None = None) -> ReviewResult:
+    """Mark pending flags as confirmed in one UPDATE. The caller commits."""
+    ids = _batch(score_ids)
+    now = now or datetime.utcnow()
+    while ids:
+        pending = [
+            score_id
+            for (score_id,) in db.session.query(GameScore.id)
+            .filter(GameScore.id.in_(ids), GameScore.review_status == "pending")
+            .order_by(GameScore.id)
+        ]
+        if not pending:
+            break
+        confirmed = db.session.execute(
+            update(GameScore)
+            .where(GameScore.id.in_(pending), GameScore.review_status == "pending")
+            .values(review_status="confirmed", reviewed_by_id=reviewer_id, reviewed_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if confirmed != len(pending):
+            # Another reviewer got to some of them first; read again.
+            db.session.rollback()
+            continue
+        return ReviewResult(score_ids=tuple(pending))
+    return ReviewResult()
+
+
+def clear_flags(score_ids, reviewer_id: int, *, now: datetime | None = None) -> ReviewResult:
+    """Clear pending flags and give each application the discount its scores would have earned.
+
+    One UPDATE clears the scores (recording what each earned under the current
+    tiers) and one UPDATE credits the applications, keeping total_discount_pct
+    in step. Applications that have already paid have their discounts locked, so
+    their scores are cleared without a credit. The cleared scores then count
+    toward bests, weekly challenges (and their bonus) and badges as if they had
+    never been flagged, a few multi-row upserts for the whole batch. The caller commits, then invalidates the leaderboards named in the result.
+    """
+    ids = _batch(score_ids)
+    now = now or datetime.utcnow()
+    while ids:
+        rows = (
+            db.session.query(
+                GameScore.id,
+                GameScore.application_id,
+                GameScore.game_key,
+                GameScore.score,
+                GameScore.created_at,
+                Application.user_id,
+                Application.class_fee_id,
+                Application.payment_method,
+            )
+            .join(Application, Application.id == GameScore.application_id)
+            .filter(GameScore.id.in_(ids), GameScore.review_status == "pending")
+            .order_by(GameScore.created_at, GameScore.id)
+            .all()
+        )
+        if not rows:
+            break
+
+        earned = {r.id: 0 if r.payment_method else compute_game_discount(r.game_key, r.score) for r in rows}
+        credit: Counter = Counter()
+        for r in rows:
+            if earned[r.id]:
+                credit[r.application_id] += earned[r.id]
+
+        # Both UPDATEs re-check the state read above; if another reviewer or a
+        # payment got there first, start over from a fresh read.
+        cleared = db.session.execute(
+            update(GameScore)
+            .where(GameScore.id.in_(earned), GameScore.review_status == "pending")
+            .values(
+                is_flagged=False,
+                review_status="cleared",
+                reviewed_by_id=reviewer_id,
+                reviewed_at=now,
+                earned_discount_pct=case(earned, value=GameScore.id, else_=0),
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if cleared != len(rows):
+            db.session.rollback()
+            continue
+
+        if credit:
+            games = Application.games_discount_pct + case(dict(credit), value=Application.id, else_=0)
+            new_games = case((games > MAX_GAMES_DISCOUNT_PCT, MAX_GAMES_DISCOUNT_PCT), else_=games)
+            credited = db.session.execute(
+                update(Application)
+                .where(Application.id.in_(credit), Application.payment_method.is_(None))
+                .values(
+                    games_discount_pct=new_games,
+                    total_discount_pct=total_discount_sql(
+                        Application.spin_discount_pct, new_games, Application.bonus_discount_pct
+                    ),
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if credited != len(credit):
+                db.session.rollback()
+                continue
+
+        boards, weeks = _count_cleared_scores(rows, now)
+        bonus_apps = _award_weekly_bonuses(weeks)
+        changed = [r for r in rows if r.application_id in credit or r.application_id in bonus_apps]
+        _award_discount_badges({r.user_id for r in changed})
+        return ReviewResult(
+            score_ids=tuple(sorted(earned)),
+            credited_pct=sum(credit.values()),
+            applications=len(credit),
+            locked=sum(1 for r in rows if r.payment_method),
+            bonuses=len(bonus_apps),
+            class_fee_ids=tuple(sorted({r.class_fee_id for r in changed})),
+            game_boards=tuple(sorted(boards, key=lambda board: (board[0], board[1] or ""))),
+        )
+    return ReviewResult()
+
+
+def _keep_best(bests: dict, key: tuple, score: int, at: datetime, lower_is_better: bool) -> None:
+    # Rows arrive oldest first, so on a tie the earliest score keeps the best, as on submission.
+    held = bests.get(key)
+    if held is None or (score < held[0] if lower_is_better else score > held[0]):
+        bests[key] = (score, at)
+
+
+def _count_cleared_scores(rows, now: datetime) -> tuple[set[tuple[str, str | None]], set[tuple[int, str]]]:
+    """Apply what GameSubmission.apply skipped while the scores were flagged, table by table.
+
+    The plays themselves were counted on submission. Now each score can become
+    the user's best (all time and for its week; best_at is when it was played)
+    and counts toward its week's challenge, as rebuild_weekly_progress and
+    rebuild_weekly_game_best would. The rows are grouped per key first, so each
+    table takes one multi-row upsert per scoring direction.
+
+    Returns (the (game_key, week_key or None) boards that got a new best,
+    the (application_id, week_key) challenges that gained plays).
+    """
+    game_bests: dict[bool, dict] = {False: {}, True: {}}  # by lower_is_better
+    weekly_bests: dict[bool, dict] = {False: {}, True: {}}
+    plays: Counter = Counter()
+    for r in rows:
+        stat_key = r.game_key.lower()
+        week_key = week_key_for(r.created_at.date())
+        tiers = game_registry.get(stat_key)
+        lower_is_better = bool(tiers and tiers.lower_is_better)
+        _keep_best(game_bests[lower_is_better], (r.user_id, stat_key), r.score, r.created_at, lower_is_better)
+        _keep_best(
+            weekly_bests[lower_is_better], (week_key, stat_key, r.user_id), r.score, r.created_at, lower_is_better
+        )
+        plays[(r.application_id, week_key, r.game_key)] += 1
+
+    boards: set[tuple[str, str | None]] = set()
+    for lower_is_better in (False, True):
+        for _, game_key in upsert_game_bests(game_bests[lower_is_better], now=now, lower_is_better=lower_is_better):
+            boards.add((game_key, None))
+        weekly = upsert_weekly_bests(weekly_bests[lower_is_better], lower_is_better=lower_is_better)
+        for week_key, game_key, _ in weekly:
+            boards.add((game_key, week_key))
+    add_weekly_plays(plays, now=now)
+    return boards, {(application_id, week_key) for application_id, week_key, _ in plays}
+
+
+def _award_weekly_bonuses(weeks: set[tuple[int, str]]) -> set[int]:
+    """The weekly challenge check GameSubmission runs, for the weeks cleared plays were added to.
+
+    Only unpaid applications, as their discounts are not locked. Returns the
+    ids of applications that received a bonus.
+    """
+    if not weeks:
+        return set()
+    app_ids = {application_id for application_id, _ in weeks}
+    # The UPDATEs above bypassed the session, so refresh anything it already holds.
+    apps = {
+        a.id: a
+        for a in Application.query.populate_existing().filter(
+            Application.id.in_(app_ids), Application.payment_method.is_(None)
+        )
+    }
+    progress = {
+        (p.application_id, p.week_key): p
+        for p in WeeklyChallengeProgress.query.populate_existing().filter(
+            WeeklyChallengeProgress.application_id.in_(app_ids),
+            WeeklyChallengeProgress.week_key.in_({week_key for _, week_key in weeks}),
+        )
+    }
+    awarded = set()
+    for application_id, week_key in sorted(weeks):  # each application's weeks oldest first
+        app_row = apps.get(application_id)
+        row = progress.get((application_id, week_key))
+        if app_row is not None and row is not None and award_weekly_bonus(
+            app_row, week_key, plays=row.plays_count, unique_games=row.unique_games
+        ):
+            awarded.add(application_id)
+    return awarded
+
+
+def _award_discount_badges(user_ids: set[int]) -> None:
+    """Discount badges the credited users now qualify for (two reads, then one insert per user)."""
+    if not user_ids:
+        return
+    held: dict[int, set[str]] = {uid: set() for uid in user_ids}
+    for uid, key in db.session.query(BadgeAward.user_id, BadgeAward.badge_key).filter(BadgeAward.user_id.in_(user_ids)):
+        held[uid].add(key)
+    best = (
+        db.session.query(Application.user_id, db.func.max(Application.total_discount_pct))
+        .filter(Application.user_id.in_(user_ids))
+        .group_by(Application.user_id)
+    )
+    for uid, total_discount in best:
+        award_earned_badges(uid, {"total_discount_pct": int(total_discount or 0)}, held=held[uid])
+
+
+def finding_summary() -> tuple[dict[str, int], datetime | None]:
+    """Findings per kind from the last analyzer run, and when it ran (one query)."""
+    rows = (
+        db.session.query(ScoreAnomaly.kind, db.func.count(), db.func.max(ScoreAnomaly.detected_at))
+        .group_by(ScoreAnomaly.kind)
+        .all()
+    )
+    counts = {kind: 0 for kind in FINDING_KINDS}
+    counts.update({kind: count for kind, count, _ in rows})
+    return counts, max((at for _, _, at in rows), default=None)
+
+
+def findings_for_scores(score_ids: list[int]) -> dict[int, list[ScoreAnomaly]]:
+    """Analyzer findings attached to these scores (one query)."""
+    found: dict[int, list[ScoreAnomaly]] = {}
+    if score_ids:
+        for row in ScoreAnomaly.query.filter(ScoreAnomaly.game_score_id.in_(score_ids)):
+            found.setdefault(row.game_score_id, []).append(row)
+    return found
+
+
+def finding_page(
+    kind: str, *, after_id: int | None = None, limit: int = PAGE_SIZE
+) -> tuple[list[ScoreAnomaly], int | None]:
+    """Findings of one kind, most severe first (the analyzer writes them in that order).
+
+    Returns (rows, after_id for the next page or None).
+    """
+    query = ScoreAnomaly.query.options(
+        joinedload(ScoreAnomaly.user), joinedload(ScoreAnomaly.application).joinedload(Application.class_fee)
+    ).filter(ScoreAnomaly.kind == kind)
+    if after_id is not None:
+        query = query.filter(ScoreAnomaly.id > after_id)
+    rows = query.order_by(ScoreAnomaly.id.asc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if more else None)
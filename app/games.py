@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from .extensions import db
+from .models import GameTierOverride
+
+
+# (threshold, discount pct) pairs per game. For lower-is-better games the
+# threshold is a maximum (e.g. reaction time in ms), otherwise a minimum.
+DEFAULT_TIERS: dict[str, list[tuple[int, int]]] = {
+    "click_rush": [(50, 1), (100, 2), (160, 3), (220, 4), (280, 5)],
+    "reaction": [(900, 1), (700, 2), (550, 3), (450, 4), (350, 5)],  # lower is better (ms)
+    "memory": [(3, 1), (5, 2), (7, 3), (9, 4), (11, 5)],
+    "quiz": [(3, 1), (5, 2), (7, 3), (9, 4), (10, 5)],
+    "lucky_number": [(30, 1), (45, 2), (60, 3), (75, 4), (90, 5)],
+    "keymaster": [(20, 1), (35, 2), (50, 3), (65, 4), (80, 5)],
+    "math_sprint": [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)],
+    "coin_flip": [(4, 1), (6, 2), (7, 3), (8, 4), (9, 5)],
+    "slider": [(60, 1), (70, 2), (80, 3), (90, 4), (97, 5)],
+    "word_scramble": [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)],
+    "timing_tap": [(3, 1), (5, 2), (6, 3), (8, 4), (9, 5)],
+    "color_match": [(3, 1), (4, 2), (5, 3), (6, 4), (7, 5)],
+    "pattern_memory": [(10, 1), (20, 2), (30, 3), (40, 4), (50, 5)],
+    "catch_falling": [(10, 1), (20, 2), (30, 3), (40, 4), (50, 5)],
+    "number_guess": [(30, 1), (40, 2), (50, 3), (60, 4), (70, 5)],
+    # New games
+    "emoji_roulette": [(10, 1), (20, 2), (30, 3), (50, 4), (70, 5)],
+    "truth_or_dare": [(20, 1), (35, 2), (50, 3), (60, 4), (75, 5)],
+    "would_you_rather": [(10, 1), (20, 2), (30, 3), (40, 4), (50, 5)],
+    "pickup_line": [(15, 1), (30, 2), (45, 3), (55, 4), (70, 5)],
+    "dad_joke": [(15, 1), (25, 2), (40, 3), (55, 4), (70, 5)],
+    "hot_take": [(20, 1), (35, 2), (50, 3), (65, 4), (80, 5)],
+    "drunk_walk": [(50, 1), (100, 2), (200, 3), (400, 4), (600, 5)],
+    "speed_typer": [(20, 1), (40, 2), (60, 3), (80, 4), (100, 5)],
+    "flirty_dice": [(12, 1), (24, 2), (36, 3), (48, 4), (60, 5)],
+    "meme_caption": [(15, 1), (30, 2), (45, 3), (55, 4), (70, 5)],
+    # Adults Only games
+    "roast_master": [(10, 1), (25, 2), (45, 3), (65, 4), (80, 5)],
+    "nsfw_trivia": [(15, 1), (30, 2), (45, 3), (60, 4), (75, 5)],
+    "awkward_confess": [(15, 1), (30, 2), (50, 3), (65, 4), (80, 5)],
+    "dirty_mind": [(20, 1), (35, 2), (50, 3), (60, 4), (75, 5)],
+    "booty_shake": [(20, 1), (40, 2), (60, 3), (75, 4), (90, 5)],
+    "savage_comeback": [(20, 1), (40, 2), (55, 3), (70, 4), (85, 5)],
+    "never_have_i": [(20, 1), (35, 2), (50, 3), (65, 4), (80, 5)],
+    "cursed_compliment": [(20, 1), (40, 2), (55, 3), (70, 4), (90, 5)],
+    # High-Graphics 18+ Canvas Games
+    "strip_pong": [(20, 1), (40, 2), (60, 3), (80, 4), (100, 5)],
+    "naughty_snake": [(10, 1), (30, 2), (50, 3), (80, 4), (120, 5)],
+    "kiss_catcher": [(30, 1), (60, 2), (100, 3), (150, 4), (200, 5)],
+    "spank_mole": [(20, 1), (40, 2), (60, 3), (80, 4), (120, 5)],
+    "body_shots": [(20, 1), (50, 2), (80, 3), (120, 4), (180, 5)],
+    "twerk_runner": [(15, 1), (30, 2), (50, 3), (80, 4), (120, 5)],
+    "strip_poker": [(20, 1), (40, 2), (50, 3), (70, 4), (90, 5)],
+    "naughty_blocks": [(100, 1), (250, 2), (500, 3), (800, 4), (1200, 5)],
+}
+
+LOWER_IS_BETTER = frozenset({"reaction"})
+
+
+@dataclass(frozen=True)
+class GameTiers:
+    thresholds: tuple[int, ...]  # ascending
+    pcts: tuple[int, ...]  # discount for the matching threshold
+    lower_is_better: bool = False
+
+    @classmethod
+    def compile(cls, pairs: list[tuple[int, int]], *, lower_is_better: bool = False) -> GameTiers:
+        ordered = sorted(pairs)
+        return cls(
+            thresholds=tuple(int(t) for t, _ in ordered),
+            pcts=tuple(int(p) for _, p in ordered),
+            lower_is_better=lower_is_better,
+        )
+
+    def discount_for(self, score: int) -> int:
+        if self.lower_is_better:
+            # Tightest maximum the score still fits under.
+            idx = bisect_left(self.thresholds, score)
+            return self.pcts[idx] if idx < len(self.thresholds) else 0
+        # Highest minimum the score reaches.
+        idx = bisect_right(self.thresholds, score)
+        return self.pcts[idx - 1] if idx else 0
+
+    def pairs(self) -> list[tuple[int, int]]:
+        pairs = list(zip(self.thresholds, self.pcts))
+        return pairs[::-1] if self.lower_is_better else pairs
+
+
+def parse_tiers(text: str) -> list[tuple[int, int]]:
+    """Parse "50:1, 100:2" into [(50, 1), (100, 2)]. Raises ValueError on bad input."""
+    pairs = []
+    for part in text.replace("\n", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        threshold, _, pct = part.partition(":")
+        pairs.append((int(threshold), int(pct)))
+    if not pairs:
+        raise ValueError("At least one threshold:pct pair is required")
+    if any(pct < 0 or pct > 70 for _, pct in pairs):
+        raise ValueError("Discount per tier must be between 0 and 70")
+    return pairs
+
+
+def format_tiers(tiers: GameTiers) -> str:
+    return ", ".join(f"{t}:{p}" for t, p in tiers.pairs())
+
+
+class GameRegistry:
+    """Compiled tier tables, built once at import, plus admin overrides from the database.
+
+    Overrides are cached in-process under a version number. Other workers
+    notice an admin edit within `ttl_seconds` by comparing a cheap marker
+    (row count + latest updated_at) against the one they last loaded.
+    """
+
+    def __init__(self, defaults: dict[str, GameTiers], *, ttl_seconds: float = 30.0) -> None:
+        self.defaults = defaults
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._overrides: dict[str, GameTiers] = {}
+        self._marker: tuple | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, game_key: str) -> GameTiers | None:
+        self._refresh_if_stale()
+        key = game_key.lower()
+        return self._overrides.get(key) or self.defaults.get(key)
+
+    def discount_for(self, game_key: str, score: int) -> int:
+        tiers = self.get(game_key)
+        return tiers.discount_for(score) if tiers else 0
+
+    def all(self) -> dict[str, GameTiers]:
+        self._refresh_if_stale()
+        return {**self.defaults, **self._overrides}
+
+    def is_overridden(self, game_key: str) -> bool:
+        self._refresh_if_stale()
+        return game_key.lower() in self._overrides
+
+    def invalidate(self) -> None:
+        self._checked_at = 0.0
+        self._marker = None
+
+    def _refresh_if_stale(self) -> None:
+        if time.monotonic() - self._checked_at < self.ttl_seconds:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.ttl_seconds:
+                return
+            try:
+                # Own connection, so a failure never poisons the request's transaction.
+                table = GameTierOverride.__table__
+                with db.engine.connect() as conn:
+                    marker = tuple(conn.execute(db.select(db.func.count(), db.func.max(table.c.updated_at))).one())
+                    if marker != self._marker:
+                        rows = conn.execute(db.select(table.c.game_key, table.c.tiers, table.c.lower_is_better)).all()
+                        self._overrides = {
+                            key: GameTiers.compile(parse_tiers(tiers), lower_is_better=bool(lower))
+                            for key, tiers, lower in rows
+                        }
+                        self._marker = marker
+                        self.version += 1
+            except (SQLAlchemyError, ValueError) as e:
+                # Missing table (not migrated yet) or a bad row: keep serving what we have.
+                current_app.logger.warning("Game tier overrides unavailable: %s", e)
+            self._checked_at = time.monotonic()
+
+
+game_registry = GameRegistry(
+    {
+        key: GameTiers.compile(pairs, lower_is_better=key in LOWER_IS_BETTER)
+        for key, pairs in DEFAULT_TIERS.items()
+    }
+)
+
+
+def compute_game_discount(game_key: str, score: int) -> int:
+    return game_registry.discount_for(game_key, score)
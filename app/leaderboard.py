@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from .cache import SnapshotCache
+from .extensions import db
+from .games import game_registry
+from .models import Application, ClassFee, UserGameStat, WeeklyGameBest
+
+
+TOP_N = 10
+GAME_TOP_N = 20
+ALL_CLASSES = "all"
+
+# Short TTL: other workers see a discount change within this many seconds,
+# the worker that handled the write sees it immediately via invalidate_discounts().
+leaderboard_cache = SnapshotCache(ttl_seconds=15)
+
+
+def class_fee_options() -> list[dict]:
+    return leaderboard_cache.get(
+        "class_fees",
+        lambda: [
+            {"id": fee_id, "class_name": name}
+            for fee_id, name in db.session.query(ClassFee.id, ClassFee.class_name).order_by(ClassFee.class_name.asc())
+        ],
+    )
+
+
+def top_discounts(class_fee_id: int | None = None) -> list[dict]:
+    """Privacy-safe top-N rows for one class (or all classes), served from the snapshot cache."""
+    key = class_fee_id if class_fee_id is not None else ALL_CLASSES
+    return leaderboard_cache.get(key, lambda: _load_top_discounts(class_fee_id))
+
+
+def _load_top_discounts(class_fee_id: int | None) -> list[dict]:
+    # Index range scan on ix_application_(class_)total_discount, class name joined in.
+    query = db.session.query(Application.id, ClassFee.class_name, Application.total_discount_pct).join(
+        ClassFee, ClassFee.id == Application.class_fee_id
+    )
+    if class_fee_id is not None:
+        query = query.filter(Application.class_fee_id == class_fee_id)
+
+    rows = query.order_by(Application.total_discount_pct.desc(), Application.created_at.asc()).limit(TOP_N)
+    return [
+        {"label": f"Student #A{app_id:04d}", "class_name": class_name, "discount": int(discount)}
+        for app_id, class_name, discount in rows
+    ]
+
+
+def invalidate_discounts(class_fee_id: int) -> None:
+    """Call after committing a discount change on an application in `class_fee_id`."""
+    leaderboard_cache.invalidate(class_fee_id, ALL_CLASSES)
+
+
+def top_game_scores(game_key: str, week_key: str | None = None) -> list[dict]:
+    """Top best scores for one game, all time or for one ISO week. Cached until a new best lands."""
+    key = ("game", game_key, week_key)
+    return leaderboard_cache.get(key, lambda: _load_top_game_scores(game_key, week_key))
+
+
+def _load_top_game_scores(game_key: str, week_key: str | None) -> list[dict]:
+    tiers = game_registry.get(game_key)
+    lower_is_better = bool(tiers and tiers.lower_is_better)
+
+    if week_key is None:
+        model = UserGameStat
+        query = db.session.query(UserGameStat.user_id, UserGameStat.best_score).filter(
+            UserGameStat.game_key == game_key, UserGameStat.best_score.is_not(None)
+        )
+    else:
+        model = WeeklyGameBest
+        query = db.session.query(WeeklyGameBest.user_id, WeeklyGameBest.best_score).filter(
+            WeeklyGameBest.week_key == week_key, WeeklyGameBest.game_key == game_key
+        )
+
+    # Range scan on ix_user_game_stat_game_best / ix_weekly_game_best_board from the right end.
+    order = model.best_score.asc() if lower_is_better else model.best_score.desc()
+    rows = query.order_by(order, model.best_at.asc()).limit(GAME_TOP_N)
+    return [
+        {"user_id": user_id, "label": f"Player #U{user_id:04d}", "score": int(score)}
+        for user_id, score in rows
+    ]
+
+
+def invalidate_game_scores(game_key: str, week_key: str | None = None) -> None:
+    """Call after committing a new best for `game_key` (all time, or in `week_key`)."""
+    leaderboard_cache.invalidate(("game", game_key, week_key))
+
+
+def application_count(class_fee_id: int | None = None) -> int:
+    """Applications in one class (or all classes), the percentile denominator. Cached like the boards."""
+    key = ("applications", class_fee_id if class_fee_id is not None else ALL_CLASSES)
+    return leaderboard_cache.get(key, lambda: _count_applications(class_fee_id))
+
+
+def _count_applications(class_fee_id: int | None) -> int:
+    query = db.session.query(db.func.count(Application.id))
+    if class_fee_id is not None:
+        query = query.filter(Application.class_fee_id == class_fee_id)
+    return int(query.scalar() or 0)
+
+
+def ranks_for_user(user_id: int) -> list[dict]:
+    """Global and per-class rank/percentile for each of the user's applications, in one query.
+
+    Rank follows RANK() semantics (ties share a rank) but is computed as
+    1 + COUNT(rows with a higher total). Each count is a range scan on the
+    total-discount indexes, whereas RANK() OVER (...) would have to sort every
+    application, and the COUNT form also works on SQLite builds without window functions.
+    The totals are full counts, so they come from the snapshot cache instead.
+    """
+    other = db.aliased(Application)
+
+    def count(*criteria):
+        return db.session.query(db.func.count(other.id)).filter(*criteria).scalar_subquery()
+
+    rows = (
+        db.session.query(
+            Application.id,
+            Application.class_fee_id,
+            ClassFee.class_name,
+            Application.total_discount_pct,
+            count(other.total_discount_pct > Application.total_discount_pct).label("above"),
+            count(
+                other.class_fee_id == Application.class_fee_id,
+                other.total_discount_pct > Application.total_discount_pct,
+            ).label("class_above"),
+        )
+        .join(ClassFee, ClassFee.id == Application.class_fee_id)
+        .filter(Application.user_id == user_id)
+        .order_by(Application.created_at.desc())
+        .all()
+    )
+    ranks = []
+    for r in rows:
+        # A cached total can briefly trail a new application; never report a rank past it.
+        total = max(application_count(), r.above + 1)
+        class_total = max(application_count(r.class_fee_id), r.class_above + 1)
+        ranks.append(
+            {
+                "label": f"Student #A{r.id:04d}",
+                "class_name": r.class_name,
+                "discount": int(r.total_discount_pct),
+                "rank": r.above + 1,
+                "total": total,
+                "top_pct": _top_pct(r.above + 1, total),
+                "class_rank": r.class_above + 1,
+                "class_total": class_total,
+                "class_top_pct": _top_pct(r.class_above + 1, class_total),
+            }
+        )
+    return ranks
+
+
+def _top_pct(rank: int, total: int) -> int:
+    # "Top N%": rank 1 of 200 is the top 1%, rank 200 of 200 the top 100%.
+    return max(1, -(-100 * rank // total)) if total else 100
@@ -3,11 +3,17 @@ from __future__ import annotations
 from datetime import date, datetime
 
 from flask_login import UserMixin
+from sqlalchemy import case
+from sqlalchemy.orm import validates
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from .extensions import db, login_manager
 
 
+MAX_TOTAL_DISCOUNT_PCT = 70
+DISCOUNT_PARTS = ("spin_discount_pct", "games_discount_pct", "bonus_discount_pct")
+
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
@@ -42,7 +48,7 @@ class ClassFee(db.Model):
 
 class Application(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     class_fee_id = db.Column(db.Integer, db.ForeignKey("class_fee.id"), nullable=False)
 
     status = db.Column(db.String(20), default="pending", nullable=False)  # pending/accepted/rejected
@@ -56,19 +62,20 @@ class Application(db.Model):
     games_discount_pct = db.Column(db.Integer, default=0, nullable=False)  # 0..70
     bonus_discount_pct = db.Column(db.Integer, default=0, nullable=False)  # weekly challenge bonus
     bonus_week_key = db.Column(db.String(12), nullable=True)  # e.g. "2026-W06"
+    # min(70, spin + games + bonus), persisted so the leaderboard can use an index.
+    # Kept in sync by _sync_total_discount; Core UPDATEs must set it via total_discount_sql().
+    total_discount_pct = db.Column(db.Integer, default=0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     user = db.relationship("User", back_populates="applications")
     class_fee = db.relationship("ClassFee")
 
-    @property
-    def total_discount_pct(self) -> int:
-        return min(
-            70,
-            int(self.spin_discount_pct or 0)
-            + int(self.games_discount_pct or 0)
-            + int(self.bonus_discount_pct or 0),
-        )
+    @validates("spin_discount_pct", "games_discount_pct", "bonus_discount_pct")
+    def _sync_total_discount(self, key: str, value: int | None) -> int | None:
+        parts = {part: int(getattr(self, part) or 0) for part in DISCOUNT_PARTS}
+        parts[key] = int(value or 0)
+        self.total_discount_pct = min(MAX_TOTAL_DISCOUNT_PCT, sum(parts.values()))
+        return value
 
     @property
     def fee_amount(self) -> int:
@@ -76,7 +83,7 @@ class Application(db.Model):
 
     @property
     def discounted_amount(self) -> int:
-        return int(round(self.fee_amount * (1 - (self.total_discount_pct / 100.0))))
+        return discounted_amount(self.fee_amount, self.total_discount_pct)
 
     @property
     def can_spin(self) -> bool:
@@ -89,6 +96,41 @@ class Application(db.Model):
         return self.payment_method is not None
 
 
+db.Index(
+    "ix_application_total_discount",
+    Application.total_discount_pct.desc(),
+    Application.created_at,
+)
+db.Index(
+    "ix_application_class_total_discount",
+    Application.class_fee_id,
+    Application.total_discount_pct.desc(),
+    Application.created_at,
+)
+# Payments are rolled up in (paid_at, id) order.
+db.Index("ix_application_paid_at", Application.paid_at, Application.id)
+# Admin application list: newest first, optionally narrowed by status or class.
+db.Index("ix_application_created", Application.created_at, Application.id)
+db.Index("ix_application_status_created", Application.status, Application.created_at, Application.id)
+db.Index("ix_application_class_created", Application.class_fee_id, Application.created_at, Application.id)
+
+
+def discounted_amount(fee_amount: int, total_discount_pct: int) -> int:
+    # Integer half-up rounding, so discounted_amount_sql() gives the same answer in SQL.
+    return (int(fee_amount) * (100 - int(total_discount_pct)) + 50) // 100
+
+
+def discounted_amount_sql(fee_amount, total_discount_pct):
+    """SQL twin of discounted_amount() (integer floor division in SQL as well)."""
+    return (fee_amount * (100 - total_discount_pct) + 50) // 100
+
+
+def total_discount_sql(spin, games, bonus):
+    """SQL expression for the capped total, for UPDATE ... SET total_discount_pct = ..."""
+    total = spin + games + bonus
+    return case((total > MAX_TOTAL_DISCOUNT_PCT, MAX_TOTAL_DISCOUNT_PCT), else_=total)
+
+
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     application_id = db.Column(db.Integer, db.ForeignKey("application.id"), nullable=False, index=True)
@@ -100,6 +142,17 @@ class ChatMessage(db.Model):
 
     application = db.relationship("Application")
 
+    # Keyset paging per conversation: WHERE application_id = ? AND id > / < ?.
+    __table_args__ = (db.Index("ix_chat_message_app_id", "application_id", "id"),)
+
+
+class ChatReadCursor(db.Model):
+    # Highest chat_message.id each side has seen per application ("admin" is shared by all admins).
+    application_id = db.Column(db.Integer, db.ForeignKey("application.id"), primary_key=True)
+    reader_role = db.Column(db.String(20), primary_key=True)  # client/admin
+    last_read_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
 
 class GameScore(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -109,14 +162,57 @@ class GameScore(db.Model):
     earned_discount_pct = db.Column(db.Integer, nullable=False, default=0)
     is_flagged = db.Column(db.Boolean, nullable=False, default=False)
     flag_reason = db.Column(db.Text, nullable=True)
+    # Fair-play review: "pending" when flagged, then "confirmed" or "cleared" by an admin.
+    review_status = db.Column(db.String(20), nullable=True)
+    reviewed_by_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    reviewed_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     application = db.relationship("Application")
+    reviewed_by = db.relationship("User")
+
+    # Flagged scores are rare: partial indexes keep "has a flagged score" probes
+    # and the review queue tiny.
+    __table_args__ = (
+        db.Index(
+            "ix_game_score_flagged_app",
+            "application_id",
+            postgresql_where=db.text("is_flagged"),
+            sqlite_where=db.text("is_flagged = 1"),
+        ),
+        db.Index(
+            "ix_game_score_review",
+            "review_status",
+            "created_at",
+            "id",
+            postgresql_where=db.text("review_status IS NOT NULL"),
+            sqlite_where=db.text("review_status IS NOT NULL"),
+        ),
+    )
+
+
+class ScoreAnomaly(db.Model):
+    # Written by `flask fair-play analyze` (app/score_analysis.py); each run replaces the previous findings.
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # outlier/timing/threshold
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    application_id = db.Column(db.Integer, db.ForeignKey("application.id"), nullable=True)
+    game_score_id = db.Column(db.Integer, db.ForeignKey("game_score.id"), nullable=True, index=True)
+    game_key = db.Column(db.String(50), nullable=True)  # None for findings across all of a user's games
+    value = db.Column(db.Float, nullable=False)  # robust z, seconds since the previous play, or threshold z
+    detail = db.Column(db.String(255), nullable=True)
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    user = db.relationship("User")
+    application = db.relationship("Application")
+
+    # Findings are written most severe first, so (kind, id) is also the display order.
+    __table_args__ = (db.Index("ix_score_anomaly_kind", "kind", "id"),)
 
 
 class AdminAuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    admin_user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    admin_user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     action = db.Column(db.String(80), nullable=False)
     target_type = db.Column(db.String(40), nullable=True)
     target_id = db.Column(db.Integer, nullable=True)
@@ -128,6 +224,20 @@ class AdminAuditLog(db.Model):
     admin = db.relationship("User")
 
 
+# Audit log search: newest first, optionally narrowed by admin, action or target.
+# The admin index also serves the foreign key, replacing the old single-column one.
+db.Index("ix_admin_audit_log_created", AdminAuditLog.created_at, AdminAuditLog.id)
+db.Index("ix_admin_audit_log_admin_created", AdminAuditLog.admin_user_id, AdminAuditLog.created_at, AdminAuditLog.id)
+db.Index("ix_admin_audit_log_action_created", AdminAuditLog.action, AdminAuditLog.created_at, AdminAuditLog.id)
+db.Index(
+    "ix_admin_audit_log_target_created",
+    AdminAuditLog.target_type,
+    AdminAuditLog.target_id,
+    AdminAuditLog.created_at,
+    AdminAuditLog.id,
+)
+
+
 class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
@@ -150,6 +260,8 @@ class BadgeAward(db.Model):
 
 
 class UserActivityDay(db.Model):
+    # Legacy one-row-per-day storage, superseded by UserActivityYear; kept so
+    # `flask engagement migrate-activity` can fold existing rows into bitmaps.
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     day = db.Column(db.Date, nullable=False)
@@ -160,6 +272,13 @@ class UserActivityDay(db.Model):
     __table_args__ = (db.UniqueConstraint("user_id", "day", name="uq_activity_user_day"),)
 
 
+class UserActivityYear(db.Model):
+    # Days the user was active in `year` as a 366-bit bitmap (app/activity.py): one row per user-year.
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    days = db.Column(db.LargeBinary(46), nullable=False)
+
+
 class UserGameStat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
@@ -171,4 +290,78 @@ class UserGameStat(db.Model):
 
     user = db.relationship("User")
 
-    __table_args__ = (db.UniqueConstraint("user_id", "game_key", name="uq_game_stat_user_key"),)
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "game_key", name="uq_game_stat_user_key"),
+        # Per-game top-k (see leaderboard.top_game_scores).
+        db.Index("ix_user_game_stat_game_best", "game_key", "best_score"),
+    )
+
+
+class UserStreak(db.Model):
+    # Incrementally maintained by engagement.record_activity_day (one row per user).
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_active_day = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    user = db.relationship("User")
+
+
+class WeeklyChallengeProgress(db.Model):
+    # Non-flagged plays per application per ISO week, kept incrementally by engagement.
+    application_id = db.Column(db.Integer, db.ForeignKey("application.id"), primary_key=True)
+    week_key = db.Column(db.String(12), primary_key=True)  # e.g. "2026-W06"
+    plays_count = db.Column(db.Integer, nullable=False, default=0)
+    unique_games = db.Column(db.Integer, nullable=False, default=0)
+    game_keys = db.Column(db.Text, nullable=False, default=",")  # delimited set: ",memory,quiz,"
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    application = db.relationship("Application")
+
+
+class WeeklyGameBest(db.Model):
+    # Best non-flagged score per user, game and ISO week, upserted on every submission
+    # so the weekly game leaderboards never GROUP BY game_score.
+    week_key = db.Column(db.String(12), primary_key=True)
+    game_key = db.Column(db.String(50), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    best_score = db.Column(db.Integer, nullable=False)
+    best_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index("ix_weekly_game_best_board", "week_key", "game_key", "best_score"),)
+
+
+class EventNotification(db.Model):
+    # Outbox for the /events SSE stream; rows are short-lived (engagement prune-events).
+    id = db.Column(db.Integer, primary_key=True)
+    audience = db.Column(db.String(10), nullable=False)  # user/admins/all
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)  # audience == "user"
+    kind = db.Column(db.String(30), nullable=False)  # chat/badge/announcement
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class GameTierOverride(db.Model):
+    # Admin override of a game's discount tiers; defaults live in app/games.py.
+    game_key = db.Column(db.String(50), primary_key=True)
+    tiers = db.Column(db.Text, nullable=False)  # "threshold:pct, ..." e.g. "50:1, 100:2"
+    lower_is_better = db.Column(db.Boolean, nullable=False, default=False)
+    updated_by_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class DailyMetric(db.Model):
+    # Per-day counters maintained incrementally by `flask analytics rollup` (app/rollups.py).
+    metric = db.Column(db.String(40), primary_key=True)  # signups/applications/payments/game_plays/...
+    dim = db.Column(db.String(50), primary_key=True, default="")  # "" or a game key
+    day = db.Column(db.Date, primary_key=True)  # UTC
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class RollupWatermark(db.Model):
+    # High-water mark per rollup source: rows up to (last_at, last_id) are already counted.
+    source = db.Column(db.String(40), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    last_at = db.Column(db.DateTime, nullable=True)  # only for sources keyed on a timestamp
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
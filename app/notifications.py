@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import EventNotification
+
+
+AUDIENCE_USER = "user"
+AUDIENCE_ADMINS = "admins"
+AUDIENCE_ALL = "all"
+
+
+class _Wakeup:
+    """In-process pub/sub: streams in this worker sleep on it and wake when an event commits.
+
+    Other workers only see the row when their next database poll runs
+    (SSE_POLL_SECONDS), so the table is the source of truth and this is a shortcut.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def notify(self) -> None:
+        with self._cond:
+            self._version += 1
+            self._cond.notify_all()
+
+    def wait(self, seen: int, timeout: float) -> int:
+        with self._cond:
+            if self._version == seen:
+                self._cond.wait(timeout)
+            return self._version
+
+
+wakeup = _Wakeup()
+
+
+def publish(kind: str, payload: dict, *, user_id: int | None = None, audience: str | None = None) -> None:
+    """Queue an event in the caller's transaction; it is delivered once that commits.
+
+    Pass `user_id` for one user, or audience="admins" / "all".
+    """
+    audience = audience or (AUDIENCE_USER if user_id is not None else AUDIENCE_ALL)
+    db.session.add(EventNotification(audience=audience, user_id=user_id, kind=kind, payload=json.dumps(payload)))
+    db.session.info["events_pending"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop("events_pending", False):
+        wakeup.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_rollback(session: Session) -> None:
+    session.info.pop("events_pending", None)
+
+
+class StreamSlots:
+    """Caps concurrent SSE streams per worker so they cannot starve normal requests."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self, limit: int) -> bool:
+        with self._lock:
+            if self.active >= limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+
+stream_slots = StreamSlots()
+
+
+def latest_event_id() -> int:
+    return int(db.session.query(db.func.max(EventNotification.id)).scalar() or 0)
+
+
+def _fetch_after(last_id: int, user_id: int, is_admin: bool, *, limit: int = 100) -> list[tuple]:
+    audiences = [EventNotification.audience == AUDIENCE_ALL]
+    audiences.append((EventNotification.audience == AUDIENCE_USER) & (EventNotification.user_id == user_id))
+    if is_admin:
+        audiences.append(EventNotification.audience == AUDIENCE_ADMINS)
+
+    table = EventNotification.__table__
+    stmt = (
+        db.select(table.c.id, table.c.kind, table.c.payload)
+        .where(table.c.id > last_id, or_(*audiences))
+        .order_by(table.c.id.asc())
+        .limit(limit)
+    )
+    # Own short-lived connection: a stream must not pin a pooled connection for its lifetime.
+    with db.engine.connect() as conn:
+        return conn.execute(stmt).all()
+
+
+def event_stream(user_id: int, is_admin: bool, last_id: int) -> Iterator[str]:
+    """SSE frames for one user until SSE_STREAM_SECONDS elapse; EventSource then reconnects."""
+    config = current_app.config
+    deadline = time.monotonic() + float(config["SSE_STREAM_SECONDS"])
+    poll_seconds = float(config["SSE_POLL_SECONDS"])
+    heartbeat_seconds = float(config["SSE_HEARTBEAT_SECONDS"])
+
+    yield f"retry: {int(config['SSE_RETRY_MS'])}\n\n"
+    last_beat = time.monotonic()
+    seen = wakeup.version
+    while time.monotonic() < deadline:
+        rows = _fetch_after(last_id, user_id, is_admin)
+        for event_id, kind, payload in rows:
+            last_id = event_id
+            yield f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+        if rows:
+            last_beat = time.monotonic()
+            continue
+
+        if time.monotonic() - last_beat >= heartbeat_seconds:
+            yield ": ping\n\n"
+            last_beat = time.monotonic()
+        seen = wakeup.wait(seen, min(poll_seconds, max(0.0, deadline - time.monotonic())))
+
+
+def prune_events(*, older_than: timedelta = timedelta(hours=24)) -> int:
+    cutoff = datetime.utcnow() - older_than
+    deleted = EventNotification.query.filter(EventNotification.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return int(deleted or 0)
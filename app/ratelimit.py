@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Protocol
+
+from flask import Flask
+
+
+class SlidingWindow(Protocol):
+    def hit(self, key: str, *, now: float | None = None) -> int:
+        """Record one event for `key` and return how many earlier events fall inside the window."""
+
+
+class MemorySlidingWindow:
+    """Per-process sliding window. Each gunicorn worker keeps its own counts."""
+
+    _SWEEP_EVERY = 1000
+
+    def __init__(self, window_seconds: float) -> None:
+        self.window_seconds = window_seconds
+        self._events: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key: str, *, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        cutoff = now - self.window_seconds
+        with self._lock:
+            events = self._events.setdefault(key, deque())
+            while events and events[0] < cutoff:
+                events.popleft()
+            prior = len(events)
+            events.append(now)
+
+            self._hits += 1
+            if self._hits % self._SWEEP_EVERY == 0:
+                self._sweep(cutoff)
+        return prior
+
+    def _sweep(self, cutoff: float) -> None:
+        # Drop keys that have gone quiet so the dict does not grow forever.
+        for key in [k for k, events in self._events.items() if not events or events[-1] < cutoff]:
+            del self._events[key]
+
+
+class SQLiteSlidingWindow:
+    """Sliding window kept in a local SQLite file, shared by every worker on the box."""
+
+    _SWEEP_EVERY = 1000
+
+    def __init__(self, path: str | Path, window_seconds: float) -> None:
+        self.path = str(path)
+        self.window_seconds = window_seconds
+        self._local = threading.local()
+        self._hits = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS window_event (key TEXT NOT NULL, ts REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_window_event_key_ts ON window_event (key, ts)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, *, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        cutoff = now - self.window_seconds
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM window_event WHERE key = ? AND ts < ?", (key, cutoff))
+            (prior,) = conn.execute("SELECT COUNT(*) FROM window_event WHERE key = ?", (key,)).fetchone()
+            conn.execute("INSERT INTO window_event (key, ts) VALUES (?, ?)", (key, now))
+            self._hits += 1
+            if self._hits % self._SWEEP_EVERY == 0:
+                conn.execute("DELETE FROM window_event WHERE ts < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return int(prior)
+
+
+class SubmissionRateLimiter:
+    """Flask extension wrapping the configured sliding-window backend.
+
+    Config:
+      SUBMISSION_RATE_LIMIT_BACKEND: "memory" (default) or "sqlite"
+      SUBMISSION_RATE_LIMIT_PATH: SQLite file for the shared backend
+    """
+
+    def __init__(self, window_seconds: float = 120) -> None:
+        self.window_seconds = window_seconds
+        self._backend: SlidingWindow | None = None
+
+    def init_app(self, app: Flask) -> None:
+        backend = (app.config.get("SUBMISSION_RATE_LIMIT_BACKEND") or "memory").lower()
+        if backend == "sqlite":
+            path = app.config.get("SUBMISSION_RATE_LIMIT_PATH") or str(Path(app.instance_path) / "ratelimit.db")
+            self._backend = SQLiteSlidingWindow(path, self.window_seconds)
+        elif backend == "memory":
+            self._backend = MemorySlidingWindow(self.window_seconds)
+        else:
+            raise ValueError(f"Unknown SUBMISSION_RATE_LIMIT_BACKEND: {backend!r}")
+        app.extensions["submission_rate_limiter"] = self
+
+    def hit(self, key: str) -> int:
+        if self._backend is None:
+            # Not initialised (e.g. scripts importing engagement directly).
+            self._backend = MemorySlidingWindow(self.window_seconds)
+        return self._backend.hit(key)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+
+from .extensions import db
+from .models import Application, ClassFee, DailyMetric, GameScore, RollupWatermark, User, discounted_amount
+from .upserts import add_daily_metrics, insert_rollup_watermarks
+
+
+# Rows younger than this wait for the next run, so a transaction still open when
+# the job starts cannot commit a row below the watermark afterwards.
+SETTLE_DELAY = timedelta(minutes=2)
+BATCH_SIZE = 5000
+
+
+@dataclass(frozen=True)
+class _Source:
+    name: str
+    # (last_id, last_at, cutoff, limit) -> rows with .id and .at, in watermark order
+    fetch: Callable[[int, datetime | None, datetime, int], list]
+    count: Callable[[list], Counter]
+    keyed_on_time: bool = False
+
+
+def _fetch_signups(last_id: int, last_at: datetime | None, cutoff: datetime, limit: int) -> list:
+    return (
+        db.session.query(User.id.label("id"), User.created_at.label("at"))
+        .filter(User.id > last_id, User.created_at < cutoff)
+        .order_by(User.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _fetch_applications(last_id: int, last_at: datetime | None, cutoff: datetime, limit: int) -> list:
+    return (
+        db.session.query(Application.id.label("id"), Application.created_at.label("at"))
+        .filter(Application.id > last_id, Application.created_at < cutoff)
+        .order_by(Application.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _fetch_payments(last_id: int, last_at: datetime | None, cutoff: datetime, limit: int) -> list:
+    # paid_at is set on existing rows, so this source walks (paid_at, id) instead of id.
+    if last_at is None:
+        after = Application.paid_at.is_not(None)
+    else:
+        after = or_(
+            Application.paid_at > last_at,
+            and_(Application.paid_at == last_at, Application.id > last_id),
+        )
+    return (
+        db.session.query(
+            Application.id.label("id"),
+            Application.paid_at.label("at"),
+            ClassFee.amount_bdt.label("fee"),
+            Application.total_discount_pct.label("pct"),
+        )
+        .join(ClassFee, ClassFee.id == Application.class_fee_id)
+        .filter(after, Application.paid_at < cutoff)
+        .order_by(Application.paid_at.asc(), Application.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _fetch_game_plays(last_id: int, last_at: datetime | None, cutoff: datetime, limit: int) -> list:
+    return (
+        db.session.query(
+            GameScore.id.label("id"),
+            GameScore.created_at.label("at"),
+            GameScore.game_key.label("game_key"),
+            GameScore.is_flagged.label("flagged"),
+        )
+        .filter(GameScore.id > last_id, GameScore.created_at < cutoff)
+        .order_by(GameScore.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _count_rows(metric: str) -> Callable[[list], Counter]:
+    return lambda rows: Counter((metric, "", r.at.date()) for r in rows)
+
+
+def _count_payments(rows: list) -> Counter:
+    counts: Counter = Counter()
+    for r in rows:
+        day = r.at.date()
+        payable = discounted_amount(r.fee, r.pct)
+        counts["payments", "", day] += 1
+        counts["revenue", "", day] += payable
+        counts["discount_granted", "", day] += int(r.fee) - payable
+    return counts
+
+
+def _count_game_plays(rows: list) -> Counter:
+    counts: Counter = Counter()
+    for r in rows:
+        day = r.at.date()
+        counts["game_plays", r.game_key, day] += 1
+        if r.flagged:
+            counts["flagged_scores", r.game_key, day] += 1
+    return counts
+
+
+SOURCES = (
+    _Source("signups", _fetch_signups, _count_rows("signups")),
+    _Source("applications", _fetch_applications, _count_rows("applications")),
+    _Source("payments", _fetch_payments, _count_payments, keyed_on_time=True),
+    _Source("game_plays", _fetch_game_plays, _count_game_plays),
+)
+
+
+def run_rollups(*, batch_size: int = BATCH_SIZE, now: datetime | None = None) -> dict[str, int]:
+    """Fold rows added since each source's watermark into daily_metric. Returns rows processed per source.
+
+    Each batch adds its counts and advances the watermark in one transaction, so
+    an interrupted run resumes where it stopped and a repeated run adds nothing.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - SETTLE_DELAY
+    insert_rollup_watermarks([source.name for source in SOURCES])
+    db.session.commit()
+    processed = {source.name: _drain(source, cutoff, batch_size) for source in SOURCES}
+    db.session.execute(update(RollupWatermark).values(updated_at=now))
+    db.session.commit()
+    return processed
+
+
+def reset_rollups() -> None:
+    """Drop every rollup and rewind the watermarks; the next run rebuilds from scratch."""
+    DailyMetric.query.delete(synchronize_session=False)
+    db.session.execute(update(RollupWatermark).values(last_id=0, last_at=None))
+    db.session.commit()
+
+
+def _drain(source: _Source, cutoff: datetime, batch_size: int) -> int:
+    done = 0
+    while True:
+        last_id, last_at = (
+            db.session.query(RollupWatermark.last_id, RollupWatermark.last_at).filter_by(source=source.name).one()
+        )
+        rows = source.fetch(last_id, last_at, cutoff, batch_size)
+        if not rows:
+            db.session.rollback()
+            return done
+
+        # Claim the batch by moving the watermark only if it is still where we read it.
+        # A concurrent run (overlapping cron) loses this race and re-reads instead of double counting.
+        same_at = RollupWatermark.last_at.is_(None) if last_at is None else RollupWatermark.last_at == last_at
+        claim = (
+            update(RollupWatermark)
+            .where(RollupWatermark.source == source.name, RollupWatermark.last_id == last_id, same_at)
+            .values(last_id=rows[-1].id, last_at=rows[-1].at if source.keyed_on_time else None)
+        )
+        if db.session.execute(claim).rowcount != 1:
+            db.session.rollback()
+            continue
+
+        add_daily_metrics(dict(source.count(rows)))
+        db.session.commit()
+        done += len(rows)
+        if len(rows) < batch_size:
+            return done
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import delete, insert
+
+from .extensions import db
+from .games import GameTiers, game_registry
+from .models import Application, GameScore, ScoreAnomaly
+
+
+# Offline fair-play analysis (`flask fair-play analyze`). game_score is streamed
+# into flat NumPy columns and every check below is array arithmetic over them;
+# no ORM objects are built and Python only loops over games, not rows.
+
+CHUNK_SIZE = 50_000
+# Robust z-score (Iglewicz & Hoaglin): 0.6745 * (x - median) / MAD, flagged above 3.5.
+OUTLIER_Z = 3.5
+MIN_GAME_SAMPLES = 30  # below this a game's median and MAD say too little
+# Two finished games by the same user closer together than this cannot both be real plays.
+MIN_PLAY_GAP_SECONDS = 1.0
+# A score "just clears" a tier when it is within 2% of the threshold (at least the threshold itself).
+THRESHOLD_BAND = 0.02
+THRESHOLD_Z = 4.0
+MIN_THRESHOLD_HITS = 5
+MAX_FINDINGS = 10_000  # per kind, most severe first
+INSERT_BATCH = 5_000
+
+
+@dataclass(frozen=True)
+class ScoreColumns:
+    """game_score as parallel arrays, one element per row, in id order."""
+
+    id: np.ndarray
+    application_id: np.ndarray
+    user_id: np.ndarray
+    game: np.ndarray  # index into game_keys
+    score: np.ndarray
+    at_us: np.ndarray  # created_at in microseconds since the epoch
+    game_keys: tuple[str, ...]
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+
+_DTYPES = (np.int64, np.int64, np.int64, np.int32, np.float64, np.int64)
+
+
+def load_score_columns(*, chunk_size: int = CHUNK_SIZE) -> ScoreColumns:
+    """Stream game_score (with each application's user) through a server-side cursor into arrays."""
+    scores = GameScore.__table__
+    apps = Application.__table__
+    stmt = (
+        db.select(
+            scores.c.id,
+            scores.c.application_id,
+            apps.c.user_id,
+            scores.c.game_key,
+            scores.c.score,
+            scores.c.created_at,
+        )
+        .join(apps, apps.c.id == scores.c.application_id)
+        .order_by(scores.c.id)
+    )
+
+    codes: dict[str, int] = {}
+    chunks: list[list[np.ndarray]] = []
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(stmt)
+        for rows in result.partitions():
+            ids, app_ids, user_ids, keys, values, created = zip(*rows)
+            chunks.append(
+                [
+                    np.array(ids, dtype=np.int64),
+                    np.array(app_ids, dtype=np.int64),
+                    np.array(user_ids, dtype=np.int64),
+                    np.array([codes.setdefault(k, len(codes)) for k in keys], dtype=np.int32),
+                    np.array(values, dtype=np.float64),
+                    np.array(created, dtype="datetime64[us]").astype(np.int64),
+                ]
+            )
+
+    if chunks:
+        columns = [np.concatenate(parts) for parts in zip(*chunks)]
+    else:
+        columns = [np.empty(0, dtype=dtype) for dtype in _DTYPES]
+    return ScoreColumns(*columns, game_keys=tuple(codes))
+
+
+def _groups(codes_sorted: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(start, length) of each run of equal values in a sorted array."""
+    starts = np.flatnonzero(np.r_[True, codes_sorted[1:] != codes_sorted[:-1]])
+    return starts, np.diff(np.r_[starts, len(codes_sorted)])
+
+
+def _sorted_medians(values_sorted: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    return (values_sorted[starts + (counts - 1) // 2] + values_sorted[starts + counts // 2]) / 2
+
+
+def robust_z(cols: ScoreColumns) -> tuple[np.ndarray, np.ndarray]:
+    """Each row's robust z-score within its game, and each game's median. NaN where undefined."""
+    n_games = len(cols.game_keys)
+    plays = np.bincount(cols.game, minlength=n_games)
+
+    # One sort by (game, score) gives every game's median at once; a second sort of
+    # the absolute deviations gives every MAD.
+    order = np.lexsort((cols.score, cols.game))
+    starts, counts = _groups(cols.game[order])
+    present = cols.game[order][starts]
+    median = np.full(n_games, np.nan)
+    median[present] = _sorted_medians(cols.score[order], starts, counts)
+
+    dev = np.abs(cols.score - median[cols.game])
+    order = np.lexsort((dev, cols.game))
+    mad = np.full(n_games, np.nan)
+    mad[present] = _sorted_medians(dev[order], starts, counts)
+
+    # When over half of a game's plays share one score its MAD is 0; fall back to
+    # the mean absolute deviation (scaled so both estimate one standard deviation).
+    mean_ad = np.bincount(cols.game, weights=dev, minlength=n_games) / np.maximum(plays, 1)
+    scale = np.where(mad > 0, 1.4826 * mad, 1.2533 * mean_ad)
+    scale[(plays < MIN_GAME_SAMPLES) | ~(scale > 0)] = np.nan
+    return (cols.score - median[cols.game]) / scale[cols.game], median
+
+
+def play_gaps(cols: ScoreColumns) -> np.ndarray:
+    """Seconds since the same user's previous play, per row (inf for a user's first play)."""
+    order = np.lexsort((cols.id, cols.at_us, cols.user_id))
+    users = cols.user_id[order]
+    gaps = np.full(len(cols), np.inf)
+    gaps[order[1:]] = np.where(users[1:] == users[:-1], np.diff(cols.at_us[order]) / 1e6, np.inf)
+    return gaps
+
+
+def threshold_hits(cols: ScoreColumns, tiers: list[GameTiers | None]) -> tuple[np.ndarray, np.ndarray]:
+    """(rows that just clear a tier threshold, rows of games that have tiers at all)."""
+    hits = np.zeros(len(cols), dtype=bool)
+    eligible = np.zeros(len(cols), dtype=bool)
+    order = np.argsort(cols.game, kind="stable")
+    starts, counts = _groups(cols.game[order])
+    for start, count in zip(starts, counts):
+        rows = order[start : start + count]
+        game_tiers = tiers[cols.game[rows[0]]]
+        if game_tiers is None:
+            continue
+        thresholds = np.asarray(game_tiers.thresholds, dtype=np.float64)
+        width = np.maximum(1.0, np.ceil(thresholds * THRESHOLD_BAND))
+        score = cols.score[rows]
+        if game_tiers.lower_is_better:
+            # Tightest maximum the score still fits under, as in GameTiers.discount_for.
+            idx = np.searchsorted(thresholds, score, side="left")
+            reached = idx < len(thresholds)
+            idx = np.minimum(idx, len(thresholds) - 1)
+            margin = thresholds[idx] - score
+        else:
+            idx = np.searchsorted(thresholds, score, side="right") - 1
+            reached = idx >= 0
+            idx = np.maximum(idx, 0)
+            margin = score - thresholds[idx]
+        hits[rows] = reached & (margin < width[idx])
+        eligible[rows] = True
+    return hits, eligible
+
+
+def threshold_z(cols: ScoreColumns, hits: np.ndarray, eligible: np.ndarray):
+    """Per user: how far their threshold hits exceed what their games' overall hit rates predict.
+
+    Returns (user_ids, hits, plays, expected, z). Each play is a Bernoulli trial
+    with its game's population hit rate, so the user's count has mean sum(p) and
+    variance sum(p * (1 - p)).
+    """
+    n_games = len(cols.game_keys)
+    tried = np.bincount(cols.game, weights=eligible, minlength=n_games)
+    rate = np.bincount(cols.game, weights=hits, minlength=n_games) / np.maximum(tried, 1)
+    p = rate[cols.game] * eligible
+
+    user_ids, user = np.unique(cols.user_id, return_inverse=True)
+    k = np.bincount(user, weights=hits)
+    plays = np.bincount(user, weights=eligible)
+    expected = np.bincount(user, weights=p)
+    var = np.bincount(user, weights=p * (1 - p))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(var > 0, (k - expected) / np.sqrt(var), np.nan)
+    return user_ids, k, plays, expected, z
+
+
+def _most_severe(rows: np.ndarray, severity: np.ndarray) -> np.ndarray:
+    return rows[np.argsort(-severity[rows], kind="stable")][:MAX_FINDINGS]
+
+
+def find_anomalies(cols: ScoreColumns, now: datetime) -> list[dict]:
+    """score_anomaly rows for `cols`, grouped by kind, most severe first."""
+    if not len(cols):
+        return []
+    tiers = [game_registry.get(key) for key in cols.game_keys]
+    keys = np.asarray(cols.game_keys, dtype=object)
+    findings: list[dict] = []
+
+    def add(kind: str, rows: np.ndarray, values: np.ndarray, details: list[str]) -> None:
+        for i, value, detail in zip(rows.tolist(), values.tolist(), details):
+            findings.append(
+                {
+                    "kind": kind,
+                    "user_id": int(cols.user_id[i]),
+                    "application_id": int(cols.application_id[i]),
+                    "game_score_id": int(cols.id[i]),
+                    "game_key": keys[cols.game[i]],
+                    "value": value,
+                    "detail": detail,
+                    "detected_at": now,
+                }
+            )
+
+    # Outliers, in the direction that earns a bigger discount.
+    z, median = robust_z(cols)
+    better = np.array([-1.0 if t is not None and t.lower_is_better else 1.0 for t in tiers])
+    signed = z * better[cols.game]
+    rows = _most_severe(np.flatnonzero(signed > OUTLIER_Z), signed)
+    add(
+        "outlier",
+        rows,
+        z[rows],
+        [f"score {cols.score[i]:g} vs game median {median[cols.game[i]]:g}" for i in rows],
+    )
+
+    # Plays that finished impossibly soon after the user's previous one.
+    gaps = play_gaps(cols)
+    rows = _most_severe(np.flatnonzero(gaps < MIN_PLAY_GAP_SECONDS), -gaps)
+    add("timing", rows, gaps[rows], [f"{gaps[i]:.2f}s after the previous play" for i in rows])
+
+    # Users who land just over tier thresholds far more often than chance.
+    hits, eligible = threshold_hits(cols, tiers)
+    user_ids, k, plays, expected, tz = threshold_z(cols, hits, eligible)
+    flagged = np.flatnonzero((k >= MIN_THRESHOLD_HITS) & (tz > THRESHOLD_Z))
+    flagged = flagged[np.argsort(-tz[flagged], kind="stable")][:MAX_FINDINGS]
+    for i in flagged.tolist():
+        findings.append(
+            {
+                "kind": "threshold",
+                "user_id": int(user_ids[i]),
+                "application_id": None,
+                "game_score_id": None,
+                "game_key": None,
+                "value": float(tz[i]),
+                "detail": f"{k[i]:.0f} of {plays[i]:.0f} plays just clear a tier threshold (expected {expected[i]:.1f})",
+                "detected_at": now,
+            }
+        )
+    return findings
+
+
+def analyze_scores(*, chunk_size: int = CHUNK_SIZE, now: datetime | None = None) -> dict[str, int]:
+    """Recompute every finding and replace the contents of score_anomaly. Returns counts per kind."""
+    now = now or datetime.utcnow()
+    findings = find_anomalies(load_score_columns(chunk_size=chunk_size), now)
+
+    # Replaced in one transaction, so the fair-play page never sees a half-written run.
+    db.session.execute(delete(ScoreAnomaly))
+    for start in range(0, len(findings), INSERT_BATCH):
+        db.session.execute(insert(ScoreAnomaly), findings[start : start + INSERT_BATCH])
+    db.session.commit()
+
+    counts = {"outlier": 0, "timing": 0, "threshold": 0}
+    for row in findings:
+        counts[row["kind"]] += 1
+    return counts
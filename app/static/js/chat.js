@@ -0,0 +1,122 @@
+// Incremental chat: polls for messages after the newest id, loads older pages on
+// demand and sends without a full page reload. Bubble markup comes from the
+// page's <template id="chatBubbleSelf"> / <template id="chatBubbleOther">.
+(function () {
+  const log = document.getElementById('chatLog');
+  if (!log) return;
+
+  const messagesUrl = log.dataset.messagesUrl;
+  const applicationId = Number(log.dataset.applicationId);
+  const selfRole = log.dataset.selfRole;
+  const timeFormat = log.dataset.timeFormat || 'full';
+  const pollMs = 5000;
+  const tokenMeta = document.querySelector('meta[name="csrf-token"]');
+  const csrf = tokenMeta ? tokenMeta.getAttribute('content') : '';
+
+  function ids() {
+    return Array.from(log.querySelectorAll('[data-message-id]')).map(el => Number(el.dataset.messageId));
+  }
+  let newestId = Math.max(0, ...ids());
+
+  function formatTime(iso) {
+    return timeFormat === 'time' ? iso.slice(11, 16) : iso.slice(0, 16).replace('T', ' ');
+  }
+
+  function bubble(m) {
+    const tpl = document.getElementById(m.sender_role === selfRole ? 'chatBubbleSelf' : 'chatBubbleOther');
+    const el = tpl.content.firstElementChild.cloneNode(true);
+    el.dataset.messageId = m.id;
+    el.querySelector('[data-slot="meta"]').textContent = m.sender_name + ' • ' + formatTime(m.created_at);
+    el.querySelector('[data-slot="message"]').textContent = m.message;
+    return el;
+  }
+
+  function nearBottom() {
+    return log.scrollHeight - log.scrollTop - log.clientHeight < 80;
+  }
+
+  function append(messages) {
+    const stick = nearBottom();
+    for (const m of messages) {
+      if (m.id <= newestId || log.querySelector(`[data-message-id="${m.id}"]`)) continue;
+      log.appendChild(bubble(m));
+      newestId = m.id;
+    }
+    if (messages.length) {
+      const empty = document.getElementById('chatEmpty');
+      if (empty) empty.remove();
+    }
+    if (stick) log.scrollTop = log.scrollHeight;
+  }
+
+  function poll() {
+    if (document.hidden) return Promise.resolve();
+    return fetch(`${messagesUrl}?after=${newestId}`, { credentials: 'same-origin' })
+      .then(r => (r.ok ? r.json() : { messages: [] }))
+      .then(data => append(data.messages))
+      .catch(() => {});
+  }
+
+  const olderBtn = document.getElementById('chatLoadOlder');
+  if (olderBtn) {
+    olderBtn.addEventListener('click', () => {
+      const oldest = Math.min(...ids());
+      olderBtn.disabled = true;
+      fetch(`${messagesUrl}?before=${oldest}`, { credentials: 'same-origin' })
+        .then(r => r.json())
+        .then(data => {
+          const before = log.scrollHeight;
+          const anchor = olderBtn.nextElementSibling;
+          for (const m of data.messages) log.insertBefore(bubble(m), anchor);
+          log.scrollTop += log.scrollHeight - before;
+          if (data.has_more) olderBtn.disabled = false;
+          else olderBtn.remove();
+        })
+        .catch(() => { olderBtn.disabled = false; });
+    });
+  }
+
+  const form = document.getElementById('chatForm');
+  if (form) {
+    form.addEventListener('submit', e => {
+      e.preventDefault();
+      const input = form.querySelector('[name="message"]');
+      if (!input.value.trim()) return;
+      const body = new FormData(form);
+      fetch(form.action, {
+        method: 'POST',
+        body,
+        credentials: 'same-origin',
+        headers: { 'X-CSRFToken': csrf, 'Accept': 'application/json' }
+      })
+        .then(r => r.json())
+        .then(data => {
+          if (!data.ok) return;
+          input.value = '';
+          // Pick up anything that arrived since the last poll, then our own message.
+          return poll().then(() => append([data.message]));
+        })
+        .then(() => { log.scrollTop = log.scrollHeight; })
+        .catch(() => {
+          // Fall back to the classic POST + redirect (form.submit() skips the CSRF submit hook).
+          const token = document.createElement('input');
+          token.type = 'hidden';
+          token.name = 'csrf_token';
+          token.value = csrf;
+          form.appendChild(token);
+          form.submit();
+        });
+    });
+  }
+
+  // Pushed over the event stream when it is connected; the interval poll is the fallback.
+  document.addEventListener('mlf:chat', e => {
+    if (e.detail.application_id === applicationId) poll();
+  });
+
+  log.scrollTop = log.scrollHeight;
+  setInterval(() => {
+    if (!(window.mlfEvents && window.mlfEvents.connected)) poll();
+  }, pollMs);
+  document.addEventListener('visibilitychange', () => { if (!document.hidden) poll(); });
+})();
@@ -5,13 +5,28 @@ function postScore(appId, gameKey, score) {
   const form = new FormData();
   form.append('game_key', gameKey);
   form.append('score', String(score));
-  fetch(`/client/application/${appId}/games/submit`, {
+  const headers = { 'Accept': 'application/json' };
+  if (csrf) headers['X-CSRFToken'] = csrf;
+  fetch(`/client/application/${appId}/games/submit.json`, {
     method: 'POST',
     body: form,
     credentials: 'same-origin',
-    headers: csrf ? { 'X-CSRFToken': csrf } : {}
+    headers
   })
-    .then(() => window.location.reload())
+    .then(r => r.json())
+    .then(data => {
+      if (!data.ok) {
+        window.location.reload();
+        return;
+      }
+      const total = document.getElementById('totalDiscount');
+      if (total) total.textContent = data.total_discount_pct + '%';
+      if (window.showToast && data.messages.length) {
+        const div = document.createElement('div');
+        div.textContent = data.messages.map(m => m.text).join(' ');
+        window.showToast(div.innerHTML);
+      }
+    })
     .catch(() => window.location.reload());
 }
 
@@ -0,0 +1,452 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from sqlalchemy import case, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .activity import merge, with_day
+from .extensions import db
+from .models import (
+    BadgeAward,
+    ChatReadCursor,
+    DailyMetric,
+    RollupWatermark,
+    UserActivityYear,
+    UserGameStat,
+    WeeklyChallengeProgress,
+    WeeklyGameBest,
+)
+
+
+# Native INSERT ... ON CONFLICT builders. Other dialects fall back to
+# SELECT-then-INSERT, which is racy but keeps the app working.
+_INSERT_BY_DIALECT = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def _native_insert(model):
+    dialect = db.session.get_bind().dialect
+    builder = _INSERT_BY_DIALECT.get(dialect.name)
+    return builder(model) if builder else None
+
+
+def _supports_returning() -> bool:
+    return bool(getattr(db.session.get_bind().dialect, "insert_returning", False))
+
+
+def _beats(new, current, *, lower_is_better: bool):
+    return new < current if lower_is_better else new > current
+
+
+def upsert_game_stat(
+    user_id: int,
+    game_key: str,
+    score: int,
+    *,
+    now: datetime | None = None,
+    lower_is_better: bool = False,
+    counts_for_best: bool = True,
+) -> bool:
+    """Count one play and keep the best score, in a single statement.
+
+    Flagged scores pass counts_for_best=False: they count as a play but never become the best.
+    Returns True if this score is the user's new best for the game.
+    """
+    now = now or datetime.utcnow()
+    best = score if counts_for_best else None
+    stmt = _native_insert(UserGameStat)
+    if stmt is None:
+        return _fallback_game_stat(user_id, game_key, best, now, lower_is_better)
+
+    stmt = stmt.values(
+        user_id=user_id,
+        game_key=game_key,
+        plays_count=1,
+        best_score=best,
+        best_at=now if counts_for_best else None,
+        updated_at=now,
+    )
+    current = UserGameStat.__table__.c
+    improved = stmt.excluded.best_score.is_not(None) & (
+        current.best_score.is_(None)
+        | _beats(stmt.excluded.best_score, current.best_score, lower_is_better=lower_is_better)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "game_key"],
+        set_={
+            "plays_count": current.plays_count + 1,
+            "best_score": case((improved, stmt.excluded.best_score), else_=current.best_score),
+            "best_at": case((improved, stmt.excluded.best_at), else_=current.best_at),
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    if not counts_for_best:
+        db.session.execute(stmt)
+        return False
+    # best_at only takes this call's timestamp when the score became the best.
+    if _supports_returning():
+        return db.session.execute(stmt.returning(current.best_at)).scalar_one() == now
+    db.session.execute(stmt)
+    best_at = db.session.execute(
+        db.select(current.best_at).where(current.user_id == user_id, current.game_key == game_key)
+    ).scalar_one()
+    return best_at == now
+
+
+def _fallback_game_stat(
+    user_id: int,
+    game_key: str,
+    best: int | None,
+    now: datetime,
+    lower_is_better: bool,
+    *,
+    plays: int = 1,
+    best_at: datetime | None = None,
+) -> bool:
+    row = UserGameStat.query.filter_by(user_id=user_id, game_key=game_key).first()
+    if not row:
+        row = UserGameStat(user_id=user_id, game_key=game_key, plays_count=0)
+        db.session.add(row)
+
+    row.plays_count = int(row.plays_count or 0) + plays
+    row.updated_at = now
+    if best is not None and (
+        row.best_score is None or _beats(best, int(row.best_score), lower_is_better=lower_is_better)
+    ):
+        row.best_score = best
+        row.best_at = best_at or now
+        return True
+    return False
+
+
+def upsert_game_bests(
+    bests: dict[tuple[int, str], tuple[int, datetime]], *, now: datetime | None = None, lower_is_better: bool = False
+) -> set[tuple[int, str]]:
+    """Offer {(user_id, game_key): (score, best_at)} as bests without counting plays, in one statement.
+
+    For flagged scores cleared later, whose plays were counted on submission.
+    All keys must share `lower_is_better`. Returns the keys whose best changed.
+    """
+    if not bests:
+        return set()
+    now = now or datetime.utcnow()
+    stmt = _native_insert(UserGameStat)
+    if stmt is None:
+        return {
+            key
+            for key, (score, best_at) in bests.items()
+            if _fallback_game_stat(*key, score, now, lower_is_better, plays=0, best_at=best_at)
+        }
+
+    stmt = stmt.values(
+        [
+            {
+                "user_id": user_id,
+                "game_key": game_key,
+                "plays_count": 0,
+                "best_score": score,
+                "best_at": best_at,
+                "updated_at": now,
+            }
+            for (user_id, game_key), (score, best_at) in bests.items()
+        ]
+    )
+    current = UserGameStat.__table__.c
+    improved = current.best_score.is_(None) | _beats(
+        stmt.excluded.best_score, current.best_score, lower_is_better=lower_is_better
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "game_key"],
+        set_={
+            "best_score": case((improved, stmt.excluded.best_score), else_=current.best_score),
+            "best_at": case((improved, stmt.excluded.best_at), else_=current.best_at),
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    returned = (current.user_id, current.game_key, current.best_at)
+    if _supports_returning():
+        rows = db.session.execute(stmt.returning(*returned)).all()
+    else:
+        db.session.execute(stmt)
+        rows = db.session.execute(
+            db.select(*returned).where(tuple_(current.user_id, current.game_key).in_(list(bests)))
+        ).all()
+    # As in upsert_game_stat: best_at only takes the offered timestamp when the score won.
+    return {(user_id, game_key) for user_id, game_key, best_at in rows if best_at == bests[(user_id, game_key)][1]}
+
+
+def upsert_weekly_best(
+    week_key: str, game_key: str, user_id: int, score: int, *, now: datetime | None = None, lower_is_better: bool = False
+) -> bool:
+    """Keep the user's best score for the game in this ISO week. Returns True if it improved."""
+    now = now or datetime.utcnow()
+    stmt = _native_insert(WeeklyGameBest)
+    if stmt is None:
+        row = db.session.get(WeeklyGameBest, (week_key, game_key, user_id))
+        if row is None:
+            db.session.add(
+                WeeklyGameBest(week_key=week_key, game_key=game_key, user_id=user_id, best_score=score, best_at=now)
+            )
+            return True
+        if _beats(score, row.best_score, lower_is_better=lower_is_better):
+            row.best_score = score
+            row.best_at = now
+            return True
+        return False
+
+    stmt = stmt.values(week_key=week_key, game_key=game_key, user_id=user_id, best_score=score, best_at=now)
+    current = WeeklyGameBest.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["week_key", "game_key", "user_id"],
+        set_={"best_score": stmt.excluded.best_score, "best_at": stmt.excluded.best_at},
+        where=_beats(stmt.excluded.best_score, current.best_score, lower_is_better=lower_is_better),
+    )
+    # DO UPDATE ... WHERE leaves the row untouched (rowcount 0) when the score is not better.
+    return db.session.execute(stmt).rowcount == 1
+
+
+def upsert_weekly_bests(
+    bests: dict[tuple[str, str, int], tuple[int, datetime]], *, lower_is_better: bool = False
+) -> set[tuple[str, str, int]]:
+    """upsert_weekly_best for many {(week_key, game_key, user_id): (score, best_at)} in one statement.
+
+    All keys must share `lower_is_better`. Returns the keys whose best changed.
+    """
+    if not bests:
+        return set()
+    stmt = _native_insert(WeeklyGameBest)
+    if stmt is None:
+        return {
+            key
+            for key, (score, best_at) in bests.items()
+            if upsert_weekly_best(*key, score, now=best_at, lower_is_better=lower_is_better)
+        }
+
+    stmt = stmt.values(
+        [
+            {"week_key": week_key, "game_key": game_key, "user_id": user_id, "best_score": score, "best_at": best_at}
+            for (week_key, game_key, user_id), (score, best_at) in bests.items()
+        ]
+    )
+    current = WeeklyGameBest.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["week_key", "game_key", "user_id"],
+        set_={"best_score": stmt.excluded.best_score, "best_at": stmt.excluded.best_at},
+        where=_beats(stmt.excluded.best_score, current.best_score, lower_is_better=lower_is_better),
+    )
+    keys = (current.week_key, current.game_key, current.user_id)
+    if _supports_returning():
+        # Only inserted and updated rows come back; DO UPDATE ... WHERE skips the rest.
+        return {tuple(row) for row in db.session.execute(stmt.returning(*keys)).all()}
+    db.session.execute(stmt)
+    rows = db.session.execute(
+        db.select(*keys, current.best_score, current.best_at).where(tuple_(*keys).in_(list(bests)))
+    ).all()
+    return {(w, g, u) for w, g, u, score, best_at in rows if (score, best_at) == bests[w, g, u]}
+
+
+def insert_activity_day(user_id: int, day: date) -> bool:
+    """Set the day's bit in the user's yearly bitmap. Returns True if this call set it."""
+    return merge_activity_bits(user_id, day.year, with_day(b"", day))
+
+
+def merge_activity_bits(user_id: int, year: int, bits: bytes) -> bool:
+    """OR `bits` into the user's bitmap for `year`. Returns True if that set any new day.
+
+    Lock-free: the stored bitmap is only replaced if it still holds what we read,
+    so concurrent requests for the same user cannot both claim the same day.
+    """
+    table = UserActivityYear.__table__
+    key = (table.c.user_id == user_id) & (table.c.year == year)
+    while True:
+        current = db.session.execute(db.select(table.c.days).where(key)).scalar()
+        if current is None:
+            stmt = _native_insert(UserActivityYear)
+            if stmt is None:
+                db.session.add(UserActivityYear(user_id=user_id, year=year, days=bits))
+                return True
+            stmt = stmt.values(user_id=user_id, year=year, days=bits)
+            if db.session.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "year"])).rowcount == 1:
+                return True
+            continue
+
+        merged = merge(current, bits)
+        if merged == current:
+            return False
+        if db.session.execute(db.update(table).where(key, table.c.days == current).values(days=merged)).rowcount == 1:
+            return True
+
+
+def insert_badge_rows(rows: list[dict]) -> list[tuple[int, str]]:
+    """Multi-row badge insert that skips held badges. Returns the (user_id, badge_key) pairs inserted."""
+    if not rows:
+        return []
+
+    stmt = _native_insert(BadgeAward)
+    if stmt is None:
+        held = set(
+            db.session.query(BadgeAward.user_id, BadgeAward.badge_key)
+            .filter(
+                BadgeAward.user_id.in_({r["user_id"] for r in rows}),
+                BadgeAward.badge_key.in_({r["badge_key"] for r in rows}),
+            )
+            .all()
+        )
+        fresh = [r for r in rows if (r["user_id"], r["badge_key"]) not in held]
+        db.session.add_all(BadgeAward(**r) for r in fresh)
+        return [(r["user_id"], r["badge_key"]) for r in fresh]
+
+    stmt = stmt.values(rows).on_conflict_do_nothing(index_elements=["user_id", "badge_key"])
+    if _supports_returning():
+        return [tuple(r) for r in db.session.execute(stmt.returning(BadgeAward.user_id, BadgeAward.badge_key)).all()]
+
+    # Old SQLite without RETURNING: insert one at a time and use rowcount.
+    inserted = []
+    for row in rows:
+        single = _native_insert(BadgeAward).values(row).on_conflict_do_nothing(index_elements=["user_id", "badge_key"])
+        if db.session.execute(single).rowcount == 1:
+            inserted.append((row["user_id"], row["badge_key"]))
+    return inserted
+
+
+def bump_weekly_progress(application_id: int, week_key: str, game_key: str, *, now: datetime | None = None) -> None:
+    """Count one non-flagged play toward the weekly challenge and add its game to the distinct set."""
+    add_weekly_plays({(application_id, week_key, game_key): 1}, now=now)
+
+
+def _like_literal(expr):
+    # `expr` with LIKE wildcards escaped (escape character "/"), as autoescape does for literals.
+    for char in ("/", "%", "_"):
+        expr = db.func.replace(expr, char, "/" + char)
+    return expr
+
+
+def add_weekly_plays(plays: dict[tuple[int, str, str], int], *, now: datetime | None = None) -> None:
+    """Add {(application_id, week_key, game_key): n} non-flagged plays to the weekly challenge counters.
+
+    One multi-row statement per round. A statement may not update the same row
+    twice, so each round holds at most one game per (application, week).
+    """
+    now = now or datetime.utcnow()
+    games: dict[tuple[int, str], dict[str, int]] = {}
+    for (application_id, week_key, game_key), n in plays.items():
+        per_week = games.setdefault((application_id, week_key), {})
+        token = game_key.replace(",", "")
+        per_week[token] = per_week.get(token, 0) + n
+
+    stmt = _native_insert(WeeklyChallengeProgress)
+    if stmt is None:
+        for (application_id, week_key), per_week in games.items():
+            row = db.session.get(WeeklyChallengeProgress, (application_id, week_key))
+            if row is None:
+                row = WeeklyChallengeProgress(
+                    application_id=application_id,
+                    week_key=week_key,
+                    plays_count=0,
+                    unique_games=0,
+                    game_keys=",",
+                )
+                db.session.add(row)
+            for token, n in per_week.items():
+                row.plays_count = int(row.plays_count or 0) + n
+                if f",{token}," not in row.game_keys:
+                    row.unique_games = int(row.unique_games or 0) + 1
+                    row.game_keys = row.game_keys + token + ","
+            row.updated_at = now
+        return
+
+    pending = {key: list(per_week.items()) for key, per_week in games.items()}
+    current = WeeklyChallengeProgress.__table__.c
+    while pending:
+        rows = [
+            {
+                "application_id": application_id,
+                "week_key": week_key,
+                "plays_count": per_week[-1][1],
+                "unique_games": 1,
+                "game_keys": f",{per_week[-1][0]},",
+                "updated_at": now,
+            }
+            for (application_id, week_key), per_week in pending.items()
+        ]
+        stmt = _native_insert(WeeklyChallengeProgress).values(rows)
+        seen = current.game_keys.contains(_like_literal(stmt.excluded.game_keys), escape="/")
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["application_id", "week_key"],
+            set_={
+                "plays_count": current.plays_count + stmt.excluded.plays_count,
+                "unique_games": current.unique_games + case((seen, 0), else_=1),
+                # excluded.game_keys is ",token,"; the stored set already ends with a comma.
+                "game_keys": case(
+                    (seen, current.game_keys), else_=current.game_keys + db.func.substr(stmt.excluded.game_keys, 2)
+                ),
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        db.session.execute(stmt)
+        for per_week in pending.values():
+            per_week.pop()
+        pending = {key: per_week for key, per_week in pending.items() if per_week}
+
+
+def advance_read_cursor(application_id: int, reader_role: str, message_id: int, *, now: datetime | None = None) -> None:
+    """Move the reader's cursor forward to `message_id` (never backwards)."""
+    now = now or datetime.utcnow()
+    stmt = _native_insert(ChatReadCursor)
+    if stmt is None:
+        row = db.session.get(ChatReadCursor, (application_id, reader_role))
+        if row is None:
+            row = ChatReadCursor(application_id=application_id, reader_role=reader_role, last_read_id=0)
+            db.session.add(row)
+        if message_id > int(row.last_read_id or 0):
+            row.last_read_id = message_id
+            row.updated_at = now
+        return
+
+    stmt = stmt.values(application_id=application_id, reader_role=reader_role, last_read_id=message_id, updated_at=now)
+    current = ChatReadCursor.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["application_id", "reader_role"],
+        set_={"last_read_id": stmt.excluded.last_read_id, "updated_at": stmt.excluded.updated_at},
+        where=stmt.excluded.last_read_id > current.last_read_id,
+    )
+    db.session.execute(stmt)
+
+
+def add_daily_metrics(counts: dict[tuple[str, str, date], int]) -> None:
+    """Add {(metric, dim, day): n} onto the daily_metric counters in one multi-row statement."""
+    if not counts:
+        return
+    rows = [{"metric": m, "dim": dim, "day": day, "value": n} for (m, dim, day), n in counts.items()]
+    stmt = _native_insert(DailyMetric)
+    if stmt is None:
+        for row in rows:
+            current = db.session.get(DailyMetric, (row["metric"], row["dim"], row["day"]))
+            if current is None:
+                db.session.add(DailyMetric(**row))
+            else:
+                current.value = int(current.value or 0) + row["value"]
+        return
+
+    stmt = stmt.values(rows)
+    current = DailyMetric.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["metric", "dim", "day"],
+        set_={"value": current.value + stmt.excluded.value},
+    )
+    db.session.execute(stmt)
+
+
+def insert_rollup_watermarks(sources: list[str]) -> None:
+    """Create a zero watermark for each rollup source that has none yet."""
+    stmt = _native_insert(RollupWatermark)
+    if stmt is None:
+        existing = {s for (s,) in db.session.query(RollupWatermark.source).all()}
+        db.session.add_all(RollupWatermark(source=s, last_id=0) for s in sources if s not in existing)
+        return
+
+    rows = [{"source": s, "last_id": 0} for s in sources]
+    db.session.execute(stmt.values(rows).on_conflict_do_nothing(index_elements=["source"]))
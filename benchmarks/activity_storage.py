@@ -0,0 +1,177 @@
+"""Compare user_activity_day rows with user_activity_year bitmaps: on-disk size and read time.
+
+    python benchmarks/activity_storage.py                  # 100k users x 365 days
+    python benchmarks/activity_storage.py --users 10000    # quicker run
+
+Builds two throwaway SQLite files from the app's own table definitions, one per
+representation. Each user is active on about a quarter of the days of one year.
+Two reads are timed:
+  - streak:    load one user's activity and compute current/longest streak (random users)
+  - retention: stream users in id chunks and collect the set of active ISO weeks per user
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.activity import active_weeks, days_in, streak_stats  # noqa: E402
+from app.models import User, UserActivityDay, UserActivityYear  # noqa: E402
+
+
+YEAR = 2025
+JAN1 = date(YEAR, 1, 1)
+
+
+def _activity(users: int, days: int, seed: int):
+    rng = random.Random(seed)
+    mask = (1 << days) - 1
+    for uid in range(1, users + 1):
+        # AND of two random words: each day active with probability 1/4.
+        yield uid, rng.getrandbits(days) & rng.getrandbits(days) & mask
+
+
+def _engine(path: str, table) -> sa.Engine:
+    engine = sa.create_engine(f"sqlite:///{path}")
+    User.metadata.create_all(engine, tables=[User.__table__, table])
+    return engine
+
+
+def _load_rows(engine: sa.Engine, users: int, days: int, seed: int) -> int:
+    table = UserActivityDay.__table__
+    created = JAN1
+    batch, total = [], 0
+    with engine.begin() as conn:
+        for uid, bits in _activity(users, days, seed):
+            for day in days_in(YEAR, bits.to_bytes(46, "little")):
+                batch.append({"user_id": uid, "day": day, "created_at": created})
+            if len(batch) >= 50_000:
+                conn.execute(table.insert(), batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            conn.execute(table.insert(), batch)
+            total += len(batch)
+    return total
+
+
+def _load_bitmaps(engine: sa.Engine, users: int, days: int, seed: int) -> int:
+    table = UserActivityYear.__table__
+    batch, total = [], 0
+    with engine.begin() as conn:
+        for uid, bits in _activity(users, days, seed):
+            batch.append({"user_id": uid, "year": YEAR, "days": bits.to_bytes(46, "little")})
+            if len(batch) >= 50_000:
+                conn.execute(table.insert(), batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            conn.execute(table.insert(), batch)
+            total += len(batch)
+    return total
+
+
+def _size_mb(engine: sa.Engine, path: str) -> float:
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    return os.path.getsize(path) / 1e6
+
+
+def _streaks_from_rows(conn, uid: int) -> tuple[int, int]:
+    table = UserActivityDay.__table__
+    days = conn.execute(sa.select(table.c.day).where(table.c.user_id == uid).order_by(table.c.day)).scalars()
+    current = longest = 0
+    prev = None
+    for day in days:
+        current = current + 1 if prev is not None and day - prev == timedelta(days=1) else 1
+        longest = max(longest, current)
+        prev = day
+    return current, longest
+
+
+def _streaks_from_bitmap(conn, uid: int) -> tuple[int, int]:
+    table = UserActivityYear.__table__
+    rows = conn.execute(sa.select(table.c.year, table.c.days).where(table.c.user_id == uid)).all()
+    current, longest, _ = streak_stats(dict(rows))
+    return current, longest
+
+
+def _weeks_from_rows(conn, ids: list[int]) -> dict[int, set[int]]:
+    table = UserActivityDay.__table__
+    weeks: dict[int, set[int]] = {}
+    for uid, day in conn.execute(sa.select(table.c.user_id, table.c.day).where(table.c.user_id.in_(ids))):
+        weeks.setdefault(uid, set()).add(day.isocalendar()[1])
+    return weeks
+
+
+def _weeks_from_bitmaps(conn, ids: list[int]) -> dict[int, set[int]]:
+    table = UserActivityYear.__table__
+    weeks: dict[int, set[int]] = {}
+    for uid, year, bits in conn.execute(
+        sa.select(table.c.user_id, table.c.year, table.c.days).where(table.c.user_id.in_(ids))
+    ):
+        weeks[uid] = {monday.isocalendar()[1] for monday in active_weeks(year, bits)}
+    return weeks
+
+
+def _timed(fn, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--samples", type=int, default=2000, help="Random users for the streak read.")
+    parser.add_argument("--chunk", type=int, default=1000, help="Users per retention chunk.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rows_path = os.path.join(tmp, "rows.db")
+        bits_path = os.path.join(tmp, "bitmaps.db")
+        rows_engine = _engine(rows_path, UserActivityDay.__table__)
+        bits_engine = _engine(bits_path, UserActivityYear.__table__)
+
+        load_rows_s, n_rows = _timed(_load_rows, rows_engine, args.users, args.days, args.seed)
+        load_bits_s, n_bits = _timed(_load_bitmaps, bits_engine, args.users, args.days, args.seed)
+        print(f"{args.users:,} users x {args.days} days")
+        print(f"{'':12}{'rows':>14}{'size MB':>10}{'load s':>9}")
+        print(f"{'day rows':12}{n_rows:>14,}{_size_mb(rows_engine, rows_path):>10.1f}{load_rows_s:>9.1f}")
+        print(f"{'bitmaps':12}{n_bits:>14,}{_size_mb(bits_engine, bits_path):>10.1f}{load_bits_s:>9.1f}")
+
+        rng = random.Random(args.seed)
+        sample = [rng.randint(1, args.users) for _ in range(args.samples)]
+        ids = list(range(1, args.users + 1))
+        chunks = [ids[i : i + args.chunk] for i in range(0, len(ids), args.chunk)]
+
+        with rows_engine.connect() as rows_conn, bits_engine.connect() as bits_conn:
+            streak_rows_s, a = _timed(lambda: [_streaks_from_rows(rows_conn, u) for u in sample])
+            streak_bits_s, b = _timed(lambda: [_streaks_from_bitmap(bits_conn, u) for u in sample])
+            assert a == b, "representations disagree on streaks"
+
+            ret_rows_s, a = _timed(lambda: [_weeks_from_rows(rows_conn, c) for c in chunks])
+            ret_bits_s, b = _timed(lambda: [_weeks_from_bitmaps(bits_conn, c) for c in chunks])
+            assert a == b, "representations disagree on active weeks"
+
+        print()
+        print(f"{'':12}{'streak ms/user':>16}{'retention s':>13}")
+        print(f"{'day rows':12}{1000 * streak_rows_s / len(sample):>16.3f}{ret_rows_s:>13.2f}")
+        print(f"{'bitmaps':12}{1000 * streak_bits_s / len(sample):>16.3f}{ret_bits_s:>13.2f}")
+        rows_engine.dispose()
+        bits_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
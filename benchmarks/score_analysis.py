@@ -0,0 +1,136 @@
+"""Time the offline fair-play analyzer (app/score_analysis.py) over a synthetic game_score table.
+
+    python benchmarks/score_analysis.py                   # 2M scores, 50k users
+    python benchmarks/score_analysis.py --scores 200000   # quicker run
+
+Builds a throwaway SQLite file from the app's own models, times the two phases
+on their own and then the whole job (`flask fair-play analyze`):
+  - load:    stream game_score through the cursor into NumPy columns
+  - analyze: robust z-scores, play gaps and tier-threshold hits
+  - full:    load + analyze + replace score_anomaly with the findings
+Three planted cheaters check that each detector fires.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.extensions import db  # noqa: E402
+from app.games import DEFAULT_TIERS, LOWER_IS_BETTER  # noqa: E402
+from app.models import Application, ClassFee, GameScore, User  # noqa: E402
+from app.score_analysis import analyze_scores, find_anomalies, load_score_columns  # noqa: E402
+
+
+START = datetime(2026, 1, 1)
+
+
+def _app(path: str) -> Flask:
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+    return app
+
+
+def _populate(users: int, scores: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    games = sorted(DEFAULT_TIERS)
+    db.session.execute(ClassFee.__table__.insert(), [{"id": 1, "class_name": "Class 1", "amount_bdt": 1000}])
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            {"id": u, "email": f"u{u}@example.com", "name": f"u{u}", "password_hash": "x", "is_admin": False, "created_at": START}
+            for u in range(1, users + 1)
+        ],
+    )
+    db.session.execute(
+        Application.__table__.insert(),
+        [{"id": u, "user_id": u, "class_fee_id": 1, "status": "pending", "created_at": START} for u in range(1, users + 1)],
+    )
+
+    app_id = rng.integers(1, users + 1, scores)
+    game = rng.integers(0, len(games), scores)
+    top = np.array([DEFAULT_TIERS[g][-1][0] for g in games], dtype=np.float64)
+    # Scores spread around the middle tiers; lower-is-better games get times instead.
+    score = np.maximum(0, rng.normal(top[game] * 0.5, top[game] * 0.2)).astype(np.int64)
+    lower = np.isin(game, [games.index(g) for g in LOWER_IS_BETTER])
+    score[lower] = np.maximum(150, rng.normal(650, 120, lower.sum())).astype(np.int64)
+    seconds = np.sort(rng.integers(0, 180 * 86400, scores))
+
+    # Planted cheaters: user 1 posts absurd scores, user 2 submits in bursts,
+    # user 3 lands exactly on thresholds.
+    planted = np.arange(0, scores, max(1, scores // 300))[:300]
+    cheat = planted[:100], planted[100:200], planted[200:]
+    app_id[cheat[0]], app_id[cheat[1]], app_id[cheat[2]] = 1, 2, 3
+    score[cheat[0]] = np.where(lower[cheat[0]], 5, top[game[cheat[0]]] * 20).astype(np.int64)
+    seconds[cheat[1][1::2]] = seconds[cheat[1][::2]][: len(cheat[1][1::2])]
+    score[cheat[2]] = [DEFAULT_TIERS[games[g]][2][0] for g in game[cheat[2]]]
+
+    created = (np.datetime64(START, "us") + seconds.astype("timedelta64[s]")).astype(datetime)
+    table = GameScore.__table__
+    for start in range(0, scores, 100_000):
+        end = min(scores, start + 100_000)
+        db.session.execute(
+            table.insert(),
+            [
+                {
+                    "application_id": int(a),
+                    "game_key": games[g],
+                    "score": int(s),
+                    "earned_discount_pct": 0,
+                    "is_flagged": False,
+                    "created_at": c,
+                }
+                for a, g, s, c in zip(app_id[start:end], game[start:end], score[start:end], created[start:end])
+            ],
+        )
+    db.session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scores", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--chunk", type=int, default=50_000, help="Rows per cursor round trip.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _app(os.path.join(tmp, "scores.db"))
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            _populate(args.users, args.scores, args.seed)
+            print(f"{args.scores:,} scores, {args.users:,} users (built in {time.perf_counter() - started:.0f}s)")
+
+            started = time.perf_counter()
+            cols = load_score_columns(chunk_size=args.chunk)
+            load_s = time.perf_counter() - started
+            started = time.perf_counter()
+            findings = find_anomalies(cols, datetime.utcnow())
+            analyze_s = time.perf_counter() - started
+            mem_mb = sum(getattr(cols, f).nbytes for f in ("id", "application_id", "user_id", "game", "score", "at_us")) / 1e6
+
+            started = time.perf_counter()
+            counts = analyze_scores(chunk_size=args.chunk)
+            total_s = time.perf_counter() - started
+
+            print(f"{'load s':>10}{'analyze s':>11}{'full run s':>12}{'columns MB':>12}")
+            print(f"{load_s:>10.1f}{analyze_s:>11.1f}{total_s:>12.1f}{mem_mb:>12.0f}")
+            for kind, found in counts.items():
+                users = sorted({f["user_id"] for f in findings if f["kind"] == kind})
+                print(f"{kind:10} {found:>6} findings, users {users[:5]}{' ...' if len(users) > 5 else ''}")
+            db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
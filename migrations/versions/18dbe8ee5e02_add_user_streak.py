@@ -0,0 +1,44 @@
+"""add user_streak (incremental streak state)
+
+Revision ID: 18dbe8ee5e02
+Revises: 9a2f1b6d8c01
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "18dbe8ee5e02"
+down_revision = "9a2f1b6d8c01"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def upgrade():
+    # Existing activity is folded in with: flask --app wsgi:app engagement backfill-streaks
+    if "user_streak" not in _table_names():
+        op.create_table(
+            "user_streak",
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("current_streak", sa.Integer(), nullable=False),
+            sa.Column("longest_streak", sa.Integer(), nullable=False),
+            sa.Column("last_active_day", sa.Date(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("user_id"),
+        )
+
+
+def downgrade():
+    if "user_streak" in _table_names():
+        op.drop_table("user_streak")
@@ -0,0 +1,46 @@
+"""add event_notification (SSE outbox)
+
+Revision ID: 3b9f6d2e4c71
+Revises: d7a4e9c2b816
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "3b9f6d2e4c71"
+down_revision = "d7a4e9c2b816"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def upgrade():
+    if "event_notification" not in _table_names():
+        op.create_table(
+            "event_notification",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("audience", sa.String(length=10), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("kind", sa.String(length=30), nullable=False),
+            sa.Column("payload", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_event_notification_created_at"), "event_notification", ["created_at"], unique=False)
+
+
+def downgrade():
+    if "event_notification" in _table_names():
+        op.drop_index(op.f("ix_event_notification_created_at"), table_name="event_notification")
+        op.drop_table("event_notification")
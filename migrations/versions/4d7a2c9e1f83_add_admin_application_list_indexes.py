@@ -0,0 +1,58 @@
+"""add admin application list indexes (keyset paging + filters)
+
+Revision ID: 4d7a2c9e1f83
+Revises: b8e3f1a6c259
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "4d7a2c9e1f83"
+down_revision = "b8e3f1a6c259"
+branch_labels = None
+depends_on = None
+
+
+APPLICATION_INDEXES = {
+    "ix_application_created": ["created_at", "id"],
+    "ix_application_status_created": ["status", "created_at", "id"],
+    "ix_application_class_created": ["class_fee_id", "created_at", "id"],
+}
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    existing = _index_names("application")
+    for name, columns in APPLICATION_INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "application", columns, unique=False)
+
+    if "ix_game_score_flagged_app" not in _index_names("game_score"):
+        op.create_index(
+            "ix_game_score_flagged_app",
+            "game_score",
+            ["application_id"],
+            unique=False,
+            postgresql_where=sa.text("is_flagged"),
+            sqlite_where=sa.text("is_flagged = 1"),
+        )
+
+
+def downgrade():
+    if "ix_game_score_flagged_app" in _index_names("game_score"):
+        op.drop_index("ix_game_score_flagged_app", table_name="game_score")
+
+    existing = _index_names("application")
+    for name in APPLICATION_INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name="application")
@@ -0,0 +1,85 @@
+"""per-game leaderboards: user_game_stat top-k index + weekly_game_best
+
+Revision ID: 5e8b3c1f7a20
+Revises: c41d7e2a9b53
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "5e8b3c1f7a20"
+down_revision = "c41d7e2a9b53"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    if "ix_user_game_stat_game_best" not in _index_names("user_game_stat"):
+        op.create_index("ix_user_game_stat_game_best", "user_game_stat", ["game_key", "best_score"], unique=False)
+
+    # Best scores used to be "highest wins" for every game and included flagged
+    # submissions; recompute them from non-flagged scores (lowest wins for reaction).
+    # 'reaction' is app.games.LOWER_IS_BETTER as of this revision, written out on
+    # purpose: a migration must not change meaning when the registry does later.
+    # best_at moves with it, to when the new best was first reached, since the
+    # boards break ties on it. Both SET expressions see the old row, so the best
+    # is spelled out again inside best_at.
+    non_flagged = """
+        FROM game_score gs JOIN application a ON a.id = gs.application_id
+        WHERE a.user_id = user_game_stat.user_id
+          AND LOWER(gs.game_key) = user_game_stat.game_key
+          AND gs.is_flagged = false
+    """
+    best = f"""
+        SELECT CASE WHEN user_game_stat.game_key = 'reaction' THEN MIN(gs.score) ELSE MAX(gs.score) END
+        {non_flagged}
+    """
+    op.execute(
+        f"""
+        UPDATE user_game_stat SET
+            best_score = ({best}),
+            best_at = (SELECT MIN(gs.created_at) {non_flagged} AND gs.score = ({best}))
+        """
+    )
+
+    if "weekly_game_best" not in _table_names():
+        # Seed the running week afterwards with: flask --app wsgi:app engagement rebuild-weekly
+        op.create_table(
+            "weekly_game_best",
+            sa.Column("week_key", sa.String(length=12), nullable=False),
+            sa.Column("game_key", sa.String(length=50), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("best_score", sa.Integer(), nullable=False),
+            sa.Column("best_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("week_key", "game_key", "user_id"),
+        )
+        op.create_index(
+            "ix_weekly_game_best_board", "weekly_game_best", ["week_key", "game_key", "best_score"], unique=False
+        )
+
+
+def downgrade():
+    if "weekly_game_best" in _table_names():
+        op.drop_index("ix_weekly_game_best_board", table_name="weekly_game_best")
+        op.drop_table("weekly_game_best")
+
+    if "ix_user_game_stat_game_best" in _index_names("user_game_stat"):
+        op.drop_index("ix_user_game_stat_game_best", table_name="user_game_stat")
@@ -0,0 +1,70 @@
+"""add game_score review columns + review queue index
+
+Revision ID: 5e8c3a1d7b42
+Revises: 9b2e6d4f1a37
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "5e8c3a1d7b42"
+down_revision = "9b2e6d4f1a37"
+branch_labels = None
+depends_on = None
+
+
+def _column_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {c["name"] for c in insp.get_columns(table)}
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    cols = _column_names("game_score")
+    with op.batch_alter_table("game_score") as batch_op:
+        if "review_status" not in cols:
+            batch_op.add_column(sa.Column("review_status", sa.String(length=20), nullable=True))
+        if "reviewed_by_id" not in cols:
+            batch_op.add_column(sa.Column("reviewed_by_id", sa.Integer(), nullable=True))
+            batch_op.create_foreign_key("fk_game_score_reviewed_by_id_user", "user", ["reviewed_by_id"], ["id"])
+        if "reviewed_at" not in cols:
+            batch_op.add_column(sa.Column("reviewed_at", sa.DateTime(), nullable=True))
+
+    # Everything flagged so far is still waiting for a review.
+    op.execute("UPDATE game_score SET review_status = 'pending' WHERE is_flagged AND review_status IS NULL")
+
+    if "ix_game_score_review" not in _index_names("game_score"):
+        op.create_index(
+            "ix_game_score_review",
+            "game_score",
+            ["review_status", "created_at", "id"],
+            unique=False,
+            postgresql_where=sa.text("review_status IS NOT NULL"),
+            sqlite_where=sa.text("review_status IS NOT NULL"),
+        )
+
+
+def downgrade():
+    if "ix_game_score_review" in _index_names("game_score"):
+        op.drop_index("ix_game_score_review", table_name="game_score")
+
+    cols = _column_names("game_score")
+    with op.batch_alter_table("game_score") as batch_op:
+        if "reviewed_at" in cols:
+            batch_op.drop_column("reviewed_at")
+        if "reviewed_by_id" in cols:
+            batch_op.drop_constraint("fk_game_score_reviewed_by_id_user", type_="foreignkey")
+            batch_op.drop_column("reviewed_by_id")
+        if "review_status" in cols:
+            batch_op.drop_column("review_status")
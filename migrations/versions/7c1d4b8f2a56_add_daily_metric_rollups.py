@@ -0,0 +1,66 @@
+"""add daily_metric + rollup_watermark (incremental analytics rollups)
+
+Revision ID: 7c1d4b8f2a56
+Revises: a6c2f8e1d934
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "7c1d4b8f2a56"
+down_revision = "a6c2f8e1d934"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    tables = _table_names()
+    if "daily_metric" not in tables:
+        op.create_table(
+            "daily_metric",
+            sa.Column("metric", sa.String(length=40), nullable=False),
+            sa.Column("dim", sa.String(length=50), nullable=False),
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("value", sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint("metric", "dim", "day"),
+        )
+    if "rollup_watermark" not in tables:
+        op.create_table(
+            "rollup_watermark",
+            sa.Column("source", sa.String(length=40), nullable=False),
+            sa.Column("last_id", sa.Integer(), nullable=False),
+            sa.Column("last_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("source"),
+        )
+
+    if "ix_application_paid_at" not in _index_names("application"):
+        op.create_index("ix_application_paid_at", "application", ["paid_at", "id"], unique=False)
+
+
+def downgrade():
+    if "ix_application_paid_at" in _index_names("application"):
+        op.drop_index("ix_application_paid_at", table_name="application")
+
+    tables = _table_names()
+    if "rollup_watermark" in tables:
+        op.drop_table("rollup_watermark")
+    if "daily_metric" in tables:
+        op.drop_table("daily_metric")
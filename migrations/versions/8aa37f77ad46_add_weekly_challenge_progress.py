@@ -0,0 +1,45 @@
+"""add weekly_challenge_progress counters
+
+Revision ID: 8aa37f77ad46
+Revises: 18dbe8ee5e02
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "8aa37f77ad46"
+down_revision = "18dbe8ee5e02"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def upgrade():
+    # Seed the running week afterwards with: flask --app wsgi:app engagement rebuild-weekly
+    if "weekly_challenge_progress" not in _table_names():
+        op.create_table(
+            "weekly_challenge_progress",
+            sa.Column("application_id", sa.Integer(), nullable=False),
+            sa.Column("week_key", sa.String(length=12), nullable=False),
+            sa.Column("plays_count", sa.Integer(), nullable=False),
+            sa.Column("unique_games", sa.Integer(), nullable=False),
+            sa.Column("game_keys", sa.Text(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["application_id"], ["application.id"]),
+            sa.PrimaryKeyConstraint("application_id", "week_key"),
+        )
+
+
+def downgrade():
+    if "weekly_challenge_progress" in _table_names():
+        op.drop_table("weekly_challenge_progress")
@@ -0,0 +1,51 @@
+"""add admin audit log search indexes (keyset paging + filters)
+
+Revision ID: 9b2e6d4f1a37
+Revises: 4d7a2c9e1f83
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "9b2e6d4f1a37"
+down_revision = "4d7a2c9e1f83"
+branch_labels = None
+depends_on = None
+
+
+AUDIT_INDEXES = {
+    "ix_admin_audit_log_created": ["created_at", "id"],
+    "ix_admin_audit_log_admin_created": ["admin_user_id", "created_at", "id"],
+    "ix_admin_audit_log_action_created": ["action", "created_at", "id"],
+    "ix_admin_audit_log_target_created": ["target_type", "target_id", "created_at", "id"],
+}
+# Covered by the leading column of ix_admin_audit_log_admin_created.
+OLD_ADMIN_INDEX = "ix_admin_audit_log_admin_user_id"
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    existing = _index_names("admin_audit_log")
+    for name, columns in AUDIT_INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "admin_audit_log", columns, unique=False)
+    if OLD_ADMIN_INDEX in existing:
+        op.drop_index(OLD_ADMIN_INDEX, table_name="admin_audit_log")
+
+
+def downgrade():
+    existing = _index_names("admin_audit_log")
+    if OLD_ADMIN_INDEX not in existing:
+        op.create_index(OLD_ADMIN_INDEX, "admin_audit_log", ["admin_user_id"], unique=False)
+    for name in AUDIT_INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name="admin_audit_log")
@@ -0,0 +1,42 @@
+"""add chat_read_cursor (per-application read state for admin and client)
+
+Revision ID: a6c2f8e1d934
+Revises: 3b9f6d2e4c71
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "a6c2f8e1d934"
+down_revision = "3b9f6d2e4c71"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def upgrade():
+    if "chat_read_cursor" not in _table_names():
+        op.create_table(
+            "chat_read_cursor",
+            sa.Column("application_id", sa.Integer(), nullable=False),
+            sa.Column("reader_role", sa.String(length=20), nullable=False),
+            sa.Column("last_read_id", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["application_id"], ["application.id"]),
+            sa.PrimaryKeyConstraint("application_id", "reader_role"),
+        )
+
+
+def downgrade():
+    if "chat_read_cursor" in _table_names():
+        op.drop_table("chat_read_cursor")
@@ -0,0 +1,43 @@
+"""add user_activity_year (one activity bitmap per user per year)
+
+Existing user_activity_day rows are folded in by `flask engagement migrate-activity`.
+
+Revision ID: b8e3f1a6c259
+Revises: e2f5a9c7d3b4
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "b8e3f1a6c259"
+down_revision = "e2f5a9c7d3b4"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def upgrade():
+    if "user_activity_year" not in _table_names():
+        op.create_table(
+            "user_activity_year",
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("year", sa.Integer(), nullable=False),
+            sa.Column("days", sa.LargeBinary(length=46), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("user_id", "year"),
+        )
+
+
+def downgrade():
+    if "user_activity_year" in _table_names():
+        op.drop_table("user_activity_year")
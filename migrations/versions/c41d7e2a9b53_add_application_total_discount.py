@@ -0,0 +1,74 @@
+"""add application.total_discount_pct + leaderboard indexes
+
+Revision ID: c41d7e2a9b53
+Revises: f28fa7afb2aa
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "c41d7e2a9b53"
+down_revision = "f28fa7afb2aa"
+branch_labels = None
+depends_on = None
+
+
+def _column_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {c["name"] for c in insp.get_columns(table)}
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    if "total_discount_pct" not in _column_names("application"):
+        with op.batch_alter_table("application") as batch_op:
+            batch_op.add_column(sa.Column("total_discount_pct", sa.Integer(), nullable=False, server_default="0"))
+
+    # Backfill with the same cap as Application._sync_total_discount.
+    op.execute(
+        """
+        UPDATE application SET total_discount_pct = CASE
+            WHEN spin_discount_pct + games_discount_pct + bonus_discount_pct > 70 THEN 70
+            ELSE spin_discount_pct + games_discount_pct + bonus_discount_pct
+        END
+        """
+    )
+
+    indexes = _index_names("application")
+    if "ix_application_total_discount" not in indexes:
+        op.create_index(
+            "ix_application_total_discount",
+            "application",
+            [sa.text("total_discount_pct DESC"), "created_at"],
+            unique=False,
+        )
+    if "ix_application_class_total_discount" not in indexes:
+        op.create_index(
+            "ix_application_class_total_discount",
+            "application",
+            ["class_fee_id", sa.text("total_discount_pct DESC"), "created_at"],
+            unique=False,
+        )
+
+
+def downgrade():
+    indexes = _index_names("application")
+    if "ix_application_class_total_discount" in indexes:
+        op.drop_index("ix_application_class_total_discount", table_name="application")
+    if "ix_application_total_discount" in indexes:
+        op.drop_index("ix_application_total_discount", table_name="application")
+
+    if "total_discount_pct" in _column_names("application"):
+        with op.batch_alter_table("application") as batch_op:
+            batch_op.drop_column("total_discount_pct")
@@ -0,0 +1,52 @@
+"""add score_anomaly (offline fair-play analyzer findings)
+
+Revision ID: c7f4a2e9d815
+Revises: 5e8c3a1d7b42
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "c7f4a2e9d815"
+down_revision = "5e8c3a1d7b42"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def upgrade():
+    if "score_anomaly" not in _table_names():
+        op.create_table(
+            "score_anomaly",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("kind", sa.String(length=20), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("application_id", sa.Integer(), nullable=True),
+            sa.Column("game_score_id", sa.Integer(), nullable=True),
+            sa.Column("game_key", sa.String(length=50), nullable=True),
+            sa.Column("value", sa.Float(), nullable=False),
+            sa.Column("detail", sa.String(length=255), nullable=True),
+            sa.Column("detected_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.ForeignKeyConstraint(["application_id"], ["application.id"]),
+            sa.ForeignKeyConstraint(["game_score_id"], ["game_score.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_score_anomaly_user_id", "score_anomaly", ["user_id"], unique=False)
+        op.create_index("ix_score_anomaly_game_score_id", "score_anomaly", ["game_score_id"], unique=False)
+        op.create_index("ix_score_anomaly_kind", "score_anomaly", ["kind", "id"], unique=False)
+
+
+def downgrade():
+    if "score_anomaly" in _table_names():
+        op.drop_table("score_anomaly")
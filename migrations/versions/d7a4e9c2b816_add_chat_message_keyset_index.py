@@ -0,0 +1,33 @@
+"""add (application_id, id) index on chat_message for keyset paging
+
+Revision ID: d7a4e9c2b816
+Revises: 5e8b3c1f7a20
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "d7a4e9c2b816"
+down_revision = "5e8b3c1f7a20"
+branch_labels = None
+depends_on = None
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    if "ix_chat_message_app_id" not in _index_names("chat_message"):
+        op.create_index("ix_chat_message_app_id", "chat_message", ["application_id", "id"], unique=False)
+
+
+def downgrade():
+    if "ix_chat_message_app_id" in _index_names("chat_message"):
+        op.drop_index("ix_chat_message_app_id", table_name="chat_message")
@@ -0,0 +1,33 @@
+"""add application.user_id index (funnel EXISTS probes, client dashboards)
+
+Revision ID: e2f5a9c7d3b4
+Revises: 7c1d4b8f2a56
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "e2f5a9c7d3b4"
+down_revision = "7c1d4b8f2a56"
+branch_labels = None
+depends_on = None
+
+
+def _index_names(table: str) -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return {i["name"] for i in insp.get_indexes(table)}
+
+
+def upgrade():
+    if "ix_application_user_id" not in _index_names("application"):
+        op.create_index("ix_application_user_id", "application", ["user_id"], unique=False)
+
+
+def downgrade():
+    if "ix_application_user_id" in _index_names("application"):
+        op.drop_index("ix_application_user_id", table_name="application")
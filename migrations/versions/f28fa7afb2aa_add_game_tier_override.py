@@ -0,0 +1,43 @@
+"""add game_tier_override (admin discount tier overrides)
+
+Revision ID: f28fa7afb2aa
+Revises: 8aa37f77ad46
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = "f28fa7afb2aa"
+down_revision = "8aa37f77ad46"
+branch_labels = None
+depends_on = None
+
+
+def _table_names() -> set[str]:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return set(insp.get_table_names())
+
+
+def upgrade():
+    if "game_tier_override" not in _table_names():
+        op.create_table(
+            "game_tier_override",
+            sa.Column("game_key", sa.String(length=50), nullable=False),
+            sa.Column("tiers", sa.Text(), nullable=False),
+            sa.Column("lower_is_better", sa.Boolean(), nullable=False),
+            sa.Column("updated_by_id", sa.Integer(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["updated_by_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("game_key"),
+        )
+
+
+def downgrade():
+    if "game_tier_override" in _table_names():
+        op.drop_table("game_tier_override")